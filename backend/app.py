@@ -1,9 +1,9 @@
 from flask import Flask
 from flask_cors import CORS
-from backend.routes import api
+from backend.routes import api, ops
 from backend.config import Config
-from backend.database import engine, Base, KLineData
-from sqlalchemy import inspect
+from backend.database import init_db
+from backend.data.listeners import register_save_listeners
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,28 +15,13 @@ def create_app():
     Config.setup_logging()
     
     app.register_blueprint(api, url_prefix='/api')
+    app.register_blueprint(ops)
     
-    # Check if the database exists and has tables
-    inspector = inspect(engine)
-    existing_tables = inspector.get_table_names()
-    
-    if not existing_tables:
-        logger.info("Database is empty. Initializing tables...")
-        with app.app_context():
-            Base.metadata.create_all(engine)
-    else:
-        logger.info("Database already initialized. Checking for missing tables...")
-    
-    # Ensure all partition tables are created
-    with engine.connect() as connection:
-        for year in range(2023, 2025):  # Adjust the range as needed
-            for quarter in range(1, 5):
-                suffix = f"{year}q{quarter}"
-                table_name = f'kline_data_{suffix}'
-                if table_name not in existing_tables:
-                    logger.info(f"Creating missing table: {table_name}")
-                    partition_class = KLineData.create_partition(suffix)
-                    partition_class.__table__.create(connection)
+    # Creates kline_data and its upcoming partitions, migrating legacy quarter tables
+    init_db()
+
+    # Indicator state, rollups, coverage and /api/stream events follow every candle write
+    register_save_listeners()
     
     logger.info("Database initialization and table check complete.")
     
@@ -0,0 +1,124 @@
+"""
+ASGI entry point, for serving the API from an ASGI server:
+
+    uvicorn backend.asgi:app --port 5001
+
+Run a single worker process. The CandleHub feeding /api/stream and the indicator and
+rollup save listeners only see candles saved in their own process, so this process also
+runs the ingest scheduler, started on the ASGI lifespan startup event, in place of
+`python -m backend`. Scale with ASGI_THREADS rather than --workers.
+
+The Flask app stays WSGI and each request runs on one of ASGI_THREADS threads. The
+coroutines of the async views are run on the server's event loop, so the
+asyncio.to_thread work of every request shares that loop instead of each request
+starting its own. /api/stream is served natively on the loop: its subscribers stay
+connected indefinitely and would otherwise each hold one of those threads.
+"""
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.datastructures import MultiDict
+from backend import routes
+from backend.app import create_app
+from backend.config import Config
+from backend.data.scheduler import start_scheduler
+from backend.formats import sse_message
+
+logger = logging.getLogger(__name__)
+
+# Separate from the loop's default executor, which the views' asyncio.to_thread calls use:
+# requests blocked on their view must never hold the threads that view needs
+_request_threads = ThreadPoolExecutor(max_workers=Config.ASGI_THREADS, thread_name_prefix='asgi-request')
+
+class _ThreadedInstance(WsgiToAsgiInstance):
+    # asgiref runs every WSGI call on one shared thread (thread_sensitive=True), which
+    # would serialize the whole API. WsgiToAsgiInstance is internal to asgiref, hence the
+    # exact version pin in requirements.txt
+    run_wsgi_app = sync_to_async(
+        WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False, executor=_request_threads,
+    )
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await lifespan(receive, send)
+            return
+        if scope['type'] == 'http' and scope['path'] == '/api/stream' and scope['method'] == 'GET':
+            await stream(scope, receive, send)
+            return
+        await _ThreadedInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+async def lifespan(receive, send):
+    """
+    Start the ingest scheduler with the server; its daemon thread ends with the process
+    """
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            start_scheduler()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def stream(scope, receive, send):
+    """
+    routes.stream on the event loop: the subscriber waits on an asyncio queue, and only the
+    indicator reads of an event go to a worker thread
+    """
+    args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1')))
+    try:
+        symbol, interval, indicators = routes.stream_params(args)
+    except routes.InvalidParameter as e:
+        await _send_response(send, 400, 'application/json', json.dumps({'error': str(e)}).encode())
+        return
+
+    hub = routes.hub
+    subscription = hub.subscribe(symbol, interval, loop=asyncio.get_running_loop())
+    logger.info(f"Stream subscriber added for {symbol} {interval}")
+    disconnected = asyncio.create_task(_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+            (b'access-control-allow-origin', b'*'),  # as CORS(api) answers
+        ]})
+        while not disconnected.done():
+            getter = asyncio.ensure_future(subscription.get(timeout=Config.EVENT_HEARTBEAT_SECONDS))
+            await asyncio.wait([getter, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                getter.cancel()
+                break
+            event = getter.result()
+            dropped = subscription.take_dropped()
+            message = sse_message('lagged', {'dropped': dropped}) if dropped else ''
+            if event is None:
+                message += routes.KEEP_ALIVE
+            elif indicators:
+                message += await asyncio.to_thread(routes.stream_message, symbol, interval, indicators, event)
+            else:
+                message += routes.stream_message(symbol, interval, indicators, event)
+            await send({'type': 'http.response.body', 'body': message.encode(), 'more_body': True})
+    except Exception as e:
+        logger.error(f"Error in stream for {symbol} {interval}: {str(e)}")
+    finally:
+        disconnected.cancel()
+        hub.unsubscribe(subscription)
+        logger.info(f"Stream subscriber removed for {symbol} {interval}")
+
+async def _disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def _send_response(send, status, content_type, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', content_type.encode()), (b'access-control-allow-origin', b'*'),
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+app = ThreadedWsgiToAsgi(create_app())
@@ -0,0 +1,53 @@
+"""
+Backtest sweep throughput: time to backtest a MACD crossover with an RSI filter over a
+synthetic candle series for grids of 1, 100 and 10k parameter combinations, per worker
+count. The default series is a year of 1m candles.
+
+    python -m backend.benchmarks.backtest [--candles 525600] [--grids 1 100 10000] [--workers 1 4]
+"""
+import argparse
+import os
+import time
+from backend.benchmarks.synthetic import synthetic_candles
+from backend.data.backtest import strategies_for_grid, sweep_universe
+from backend.data.parallel import Universe
+
+ENTRY = 'macd({fast},{slow},9).macd crosses_above macd({fast},{slow},9).signal; rsi(14) < {rsi}'
+EXIT = 'macd({fast},{slow},9).macd crosses_below macd({fast},{slow},9).signal'
+
+# fast x slow x rsi shapes giving each grid size
+GRIDS = {1: (1, 1, 1), 100: (5, 4, 5), 10000: (20, 25, 20)}
+
+def grid(size):
+    fast, slow, rsi = GRIDS[size]
+    return {
+        'fast': list(range(5, 5 + fast)),
+        'slow': list(range(26, 26 + slow)),
+        'rsi': [50 + 50 * i // rsi for i in range(1, rsi + 1)],
+    }
+
+def run(candles, grids, workers):
+    results = []
+    with Universe.from_columns('SYNTH', synthetic_candles(candles)) as universe:
+        for size in grids:
+            _, strategies = strategies_for_grid(ENTRY, EXIT, grid(size))
+            for count in workers:
+                sweep_universe(universe, strategies[:1], '1m', workers=count)  # starts the pool
+                started = time.perf_counter()
+                sweep_universe(universe, strategies, '1m', workers=count)
+                elapsed = time.perf_counter() - started
+                results.append({'combinations': len(strategies), 'workers': count, 'seconds': elapsed})
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--candles', type=int, default=525600)
+    parser.add_argument('--grids', type=int, nargs='+', choices=sorted(GRIDS), default=sorted(GRIDS))
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    print(f"{args.candles} candles")
+    print(f"{'combinations':>12} {'workers':>8} {'seconds':>9} {'ms/combination':>15}")
+    for row in run(args.candles, args.grids, args.workers):
+        print(f"{row['combinations']:>12} {row['workers']:>8} {row['seconds']:>9.2f} "
+              f"{row['seconds'] * 1000 / row['combinations']:>15.1f}")
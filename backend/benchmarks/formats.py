@@ -0,0 +1,41 @@
+"""
+Compare response encodings for kline columns: payload bytes and encode time of the
+JSON records /api/kline returns by default versus Arrow IPC and MessagePack.
+
+    python -m backend.benchmarks.formats [--sizes 10000 100000 1000000]
+"""
+import argparse
+import json
+import time
+from backend.benchmarks.synthetic import synthetic_candles
+from backend.data.storage import columns_to_records
+from backend.formats import encode_arrow, encode_msgpack
+
+ENCODERS = {
+    'json': lambda columns: json.dumps(columns_to_records(columns)).encode(),
+    'arrow': encode_arrow,
+    'msgpack': encode_msgpack,
+}
+
+def run(sizes, repeat=3):
+    results = []
+    for size in sizes:
+        columns = synthetic_candles(size)
+        for name, encode in ENCODERS.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                payload = encode(columns)
+                timings.append(time.perf_counter() - started)
+            results.append({'candles': size, 'format': name, 'bytes': len(payload), 'seconds': min(timings)})
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'candles':>9} {'format':>8} {'bytes':>12} {'encode ms':>10}")
+    for row in run(args.sizes, args.repeat):
+        print(f"{row['candles']:>9} {row['format']:>8} {row['bytes']:>12} {row['seconds'] * 1000:>10.1f}")
@@ -0,0 +1,84 @@
+"""
+Load test a running API: latency percentiles and throughput of one or more URLs at each
+concurrency level, with every client looping over its requests for a fixed duration.
+
+    python -m backend.benchmarks.load [--url http://127.0.0.1:5001] [--concurrency 1 50 500]
+        [--duration 10] [--path '/api/kline?symbol=BTCUSDT&interval=1m&startTime=...'] [--revalidate]
+
+--revalidate sends each path's ETag back in If-None-Match, so unchanged charts measure
+the 304 path.
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+import aiohttp
+import numpy as np
+
+DEFAULT_PATHS = [
+    '/api/kline?symbol=BTCUSDT&interval=1h&startTime=1704067200000&endTime=1711929600000',
+    '/api/indicators?symbol=BTCUSDT&interval=1h&startTime=1704067200000&endTime=1711929600000&indicators=macd,rsi',
+]
+
+async def client(session, url, paths, etags, deadline, latencies, statuses):
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        headers = {'If-None-Match': etags[path]} if path in etags else {}
+        started = time.perf_counter()
+        try:
+            async with session.get(url + path, headers=headers) as response:
+                await response.read()
+                statuses[response.status] += 1
+        except aiohttp.ClientError as e:
+            statuses[type(e).__name__] += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+
+async def run_level(url, paths, concurrency, duration, revalidate):
+    # No connection limit: each simulated client keeps its own keep-alive connection
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        etags = {}
+        if revalidate:
+            for path in paths:
+                async with session.get(url + path) as response:
+                    await response.read()
+                    if 'ETag' in response.headers:
+                        etags[path] = response.headers['ETag']
+        latencies, statuses = [], Counter()
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            client(session, url, paths[i % len(paths):] + paths[:i % len(paths)], etags, deadline, latencies, statuses)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+    latencies = np.array(latencies) * 1000
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+        'p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+        'statuses': dict(statuses),
+    }
+
+def run(url, paths, levels, duration, revalidate=False):
+    return [asyncio.run(run_level(url, paths, level, duration, revalidate)) for level in levels]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5001')
+    parser.add_argument('--path', dest='paths', action='append', help='repeatable; defaults to a kline and an indicators chart')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 50, 500])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--revalidate', action='store_true')
+    args = parser.parse_args()
+
+    print(f"{'clients':>8} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9}  statuses")
+    for row in run(args.url.rstrip('/'), args.paths or DEFAULT_PATHS, args.concurrency, args.duration, args.revalidate):
+        print(f"{row['concurrency']:>8} {row['requests']:>9} {row['rps']:>8.1f} "
+              f"{row['p50'] or 0:>9.1f} {row['p99'] or 0:>9.1f}  {row['statuses']}")
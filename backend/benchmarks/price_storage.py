@@ -0,0 +1,105 @@
+"""
+Compare the PRICE_STORAGE modes on PostgreSQL: table size, COPY insert rate, range-read
+throughput into column arrays and an hourly OHLCV aggregation, over one synthetic series
+loaded into a scratch table per mode (dropped afterwards).
+
+    DATABASE_URL=postgresql://... python -m backend.benchmarks.price_storage [--candles 1000000]
+"""
+import argparse
+import time
+import numpy as np
+from sqlalchemy import MetaData, func, select
+from backend.benchmarks.synthetic import synthetic_candles
+from backend.database import engine, build_kline_table, read_price, PRICE_COLUMNS, PRICE_SCALE, PRICE_TYPES
+from backend.data.storage import KLINE_FIELDS, rows_to_columns, _copy_rows
+
+HOUR = 3600000
+
+def exchange_rows(count):
+    # Binance quotes prices to 2 decimals and volumes to 8, which every mode holds exactly
+    columns = synthetic_candles(count)
+    decimals = {'open': 2, 'high': 2, 'low': 2, 'close': 2, 'volume': 8}
+    values = [np.round(columns[name], decimals[name]) if name in decimals else columns[name] for name in KLINE_FIELDS]
+    return [('SYNTH', '1m', *row) for row in zip(*(array.tolist() for array in values))]
+
+def stored_rows(rows, mode):
+    if mode != 'scaled':
+        return rows
+    return [row[:3] + tuple(round(value * PRICE_SCALE) for value in row[3:8]) + row[8:] for row in rows]
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+def run_mode(mode, rows, repeat):
+    table = build_kline_table(MetaData(), mode, name=f'bench_kline_{mode}')
+    read = select(
+        table.c.open_time, *(read_price(table.c[name]) for name in PRICE_COLUMNS), table.c.close_time,
+    ).order_by(table.c.open_time)
+    hours = table.c.open_time // HOUR
+    rollup = select(
+        hours, func.max(table.c.high), func.min(table.c.low), func.sum(table.c.volume),
+    ).group_by(hours)
+
+    def read_columns():
+        with engine.connect() as connection:
+            return rows_to_columns(connection.execute(read).all())
+
+    def aggregate():
+        with engine.connect() as connection:
+            return connection.execute(rollup).all()
+
+    with engine.begin() as connection:
+        table.drop(connection, checkfirst=True)
+        table.create(connection)
+    try:
+        stored = stored_rows(rows, mode)
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            _copy_rows(connection, table.name, stored)
+        insert_seconds = time.perf_counter() - started
+        with engine.connect() as connection:
+            size = connection.exec_driver_sql(f"SELECT pg_total_relation_size('{table.name}')").scalar()
+        read_seconds, columns = best_of(read_columns, repeat)
+        aggregate_seconds, _ = best_of(aggregate, repeat)
+    finally:
+        with engine.begin() as connection:
+            table.drop(connection)
+    result = {
+        'mode': mode,
+        'bytes': size,
+        'insertRowsPerSecond': len(rows) / insert_seconds,
+        'readRowsPerSecond': len(rows) / read_seconds,
+        'aggregateSeconds': aggregate_seconds,
+    }
+    return result, columns
+
+def run(candles, modes, repeat=3):
+    rows = exchange_rows(candles)
+    results, reference = [], None
+    for mode in modes:
+        result, columns = run_mode(mode, rows, repeat)
+        reference = reference or columns
+        # Every mode must read back the same arrays
+        result['identical'] = all(np.array_equal(columns[name], reference[name]) for name in KLINE_FIELDS)
+        results.append(result)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--candles', type=int, default=1000000)
+    parser.add_argument('--modes', nargs='+', choices=list(PRICE_TYPES), default=list(PRICE_TYPES))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    if engine.dialect.name != 'postgresql':
+        parser.error('DATABASE_URL must point at PostgreSQL')
+
+    print(f"{args.candles} candles")
+    print(f"{'mode':>8} {'MB':>8} {'insert rows/s':>14} {'read rows/s':>12} {'hourly agg ms':>14} {'identical':>10}")
+    for row in run(args.candles, args.modes, args.repeat):
+        print(f"{row['mode']:>8} {row['bytes'] / 2 ** 20:>8.1f} {row['insertRowsPerSecond']:>14.0f} "
+              f"{row['readRowsPerSecond']:>12.0f} {row['aggregateSeconds'] * 1000:>14.1f} {str(row['identical']):>10}")
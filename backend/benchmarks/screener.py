@@ -0,0 +1,52 @@
+"""
+Scaling of the screener with worker processes: time to screen a synthetic universe of
+symbols already packed into a memory-mapped Universe, for each worker count.
+
+    python -m backend.benchmarks.screener [--symbols 500] [--candles 600] [--workers 1 2 4 8]
+"""
+import argparse
+import os
+import time
+import numpy as np
+from backend.benchmarks.synthetic import synthetic_candles
+from backend.data.parallel import Universe
+from backend.data.screener import Screen, scan
+
+CONDITIONS = 'rsi(14) < 30; macd(12,26,9).macd crosses_above macd(12,26,9).signal within 5'
+
+def synthetic_universe(symbols, candles):
+    series = [synthetic_candles(candles, seed=i) for i in range(symbols)]
+    columns = {name: np.concatenate([s[name] for s in series]) for name in series[0]}
+    offsets = np.arange(symbols + 1, dtype=np.int64) * candles
+    return Universe([f'SYM{i:04d}' for i in range(symbols)], offsets, columns)
+
+def run(symbols, candles, workers, conditions=CONDITIONS, repeat=3):
+    screen = Screen(conditions)
+    results = []
+    with synthetic_universe(symbols, candles) as universe:
+        for count in workers:
+            scan(universe, screen, count)  # starts the pool's processes outside the timing
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                matches = scan(universe, screen, count)
+                timings.append(time.perf_counter() - started)
+            results.append({'workers': count, 'seconds': min(timings), 'matches': len(matches)})
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--candles', type=int, default=600)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--conditions', default=CONDITIONS)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = run(args.symbols, args.candles, args.workers, args.conditions, args.repeat)
+    print(f"{args.symbols} symbols x {args.candles} candles: {args.conditions}")
+    print(f"{'workers':>8} {'scan ms':>9} {'speedup':>8} {'matches':>8}")
+    for row in results:
+        print(f"{row['workers']:>8} {row['seconds'] * 1000:>9.1f} "
+              f"{results[0]['seconds'] / row['seconds']:>8.2f} {row['matches']:>8}")
@@ -0,0 +1,197 @@
+"""
+Benchmark suite over synthetic candles on DATABASE_URL (SQLite or PostgreSQL): insert
+throughput of save_kline_data, get_kline_data range reads across quarter partitions,
+get_macd/get_rsi from cold, precomputed and cached state, and end-to-end route latency.
+Results are written as JSON, and --compare reports the cases that slowed down against an
+earlier run, so regressions can be tracked between commits.
+
+    DATABASE_URL=... python -m backend.benchmarks.suite [--sizes 1000 100000 1000000 10000000]
+        [--output results.json] [--compare baseline.json]
+
+Each size is stored as its own 1m series ending before now (symbols BENCH0, BENCH1, ...),
+written through every save listener the app registers, and deleted afterwards.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+from sqlalchemy import delete
+from backend.app import create_app
+from backend.benchmarks.synthetic import synthetic_candles
+from backend.config import Config
+from backend.database import (
+    engine, kline_table, kline_coverage_table, kline_versions_table, indicator_state_table, indicator_values_table,
+    partition_suffixes,
+)
+from backend.data.processing import get_macd, get_rsi, indicator_cache
+from backend.data.storage import columns_to_records, get_kline_data, save_kline_data
+
+INTERVAL = '1m'
+STEP = 60000
+SYMBOL_TABLES = (kline_table, kline_coverage_table, kline_versions_table, indicator_state_table, indicator_values_table)
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), 'results')
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def drop_symbol(symbol, tables=SYMBOL_TABLES):
+    with engine.begin() as connection:
+        for table in tables:
+            connection.execute(delete(table).where(table.c.symbol == symbol))
+    indicator_cache.clear()
+
+def store(symbol, columns, batch):
+    """
+    Save `columns` in batches of `batch` candles; only the save_kline_data calls are timed
+    """
+    seconds = 0.
+    for offset in range(0, len(columns['openTime']), batch):
+        records = columns_to_records({name: values[offset:offset + batch] for name, values in columns.items()})
+        started = time.perf_counter()
+        save_kline_data(symbol, INTERVAL, records)
+        seconds += time.perf_counter() - started
+    return seconds
+
+def indicator_cases(symbol, start, end, repeat):
+    results = []
+    for name, get in (('macd', get_macd), ('rsi', get_rsi)):
+        # cold seeds the series from every stored candle, warm reads the precomputed values
+        # and cached is served by the indicator cache
+        drop_symbol(symbol, (indicator_state_table, indicator_values_table))
+        started = time.perf_counter()
+        get(symbol, INTERVAL, start, end)
+        results.append({'case': name, 'label': 'cold', 'seconds': time.perf_counter() - started})
+
+        def warm():
+            indicator_cache.clear()
+            get(symbol, INTERVAL, start, end)
+        results.append({'case': name, 'label': 'warm', 'seconds': best_of(warm, repeat)})
+        results.append({'case': name, 'label': 'cached', 'seconds': best_of(lambda: get(symbol, INTERVAL, start, end), repeat)})
+    return results
+
+def route_cases(client, symbol, start, end, requests):
+    results = []
+    for path in ('/api/kline', '/api/macd', '/api/rsi'):
+        url = f'{path}?symbol={symbol}&interval={INTERVAL}&startTime={start}&endTime={end}'
+        latencies = []
+        for _ in range(requests):
+            indicator_cache.clear()
+            started = time.perf_counter()
+            response = client.get(url)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned {response.status_code}")
+        results.append({
+            'case': 'route',
+            'label': path,
+            'seconds': float(np.median(latencies)),
+            'p95Seconds': float(np.percentile(latencies, 95)),
+            'bytes': len(response.get_data()),
+        })
+    return results
+
+def run_size(client, index, size, args):
+    symbol = f'BENCH{index}'
+    now = int(time.time() * 1000)
+    start = (now // STEP - size - 1) * STEP  # every candle closed, so it all counts as covered
+    columns = synthetic_candles(size, INTERVAL, start_time=start, seed=index)
+    end = int(columns['openTime'][-1])
+    window_start = max(start, end - (args.window - 1) * STEP)
+
+    drop_symbol(symbol)
+    try:
+        insert_seconds = store(symbol, columns, args.batch)
+        results = [{'case': 'store', 'label': f'batch {args.batch}', 'seconds': insert_seconds,
+                    'rowsPerSecond': size / insert_seconds}]
+        for label, first in (('full', start), ('window', window_start)):
+            seconds = best_of(lambda: get_kline_data(symbol, INTERVAL, first, end), args.repeat)
+            results.append({'case': 'read', 'label': label, 'seconds': seconds,
+                            'rowsPerSecond': ((end - first) // STEP + 1) / seconds,
+                            'partitions': len(partition_suffixes(first, end))})
+        results += indicator_cases(symbol, start, end, args.repeat)
+        results += route_cases(client, symbol, window_start, end, args.requests)
+    finally:
+        drop_symbol(symbol)
+    return [{'candles': size, **result} for result in results]
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def result_key(result):
+    return (result['case'], result['label'], result['candles'])
+
+def compare(results, baseline, threshold, floor=0.001):
+    """
+    (result, baseline seconds, ratio) of the cases that take over `threshold` times as long
+    as in `baseline`. Cases under `floor` seconds in both runs are timer noise and skipped.
+    """
+    before = {result_key(result): result['seconds'] for result in baseline['results']}
+    slower = []
+    for result in results:
+        seconds = before.get(result_key(result))
+        if seconds and max(seconds, result['seconds']) >= floor and result['seconds'] / seconds > threshold:
+            slower.append((result, seconds, result['seconds'] / seconds))
+    return slower
+
+def run(sizes, args):
+    app = create_app()
+    client = app.test_client()
+    results = []
+    for index, size in enumerate(sizes):
+        results += run_size(client, index, size, args)
+    return {
+        'commit': git_commit(),
+        'createdAt': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'database': engine.dialect.name,
+        'priceStorage': Config.PRICE_STORAGE,
+        'python': platform.python_version(),
+        'results': results,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--batch', type=int, default=50000, help='candles per save_kline_data call')
+    parser.add_argument('--window', type=int, default=1000, help='candles requested by the window read and the routes')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=20, help='requests per route')
+    parser.add_argument('--output', help=f'results file (default: {DEFAULT_OUTPUT}/<commit>-<database>.json)')
+    parser.add_argument('--compare', help='earlier results file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=1.2, help='slowdown ratio reported as a regression')
+    args = parser.parse_args()
+
+    report = run(args.sizes, args)
+    output = args.output or os.path.join(DEFAULT_OUTPUT, f"{report['commit'] or 'unknown'}-{report['database']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'candles':>9} {'case':>6} {'label':>12} {'ms':>10} {'rows/s':>12}")
+    for row in report['results']:
+        rate = f"{row['rowsPerSecond']:.0f}" if row.get('rowsPerSecond') else ''
+        print(f"{row['candles']:>9} {row['case']:>6} {row['label']:>12} {row['seconds'] * 1000:>10.2f} {rate:>12}")
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = compare(report['results'], baseline, args.threshold)
+        for row, seconds, ratio in slower:
+            print(f"REGRESSION {row['candles']} {row['case']} {row['label']}: "
+                  f"{seconds * 1000:.2f} ms -> {row['seconds'] * 1000:.2f} ms ({ratio:.2f}x)")
+        print(f"{len(slower)} of {len(report['results'])} cases over {args.threshold}x {baseline.get('commit')}")
+        sys.exit(1 if slower else 0)
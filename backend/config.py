@@ -14,6 +14,71 @@ KLINE_DATA = {}
 class Config:
     DATABASE_URL = os.environ.get('DATABASE_URL') or 'postgresql://nickhalphide@localhost/kline_data'
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    # Connection pool of the shared engine. Size plus overflow covers asyncio.to_thread's
+    # default executor (min(32, cpus + 4) threads) and the background ingestion threads.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 30))
+    # Seconds to wait for a free connection, and the age after which one is replaced
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+    # PostgreSQL statement_timeout of every pooled connection; 0 disables it
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    # Threads running requests when served through backend.asgi
+    ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 64))
+    # Add a Server-Timing header with the per-stage time of each /api response
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
+    # Quarter partitions of kline_data created ahead of the current one
+    PARTITIONS_AHEAD = int(os.environ.get('PARTITIONS_AHEAD', 4))
+    # Column type of stored OHLCV values: 'numeric' (NUMERIC(20, 8)), 'double' (DOUBLE
+    # PRECISION) or 'scaled' (BIGINT of value * 10**8). Convert an existing database with
+    # python -m backend.database migrate-prices <mode> before changing it.
+    PRICE_STORAGE = os.environ.get('PRICE_STORAGE', 'numeric')
+    # Binance request weight allowed per minute and the weight of one 1000-candle klines call
+    BINANCE_WEIGHT_LIMIT = int(os.environ.get('BINANCE_WEIGHT_LIMIT', 1200))
+    BINANCE_KLINES_WEIGHT = int(os.environ.get('BINANCE_KLINES_WEIGHT', 2))
+    BACKFILL_CONCURRENCY = int(os.environ.get('BACKFILL_CONCURRENCY', 8))
+    BACKFILL_CHECKPOINT_DIR = os.environ.get('BACKFILL_CHECKPOINT_DIR', 'backfill_checkpoints')
+    # Memory budget and lifetime of cached MACD/RSI results
+    INDICATOR_CACHE_BYTES = int(os.environ.get('INDICATOR_CACHE_BYTES', 64 * 1024 * 1024))
+    INDICATOR_CACHE_TTL = float(os.environ.get('INDICATOR_CACHE_TTL', 300))
+    # Directory of the local hot tier serving sealed quarters of candles from memory-mapped
+    # .npy files; empty keeps every read on the database
+    HOT_TIER_DIR = os.environ.get('HOT_TIER_DIR', '')
+    # Candles per chunk when streaming a kline range
+    STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 10000))
+    # Pending events a slow /api/stream subscriber may fall behind before the oldest are
+    # dropped, and the idle time after which a keep-alive comment is sent
+    EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', 256))
+    EVENT_HEARTBEAT_SECONDS = float(os.environ.get('EVENT_HEARTBEAT_SECONDS', 15))
+    # Most candles one read may fetch from the exchange to fill holes in stored data
+    COVERAGE_MAX_FILL = int(os.environ.get('COVERAGE_MAX_FILL', 5000))
+    # Processes for screener scans and backtest sweeps; 1 runs them in the request thread
+    WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', os.cpu_count() or 1))
+    # Fee rate charged on each backtest fill, and the largest parameter sweep accepted
+    BACKTEST_FEE = float(os.environ.get('BACKTEST_FEE', 0.001))
+    BACKTEST_MAX_COMBINATIONS = int(os.environ.get('BACKTEST_MAX_COMBINATIONS', 10000))
+    # Higher intervals materialized from stored base candles instead of fetched from Binance
+    ROLLUP_BASE_INTERVAL = os.environ.get('ROLLUP_BASE_INTERVAL', '1m')
+    ROLLUP_INTERVALS = os.environ.get('ROLLUP_INTERVALS', '5m,15m,30m,1h,4h,1d,1w').split(',')
+    # Live ingestion: every symbol is fetched at every interval as each candle closes
+    INGEST_SYMBOLS = os.environ.get('INGEST_SYMBOLS', 'BTCUSDT').split(',')
+    INGEST_INTERVALS = os.environ.get('INGEST_INTERVALS', ROLLUP_BASE_INTERVAL).split(',')
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 8))
+    # Wait after a candle closes before fetching it, and between retries while it is missing
+    INGEST_CLOSE_DELAY_MS = int(os.environ.get('INGEST_CLOSE_DELAY_MS', 500))
+    INGEST_RETRY_SECONDS = float(os.environ.get('INGEST_RETRY_SECONDS', 2))
+    # Candles checked for holes at startup, and fetched for a pair with nothing stored
+    INGEST_LOOKBACK = int(os.environ.get('INGEST_LOOKBACK', 1000))
+    # Failed fetches of a hole before it is given up on; retries back off from
+    # INGEST_RETRY_SECONDS, doubling each time
+    INGEST_GAP_MAX_FAILURES = int(os.environ.get('INGEST_GAP_MAX_FAILURES', 5))
+    # Write-behind buffer every candle producer writes through: the candles it may hold
+    # before producers wait (and POST /api/ingest answers 503), and the buffered count or
+    # age of the oldest candle that triggers a group commit
+    WRITE_BUFFER_MAX_CANDLES = int(os.environ.get('WRITE_BUFFER_MAX_CANDLES', 1000000))
+    WRITE_BUFFER_FLUSH_CANDLES = int(os.environ.get('WRITE_BUFFER_FLUSH_CANDLES', 5000))
+    WRITE_BUFFER_FLUSH_MS = int(os.environ.get('WRITE_BUFFER_FLUSH_MS', 100))
 
     @staticmethod
     def setup_logging():
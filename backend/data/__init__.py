@@ -1,2 +1,2 @@
 from .processing import fetch_and_store_kline_data, get_macd, get_rsi
-from .storage import get_kline_data
+from .storage import get_kline_data, get_kline_columns, get_kline_frame
@@ -0,0 +1,218 @@
+import aiohttp
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from backend.config import Config, BINANCE_API_URL, BINANCE_API_KEY
+from backend.data.processing import get_interval_milliseconds
+from backend.data.buffer import write_buffer
+from backend.metrics import span
+
+logger = logging.getLogger(__name__)
+
+KLINES_PER_REQUEST = 1000  # Maximum allowed by Binance
+USED_WEIGHT_HEADER = 'X-MBX-USED-WEIGHT-1M'
+
+class WeightBudget:
+    """
+    Client-side view of the exchange's per-minute request weight. Requests reserve their
+    weight before being sent and the count is corrected from X-MBX-USED-WEIGHT-1M on every
+    response, so concurrent fetchers never push the account over `limit`.
+    """
+
+    def __init__(self, limit, window_seconds=60):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.used = 0
+        self.window_start = self._current_window()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _current_window(self):
+        return time.time() // self.window_seconds * self.window_seconds
+
+    def _roll(self):
+        window = self._current_window()
+        if window != self.window_start:
+            self.window_start = window
+            self.used = 0
+
+    async def acquire(self, weight):
+        async with self._lock:
+            while True:
+                now = time.time()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._roll()
+                if self.used + weight <= self.limit:
+                    self.used += weight
+                    return
+                await asyncio.sleep(self.window_start + self.window_seconds - now)
+
+    def update(self, used_weight):
+        # The exchange's count is authoritative; it also includes other clients on the same IP
+        self._roll()
+        self.used = max(self.used, used_weight)
+
+    def back_off(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+class BackfillCheckpoint:
+    """
+    Completed windows of one backfill job, persisted as JSON so an interrupted run resumes
+    where it stopped. Writes go through a temp file and os.replace to survive crashes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.done = set(json.load(f)['done'])
+
+    @classmethod
+    def for_job(cls, symbol, interval, start_time, end_time, directory=None):
+        directory = directory or Config.BACKFILL_CHECKPOINT_DIR
+        os.makedirs(directory, exist_ok=True)
+        return cls(os.path.join(directory, f'{symbol}_{interval}_{start_time}_{end_time}.json'))
+
+    def mark_done(self, window_start):
+        self.done.add(window_start)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'done': sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+
+def split_windows(interval, start_time, end_time):
+    """
+    Split [start_time, end_time) into windows of at most one request worth of candles
+    """
+    step = KLINES_PER_REQUEST * get_interval_milliseconds(interval)
+    return [(start, min(start + step, end_time)) for start in range(start_time, end_time, step)]
+
+def parse_klines(klines):
+    return [
+        {
+            "openTime": int(item[0]),
+            "open": float(item[1]),
+            "high": float(item[2]),
+            "low": float(item[3]),
+            "close": float(item[4]),
+            "volume": float(item[5]),
+            "closeTime": int(item[6])
+        }
+        for item in klines
+    ]
+
+async def fetch_window(session, budget, base_url, symbol, interval, start_time, end_time, max_retries=5):
+    """
+    Fetch the candles opening in [start_time, end_time) with a single klines request
+    """
+    params = {
+        "symbol": symbol,
+        "interval": interval,
+        "startTime": start_time,
+        "endTime": end_time - 1,
+        "limit": KLINES_PER_REQUEST,
+    }
+    for attempt in range(max_retries + 1):
+        await budget.acquire(Config.BINANCE_KLINES_WEIGHT)
+        try:
+            with span('fetch', 'binance') as timing:
+                async with session.get(f"{base_url}/api/v3/klines", params=params) as response:
+                    if USED_WEIGHT_HEADER in response.headers:
+                        budget.update(int(response.headers[USED_WEIGHT_HEADER]))
+                    if response.status in (418, 429):
+                        retry_after = int(response.headers.get('Retry-After', 60))
+                        logger.warning(f"Rate limited by exchange ({response.status}), backing off {retry_after}s")
+                        budget.back_off(retry_after)
+                        continue
+                    response.raise_for_status()
+                    body = await response.read()
+                    klines = parse_klines(json.loads(body))
+                    timing.rows, timing.nbytes = len(klines), len(body)
+                    return klines
+        except aiohttp.ClientError as e:
+            if (isinstance(e, aiohttp.ClientResponseError) and e.status < 500) or attempt == max_retries:
+                raise
+            delay = min(2 ** attempt, 30)
+            logger.warning(f"Error fetching {symbol} {interval} window {start_time}: {e}, retrying in {delay}s")
+            await asyncio.sleep(delay)
+    raise RuntimeError(f"Rate limited on every attempt for {symbol} {interval} window {start_time}")
+
+async def backfill_async(symbol, interval, start_time, end_time, writer=write_buffer.save, checkpoint=None,
+                         base_url=None, concurrency=None, budget=None):
+    """
+    Backfill [start_time, end_time) by fetching independent windows concurrently within the
+    exchange weight budget. Each window is handed to `writer(symbol, interval, candles)` as
+    soon as it arrives, so memory stays bounded by the number of in-flight windows.
+    Windows already recorded in `checkpoint` are skipped.
+    """
+    base_url = base_url or BINANCE_API_URL
+    concurrency = concurrency or Config.BACKFILL_CONCURRENCY
+    budget = budget or WeightBudget(Config.BINANCE_WEIGHT_LIMIT)
+    if checkpoint is None:
+        checkpoint = BackfillCheckpoint.for_job(symbol, interval, start_time, end_time)
+
+    windows = [w for w in split_windows(interval, start_time, end_time) if w[0] not in checkpoint.done]
+    queue = asyncio.Queue()
+    for window in windows:
+        queue.put_nowait(window)
+    stats = {'windows': len(windows), 'candles': 0, 'failed': 0}
+    started = time.perf_counter()
+
+    async def worker(session):
+        while True:
+            try:
+                window_start, window_end = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                candles = await fetch_window(session, budget, base_url, symbol, interval, window_start, window_end)
+                # The writer logs and returns 0 when the write fails; keep such windows unchecked
+                if candles and await asyncio.to_thread(writer, symbol, interval, candles) == 0:
+                    raise RuntimeError("writer stored no rows")
+                checkpoint.mark_done(window_start)
+                stats['candles'] += len(candles)
+            except Exception as e:
+                logger.error(f"Backfill window {window_start}-{window_end} for {symbol} {interval} failed: {e}")
+                stats['failed'] += 1
+
+    headers = {"X-MBX-APIKEY": BINANCE_API_KEY} if BINANCE_API_KEY else None
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+        await asyncio.gather(*(worker(session) for _ in range(min(concurrency, len(windows)))))
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Backfilled {stats['candles']} {symbol} {interval} candles from {stats['windows']} windows "
+        f"in {elapsed:.1f}s ({stats['failed']} failed)"
+    )
+    return stats
+
+def backfill(symbol, interval, start_time, end_time, **kwargs):
+    return asyncio.run(backfill_async(symbol, interval, start_time, end_time, **kwargs))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backfill Binance candles into the kline store')
+    parser.add_argument('symbol')
+    parser.add_argument('interval')
+    parser.add_argument('start_time', type=int, help='inclusive, milliseconds')
+    parser.add_argument('end_time', type=int, help='exclusive, milliseconds')
+    args = parser.parse_args(argv)
+
+    Config.setup_logging()
+    # Imported here: coverage, one of the listeners, imports this module
+    from backend.data.listeners import register_save_listeners
+    # Backfilled history is then covered, rolled up and folded into indicator state like
+    # candles the server stores
+    register_save_listeners()
+    stats = backfill(args.symbol, args.interval, args.start_time, args.end_time, writer=write_buffer.save)
+    write_buffer.close()
+    return stats
+
+if __name__ == '__main__':
+    main()
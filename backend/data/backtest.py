@@ -0,0 +1,202 @@
+import itertools
+import logging
+import math
+import time
+import numpy as np
+from backend.config import Config
+from backend.data.batch import Inputs, compute_batch
+from backend.data.parallel import Universe, get_pool, map_universe, universe_columns
+from backend.data.processing import get_interval_milliseconds
+from backend.data.screener import Screen
+from backend.data.storage import get_kline_columns
+
+logger = logging.getLogger(__name__)
+
+YEAR = 365 * 86400000
+
+class Strategy:
+    """
+    Long-only rule. `entry` and `exit` are screener conditions ('rsi(14) < 30; ...'). A
+    position opens at the next candle's open after every entry condition holds at a close
+    and closes at the next open after every exit condition holds; exit wins when both do.
+    `size` is the fraction of equity put into each trade and `fee` the rate charged on the
+    notional of every fill.
+    """
+
+    def __init__(self, entry, exit, fee=None, size=None):
+        self.entry, self.exit = Screen(entry), Screen(exit)
+        self.fee = Config.BACKTEST_FEE if fee is None else float(fee)
+        self.size = 1.0 if size is None else float(size)
+        if not 0 <= self.fee < 1:
+            raise ValueError("fee must be in [0, 1)")
+        if not 0 < self.size <= 1:
+            raise ValueError("size must be in (0, 1]")
+        specs = self.entry.specs + self.exit.specs
+        self.specs = list({spec.label: spec for spec in specs}.values())
+
+    def warmup_start(self, interval, start_time):
+        """
+        Open time of the first candle to load so every indicator is warmed up at `start_time`
+        """
+        return min([start_time] + [spec.warmup_start(interval, start_time) for spec in self.specs])
+
+def positions(entries, exits):
+    """
+    Whether a position is held during each candle, given the candles at whose close the
+    entry and exit signals fired. Without a per-candle loop: a position is wanted after a
+    close when the latest entry signal so far is newer than the latest exit signal, and is
+    held from the next open.
+    """
+    index = np.arange(len(entries))
+    last_entry = np.maximum.accumulate(np.where(entries, index, -1))
+    last_exit = np.maximum.accumulate(np.where(exits, index, -1))
+    return np.r_[False, (last_entry > last_exit)[:-1]]
+
+def simulate(open_, close, held, fee, size):
+    """
+    Equity (starting at 1, marked at each close) and per-trade multipliers of holding
+    during the `held` candles. Fills happen at the open; a position still held at the end
+    is closed at the last close. Equity is compounded trade by trade, so within a trade the
+    invested part moves with the price and the rest stays in cash.
+    """
+    change = np.diff(held.astype(np.int8), prepend=0)
+    entry_bars = np.flatnonzero(change == 1)
+    exit_bars = np.flatnonzero(change == -1)
+    entry_prices = open_[entry_bars]
+    exit_prices = np.r_[open_[exit_bars], close[-1:]][:len(entry_bars)]
+    multipliers = (1 - size) + size * (1 - fee) ** 2 * exit_prices / entry_prices
+    before = np.r_[1., np.cumprod(multipliers)]  # equity before each trade, then the final equity
+
+    # Flat candles carry the equity after the trades closed so far; held candles mark the
+    # open trade to the close, net of its entry fee
+    equity = before[np.cumsum(change == -1, dtype=np.int32)]
+    trade = np.cumsum(change == 1, dtype=np.int32)[held] - 1
+    equity[held] = before[trade] * ((1 - size) + size * (1 - fee) * close[held] / entry_prices[trade])
+    return equity, multipliers, entry_bars, exit_bars
+
+def metrics(equity, multipliers, held, close, open_, interval):
+    returns = np.diff(equity) / equity[:-1] if len(equity) > 1 else np.zeros(0)
+    deviation = returns.std() if len(returns) else 0.
+    final = float(np.prod(multipliers))
+    return {
+        'totalReturn': final - 1,
+        'buyAndHoldReturn': float(close[-1] / open_[0] - 1),
+        'maxDrawdown': float(np.max(1 - equity / np.maximum.accumulate(equity))),
+        'sharpe': float(returns.mean() / deviation * math.sqrt(YEAR / get_interval_milliseconds(interval))) if deviation > 0 else 0.,
+        'trades': len(multipliers),
+        'winRate': float(np.mean(multipliers > 1)) if len(multipliers) else None,
+        'exposure': float(held.mean()),
+    }
+
+def backtest_columns(columns, strategy, interval, start_time=None, inputs=None):
+    """
+    Run `strategy` over candle columns loaded from its warm-up start; trading begins at
+    `start_time`. Returns the metrics, the equity curve, the (entry, exit) candle indices
+    of the trades and the index of the first traded candle in `columns`.
+    """
+    inputs = inputs or Inputs(columns)
+    series = {**columns, **compute_batch(columns, strategy.specs, inputs=inputs)}
+    first = 0 if start_time is None else int(np.searchsorted(columns['openTime'], start_time))
+    entries = strategy.entry.signals(series, inputs.memo)[first:]
+    exits = strategy.exit.signals(series, inputs.memo)[first:]
+    open_, close = columns['open'][first:], columns['close'][first:]
+    if not len(close):
+        raise ValueError("No candles stored in the backtest range")
+
+    held = positions(entries, exits)
+    equity, multipliers, entry_bars, exit_bars = simulate(open_, close, held, strategy.fee, strategy.size)
+    return metrics(equity, multipliers, held, close, open_, interval), equity, (entry_bars, exit_bars), first
+
+def run_backtest(strategy, symbol, interval, start_time, end_time):
+    """
+    Backtest over the stored candles of [start_time, end_time]. Returns the metrics, the
+    trades and the equity curve as columns, or None when no candles are stored there.
+    """
+    columns = get_kline_columns(symbol, interval, max(strategy.warmup_start(interval, start_time), 0), end_time)
+    if not np.any(columns['openTime'] >= start_time):
+        return None
+    result, equity, (entry_bars, exit_bars), first = backtest_columns(columns, strategy, interval, start_time)
+    open_times, open_, close = columns['openTime'][first:], columns['open'][first:], columns['close'][first:]
+    exit_prices = np.r_[open_[exit_bars], close[-1:]][:len(entry_bars)]
+    trades = [
+        {
+            'entryTime': int(open_times[entry]),
+            'exitTime': int(open_times[exit_]) if i < len(exit_bars) else None,
+            'entryPrice': float(open_[entry]),
+            'exitPrice': float(exit_price),
+            'return': float(exit_price / open_[entry] - 1),
+        }
+        for i, (entry, exit_, exit_price) in enumerate(itertools.zip_longest(entry_bars, exit_bars[:len(entry_bars)], exit_prices))
+    ]
+    return {'metrics': result, 'trades': trades, 'equity': {'timestamps': open_times, 'equity': equity}}
+
+def expand_grid(grid):
+    """
+    Every combination of a {name: [values]} grid as a list of {name: value} dicts
+    """
+    names = list(grid)
+    if any(not isinstance(grid[name], list) or not grid[name] for name in names):
+        raise ValueError("Every grid parameter needs a non-empty list of values")
+    count = math.prod(len(grid[name]) for name in names)
+    if count > Config.BACKTEST_MAX_COMBINATIONS:
+        raise ValueError(f"Grid has {count} combinations, over BACKTEST_MAX_COMBINATIONS ({Config.BACKTEST_MAX_COMBINATIONS})")
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def strategies_for_grid(entry, exit, grid, fee=None, size=None):
+    """
+    One Strategy per grid combination, filling '{name}' placeholders of the entry and exit
+    templates, e.g. 'macd({fast},{slow},9).macd crosses_above macd({fast},{slow},9).signal'
+    """
+    combinations = expand_grid(grid)
+    try:
+        return combinations, [
+            Strategy(entry.format(**params), exit.format(**params), fee, size) for params in combinations
+        ]
+    except (KeyError, IndexError) as e:
+        raise ValueError(f"Template placeholder missing from the grid: {e}") from None
+
+def _run_strategies(path, strategies, interval, start_time):
+    # Runs in a pool worker: one mapping of the candles and one indicator memo for the chunk,
+    # so combinations sharing an indicator compute it once
+    columns = universe_columns(map_universe(path), 0, None)
+    inputs = Inputs(columns)
+    return [backtest_columns(columns, strategy, interval, start_time, inputs)[0] for strategy in strategies]
+
+def sweep_universe(universe, strategies, interval, start_time=None, workers=None):
+    """
+    Metrics of every strategy over the single-symbol `universe`, over `workers` processes
+    (WORKER_PROCESSES by default; 1 runs in this process), in the order given
+    """
+    workers = workers or Config.WORKER_PROCESSES
+    if workers <= 1 or len(strategies) == 1:
+        return _run_strategies(universe.path, strategies, interval, start_time)
+    pool = get_pool(workers)
+    # Contiguous chunks keep neighbouring combinations, which share most indicators, together
+    chunk = math.ceil(len(strategies) / (workers * 4))
+    futures = [
+        pool.submit(_run_strategies, universe.path, strategies[i:i + chunk], interval, start_time)
+        for i in range(0, len(strategies), chunk)
+    ]
+    return [result for future in futures for result in future.result()]
+
+def run_sweep(combinations, strategies, symbol, interval, start_time, end_time, workers=None):
+    """
+    Backtest every strategy (see strategies_for_grid) over the stored candles of
+    [start_time, end_time], reading them once. Returns each combination's parameters and
+    metrics, best total return first, or None when no candles are stored there.
+    """
+    load_start = min(strategy.warmup_start(interval, start_time) for strategy in strategies)
+    started = time.perf_counter()
+    columns = get_kline_columns(symbol, interval, max(load_start, 0), end_time)
+    if not np.any(columns['openTime'] >= start_time):
+        return None
+    with Universe.from_columns(symbol, columns) as universe:
+        results = sweep_universe(universe, strategies, interval, start_time, workers)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Swept {len(strategies)} {symbol} {interval} combinations over {len(columns['openTime'])} candles in {elapsed:.2f}s")
+    ranked = sorted(zip(combinations, results), key=lambda pair: pair[1]['totalReturn'], reverse=True)
+    return {
+        'combinations': len(strategies),
+        'seconds': elapsed,
+        'results': [{'params': params, 'metrics': result} for params, result in ranked],
+    }
@@ -0,0 +1,262 @@
+import math
+import re
+import numpy as np
+import pandas as pd
+from backend.data.indicators import compute_rsi
+from backend.data.processing import get_interval_milliseconds, indicator_cache, normalize_candle_range
+from backend.data.resample import bucket_open_times
+from backend.data.storage import get_kline_columns, series_version
+from backend.metrics import span
+
+# Candles of history loaded per unit of 1 / alpha before an exponentially weighted indicator's
+# first returned value; older candles then carry under e^-20 (2e-9) of its weight
+EWM_WARMUP = 20
+
+class Inputs:
+    """
+    Candle columns shared by every indicator of a batch, with the intermediate series
+    several indicators need (EMAs, rolling means, true range) computed once and reused
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self._memo = {}
+
+    def __getitem__(self, field):
+        return self.columns[field]
+
+    def memo(self, key, compute):
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def ema(self, span):
+        return self.memo(('ema', span), lambda: pd.Series(self['close']).ewm(span=span, adjust=False).mean().to_numpy())
+
+    def sma(self, periods):
+        return self.memo(('sma', periods), lambda: pd.Series(self['close']).rolling(periods).mean().to_numpy())
+
+    def true_range(self):
+        def compute():
+            high, low, close = self['high'], self['low'], self['close']
+            previous = np.r_[np.nan, close[:-1]]
+            return np.fmax(high - low, np.fmax(np.abs(high - previous), np.abs(low - previous)))
+        return self.memo(('true_range',), compute)
+
+class IndicatorSpec:
+    """
+    One requested indicator: `name` and `defaults` describe it, `params` are the values
+    asked for. Subclasses compute their output fields from shared Inputs and say how much
+    history before the first returned candle they need.
+    """
+    name = None
+    defaults = ()
+    fields = ()
+
+    def __init__(self, *params):
+        if len(params) > len(self.defaults):
+            raise ValueError(f"{self.name} takes at most {len(self.defaults)} parameters")
+        self.params = tuple(self.parse(value, default) for value, default in zip(params, self.defaults))
+        self.params += self.defaults[len(params):]
+
+    def parse(self, value, default):
+        # Parameters take the type of their default and must be positive
+        try:
+            value = type(default)(value)
+        except ValueError:
+            raise ValueError(f"Invalid {self.name} parameter: {value}") from None
+        if not 0 < value < math.inf:
+            raise ValueError(f"{self.name} parameters must be positive, got {value}")
+        return value
+
+    @property
+    def label(self):
+        return f"{self.name}({','.join(map(str, self.params))})" if self.params else self.name
+
+    def columns(self):
+        # Response column names; a single-output indicator is named by its label alone
+        if len(self.fields) == 1:
+            return [self.label]
+        return [f"{self.label}.{field}" for field in self.fields]
+
+    def warmup_start(self, interval, start_time):
+        return start_time - self.lookback() * get_interval_milliseconds(interval)
+
+    def lookback(self):
+        return 0
+
+    def compute(self, inputs):
+        raise NotImplementedError
+
+class EMA(IndicatorSpec):
+    name = 'ema'
+    defaults = (20,)
+    fields = ('ema',)
+
+    def lookback(self):
+        return EWM_WARMUP * (self.params[0] + 1) // 2
+
+    def compute(self, inputs):
+        return (inputs.ema(self.params[0]),)
+
+class SMA(IndicatorSpec):
+    name = 'sma'
+    defaults = (20,)
+    fields = ('sma',)
+
+    def lookback(self):
+        return self.params[0] - 1
+
+    def compute(self, inputs):
+        return (inputs.sma(self.params[0]),)
+
+class MACDSpec(IndicatorSpec):
+    name = 'macd'
+    defaults = (12, 26, 9)
+    fields = ('macd', 'signal', 'histogram')
+
+    def lookback(self):
+        return EWM_WARMUP * (max(self.params) + 1) // 2
+
+    def compute(self, inputs):
+        fast, slow, signal = self.params
+        macd = inputs.ema(fast) - inputs.ema(slow)
+        signal_line = pd.Series(macd).ewm(span=signal, adjust=False).mean().to_numpy()
+        return macd, signal_line, macd - signal_line
+
+class RSISpec(IndicatorSpec):
+    name = 'rsi'
+    defaults = (14,)
+    fields = ('rsi',)
+
+    def lookback(self):
+        return EWM_WARMUP * self.params[0]
+
+    def compute(self, inputs):
+        return (compute_rsi(inputs['close'], self.params[0]),)
+
+class Bollinger(IndicatorSpec):
+    name = 'bbands'
+    defaults = (20, 2.0)
+    fields = ('middle', 'upper', 'lower')
+
+    def lookback(self):
+        return self.params[0] - 1
+
+    def compute(self, inputs):
+        periods, width = self.params
+        middle = inputs.sma(periods)
+        deviation = width * pd.Series(inputs['close']).rolling(periods).std(ddof=0).to_numpy()
+        return middle, middle + deviation, middle - deviation
+
+class ATR(IndicatorSpec):
+    name = 'atr'
+    defaults = (14,)
+    fields = ('atr',)
+
+    def lookback(self):
+        return EWM_WARMUP * self.params[0]
+
+    def compute(self, inputs):
+        # Wilder's smoothing: an EMA with alpha = 1 / periods
+        periods = self.params[0]
+        atr = pd.Series(inputs.true_range()).ewm(alpha=1 / periods, adjust=False, min_periods=periods).mean()
+        return (atr.to_numpy(),)
+
+class VWAP(IndicatorSpec):
+    """
+    Volume-weighted average typical price, restarting at each `anchor` candle (a UTC day
+    by default)
+    """
+    name = 'vwap'
+    defaults = ('1d',)
+    fields = ('vwap',)
+
+    def parse(self, value, default):
+        if value not in VWAP_ANCHORS:
+            raise ValueError(f"vwap anchor must be one of {', '.join(VWAP_ANCHORS)}")
+        return value
+
+    def warmup_start(self, interval, start_time):
+        return int(bucket_open_times([start_time], self.params[0])[0])
+
+    def compute(self, inputs):
+        typical = (inputs['high'] + inputs['low'] + inputs['close']) / 3
+        volume = inputs['volume']
+        sessions = bucket_open_times(inputs['openTime'], self.params[0])
+        # Running sums restart with each session rather than subtracting a global cumsum,
+        # which would lose precision over long ranges
+        price_volume = pd.Series(typical * volume).groupby(sessions).cumsum().to_numpy()
+        total_volume = pd.Series(volume).groupby(sessions).cumsum().to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (price_volume / total_volume,)
+
+VWAP_ANCHORS = ('1h', '4h', '1d', '1w', '1M')
+
+SPECS = {spec.name: spec for spec in (EMA, SMA, MACDSpec, RSISpec, Bollinger, ATR, VWAP)}
+
+SPEC_PATTERN = re.compile(r'\s*(\w+)\s*(?:\(([^)]*)\))?\s*(?:,|$)')
+
+def parse_specs(text):
+    """
+    Parse a comma separated list such as 'macd(12,26,9),rsi,bbands(20,2.5)' into
+    IndicatorSpecs; omitted parameters take each indicator's defaults. Raises ValueError
+    for unknown indicators or malformed lists.
+    """
+    specs, position = [], 0
+    while position < len(text):
+        match = SPEC_PATTERN.match(text, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Malformed indicator list near '{text[position:]}'")
+        name, params = match.group(1).lower(), match.group(2)
+        if name not in SPECS:
+            raise ValueError(f"Unknown indicator: {name}")
+        specs.append(SPECS[name](*(p.strip() for p in params.split(',')) if params else ()))
+        position = match.end()
+    if not specs:
+        raise ValueError("No indicators requested")
+    labels = [spec.label for spec in specs]
+    if len(set(labels)) != len(labels):
+        raise ValueError("Duplicate indicators requested")
+    return specs
+
+def _timed_compute(spec, inputs):
+    with span('compute', spec.name) as timing:
+        timing.rows = len(inputs.columns['openTime'])
+        return spec.compute(inputs)
+
+def compute_batch(columns, specs, start_time=None, inputs=None):
+    """
+    Compute every spec over one set of candle columns and return their outputs aligned to
+    a single 'timestamps' vector, dropping candles before `start_time` (the warm-up).
+    Passing the same `inputs` for several batches over the same columns reuses every
+    indicator already computed, as a backtest sweep does.
+    """
+    inputs = inputs or Inputs(columns)
+    keep = slice(None) if start_time is None else slice(int(np.searchsorted(columns['openTime'], start_time)), None)
+    result = {'timestamps': columns['openTime'][keep]}
+    for spec in specs:
+        outputs = inputs.memo(('spec', spec.label), lambda: _timed_compute(spec, inputs))
+        for name, values in zip(spec.columns(), outputs):
+            result[name] = values[keep]
+    return result
+
+def get_indicator_batch(symbol, interval, start_time, end_time, specs):
+    """
+    Compute many indicators over [start_time, end_time] from a single candle range read,
+    extended back far enough to warm up the spec needing the most history. Results are
+    cached like get_macd/get_rsi. Returns None when no candles are stored in the range.
+    """
+    start_time, end_time = normalize_candle_range(interval, start_time, end_time)
+
+    def compute():
+        load_start = min(spec.warmup_start(interval, start_time) for spec in specs)
+        columns = get_kline_columns(symbol, interval, max(load_start, 0), end_time)
+        result = compute_batch(columns, specs, start_time)
+        return result if len(result['timestamps']) else None
+
+    labels = tuple(spec.label for spec in specs)
+    return indicator_cache.get_or_compute(
+        ('batch', symbol, interval, start_time, end_time, labels), compute,
+        series_version(symbol, interval, 0, end_time),
+    )
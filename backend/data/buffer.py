@@ -0,0 +1,206 @@
+import atexit
+import logging
+import threading
+import time
+from backend.config import Config
+from backend.data.storage import normalize_rows, rows_to_columns, save_kline_columns, save_kline_series
+
+logger = logging.getLogger(__name__)
+
+class Flush:
+    """
+    One group commit; `done` is set once it has been written and `failed` then holds the
+    (symbol, interval) series that couldn't be
+    """
+    __slots__ = ('done', 'failed')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.failed = set()
+
+class WriteBuffer:
+    """
+    Write-behind buffer shared by every candle producer. Batches are held per (symbol,
+    interval) and written by a background thread in group commits, one transaction for
+    everything buffered, once `flush_candles` are waiting or the oldest has waited
+    `flush_seconds`. A producer blocked in save() doesn't wait for either: its batch goes
+    out as soon as the writer is free, with whatever else arrived during the previous
+    commit. A candle buffered again before its flush is written once with its last values,
+    so the forming candle's repeated updates collapse.
+
+    At most `max_candles` are held, counting a commit in progress: put() refuses batches
+    beyond that (POST /api/ingest answers 503) and save() waits for room. Whatever is
+    buffered is flushed by close(), which runs at interpreter exit.
+    """
+
+    def __init__(self, max_candles, flush_candles, flush_seconds, writer=save_kline_series):
+        self.max_candles = max_candles
+        self.flush_candles = flush_candles
+        self.flush_seconds = flush_seconds
+        self.writer = writer
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self.flushes = 0
+        self.peak_candles = 0
+        self._pending = []  # (symbol, interval, columns) in arrival order
+        self._pending_candles = 0
+        self._oldest = None  # monotonic time the oldest pending batch arrived
+        self._writing = 0  # candles of the commit in progress
+        self._flush = Flush()  # the commit the pending batches will go out in
+        self._flush_requested = False
+        self._waited = False  # a producer is blocked on the pending batches
+        self._closing = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def _queued(self):
+        return self._pending_candles + self._writing
+
+    def put(self, batches, block=False, timeout=None, urgent=False):
+        """
+        Buffer every (symbol, interval, columns) batch, or none of them if they don't fit and
+        `block` is false (or `timeout` seconds pass first). `urgent` batches are committed as
+        soon as the writer is free. Returns the Flush that will write them, or None if they
+        weren't buffered.
+        """
+        candles = sum(len(columns['openTime']) for _, _, columns in batches)
+        with self._condition:
+            # A batch larger than the whole buffer still goes in once the buffer is empty
+            fits = lambda: self._queued() + candles <= self.max_candles or not self._queued()
+            if self._closing or not (fits() or block and self._condition.wait_for(fits, timeout)):
+                self.rejected += candles
+                return None
+            self._pending.extend(batches)
+            self._pending_candles += candles
+            self._oldest = self._oldest or time.monotonic()
+            self._waited = self._waited or urgent
+            self.accepted += candles
+            self.peak_candles = max(self.peak_candles, self._queued())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-buffer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            self._condition.notify_all()
+            return self._flush
+
+    def save(self, symbol, interval, data):
+        """
+        save_kline_data through the buffer: waits for the group commit holding `data` and
+        returns the number of candles given, or 0 if their write failed. A drop-in `writer`
+        for the scheduler and backfill.
+        """
+        try:
+            rows = normalize_rows(symbol, interval, data)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Error preparing kline data for {symbol} {interval}: {e}")
+            return 0
+        if not rows:
+            return 0
+        columns = rows_to_columns([row[2:] for row in rows])
+        if threading.current_thread() is self._thread:
+            # A save listener writing from inside a flush would wait on itself
+            return save_kline_columns(symbol, interval, columns)
+        flush = self.put([(symbol, interval, columns)], block=True, urgent=True)
+        if flush is None:
+            return 0
+        flush.done.wait()
+        return 0 if (symbol, interval) in flush.failed else len(rows)
+
+    def flush(self, timeout=None):
+        """
+        Write everything buffered now instead of at the next threshold; returns False if
+        that didn't finish within `timeout` seconds
+        """
+        with self._condition:
+            if not self._pending:
+                return self._condition.wait_for(lambda: not self._writing, timeout)
+            flush = self._flush
+            self._flush_requested = True
+            self._condition.notify_all()
+        return flush.done.wait(timeout)
+
+    def close(self, timeout=None):
+        """
+        Flush what is buffered and stop the writer thread; later puts are refused
+        """
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _due(self):
+        if not self._pending:
+            return False
+        return (
+            self._closing or self._flush_requested or self._waited or self._pending_candles >= self.flush_candles
+            or time.monotonic() - self._oldest >= self.flush_seconds
+        )
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._due():
+                    if self._closing:
+                        return
+                    wait = None if self._oldest is None else self._oldest + self.flush_seconds - time.monotonic()
+                    self._condition.wait(None if wait is None else max(wait, 0))
+                batches, flush, candles = self._pending, self._flush, self._pending_candles
+                self._pending, self._flush, self._pending_candles = [], Flush(), 0
+                self._oldest, self._flush_requested, self._waited, self._writing = None, False, False, candles
+            flush.failed = self._write(batches)
+            with self._condition:
+                self._writing = 0
+                self.flushes += 1
+                failed = sum(len(c['openTime']) for s, i, c in batches if (s, i) in flush.failed)
+                self.failed += failed
+                self.written += candles - failed
+                self._condition.notify_all()
+            flush.done.set()
+
+    def _write(self, batches):
+        # One transaction for every series; if it fails, each series is retried on its own so
+        # one bad series doesn't lose the others. Returns the series that couldn't be written.
+        candles = sum(len(columns['openTime']) for _, _, columns in batches)
+        try:
+            written = self.writer(batches)
+        except Exception as e:
+            logger.error(f"Error in group commit of {len(batches)} candle batches: {e}")
+            written = 0
+        if written:
+            with self._condition:
+                self.deduplicated += candles - written
+            return set()
+        failed = set()
+        for key in dict.fromkeys((symbol, interval) for symbol, interval, _ in batches):
+            try:
+                written = self.writer([batch for batch in batches if batch[:2] == key])
+            except Exception as e:
+                logger.error(f"Error writing {key[0]} {key[1]} candles: {e}")
+                written = 0
+            if not written:
+                failed.add(key)
+        return failed
+
+    def stats(self):
+        with self._condition:
+            return {
+                'bufferedCandles': self._pending_candles,
+                'writingCandles': self._writing,
+                'maxCandles': self.max_candles,
+                'peakCandles': self.peak_candles,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'written': self.written,
+                'deduplicated': self.deduplicated,
+                'failed': self.failed,
+                'flushes': self.flushes,
+            }
+
+write_buffer = WriteBuffer(
+    Config.WRITE_BUFFER_MAX_CANDLES, Config.WRITE_BUFFER_FLUSH_CANDLES, Config.WRITE_BUFFER_FLUSH_MS / 1000,
+)
@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from backend.metrics import span
+
+def result_nbytes(value):
+    """
+    Approximate memory held by a cached indicator result (a dict of NumPy arrays, or None)
+    """
+    if value is None:
+        return 0
+    return sum(getattr(array, 'nbytes', 0) for array in value.values())
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time: callers arriving while one is in flight
+    wait for it and share its result, or its exception. Their wait is timed as a 'wait' span
+    with `name` as its detail, so it shows in their Server-Timing.
+    """
+
+    def __init__(self, name=''):
+        self.name = name
+        self.runs = 0
+        self.shared = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, compute):
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self.runs += 1
+            else:
+                self.shared += 1
+        if not owner:
+            with span('wait', self.name):
+                return future.result()
+        try:
+            value = compute()
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            return {'runs': self.runs, 'shared': self.shared, 'inflight': len(self._inflight)}
+
+class IndicatorCache:
+    """
+    Thread-safe LRU cache of indicator results bounded by total array bytes, with a TTL.
+    Keys are (name, symbol, interval, start_time, end_time, *params) tuples so writes for a
+    (symbol, interval) can drop exactly the entries whose range they touch. Writes by other
+    processes never reach invalidate(), so each entry also records the stored series version
+    it was computed from and is only served to callers passing the same version.
+    """
+
+    def __init__(self, max_bytes, ttl_seconds):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (expires_at, nbytes, value, version)
+        self._series = {}  # (symbol, interval) -> keys cached for that series
+        self._generations = {}  # (symbol, interval) -> number of invalidating writes seen
+        self._flights = SingleFlight('indicator')  # concurrent misses of one key compute it once
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        nbytes = self._entries.pop(key)[1]
+        self.bytes -= nbytes
+        series_keys = self._series[key[1:3]]
+        series_keys.discard(key)
+        if not series_keys:
+            del self._series[key[1:3]]
+
+    def get_or_compute(self, key, compute, version=None):
+        """
+        Return the result cached for `key` at `version`, the storage.series_version of the
+        candles it reads, calling `compute()` and storing its result on a miss
+        """
+        series = key[1:3]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic() and entry[3] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                self._remove(key)
+                if entry[3] != version:
+                    self.invalidations += 1
+                else:
+                    self.expirations += 1
+            self.misses += 1
+            generation = self._generations.get(series, 0)
+
+        def compute_and_put():
+            value = compute()
+            self._put(key, value, generation, version)
+            return value
+        return self._flights.do((key, version), compute_and_put)
+
+    def _put(self, key, value, generation, version):
+        nbytes = result_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        series = key[1:3]
+        with self._lock:
+            # A write landed while computing, so the result may already be stale
+            if self._generations.get(series, 0) != generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, nbytes, value, version)
+            self._series.setdefault(series, set()).add(key)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, symbol, interval, since=None):
+        """
+        Drop the cached results of (symbol, interval) whose range ends at or after `since`.
+        Indicator values only depend on earlier candles, so older ranges stay valid.
+        """
+        series = (symbol, interval)
+        with self._lock:
+            self._generations[series] = self._generations.get(series, 0) + 1
+            for key in list(self._series.get(series, ())):
+                if since is None or key[4] >= since:
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def on_candles_saved(self, symbol, interval, rows):
+        self.invalidate(symbol, interval, since=min(row[2] for row in rows))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._series.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'coalesced': self._flights.shared,
+            }
@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import select, insert
+from backend.config import Config
+from backend.database import engine, kline_coverage_table
+from backend.data.backfill import KLINES_PER_REQUEST, parse_klines, split_windows
+from backend.data.ingestion import fetch_kline_data
+from backend.data.processing import get_interval_milliseconds
+from backend.data.resample import bucket_open_times, bucket_close_times
+from backend.data.buffer import write_buffer
+from backend.data.storage import add_save_listener
+
+logger = logging.getLogger(__name__)
+
+class FillLocks:
+    """
+    One lock per (symbol, interval) held while filling its coverage. A caller that waited
+    re-reads what is missing once it holds the lock, so concurrent requests for overlapping
+    ranges (a chart panning or zooming) fetch the shared part once.
+    """
+
+    def __init__(self):
+        self.fills = 0
+        self.waits = 0
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, symbol, interval):
+        with self._guard:
+            lock = self._locks.setdefault((symbol, interval), threading.Lock())
+            self.fills += 1
+        if not lock.acquire(blocking=False):
+            with self._guard:
+                self.waits += 1
+            lock.acquire()
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def stats(self):
+        with self._guard:
+            return {'fills': self.fills, 'waits': self.waits, 'series': len(self._locks)}
+
+fill_locks = FillLocks()
+
+def _key_filter(symbol, interval):
+    return (kline_coverage_table.c.symbol == symbol) & (kline_coverage_table.c.interval == interval)
+
+def mark_covered(connection, symbol, interval, start_time, end_time):
+    """
+    Record [start_time, end_time) as stored, merging it with the ranges it overlaps or touches
+    """
+    if start_time >= end_time:
+        return
+    if connection.dialect.name == 'postgresql':
+        # Serialize merges per series; row locks can't cover ranges that don't exist yet
+        connection.exec_driver_sql("SELECT pg_advisory_xact_lock(hashtext(%s))", (f'{symbol}:{interval}',))
+    c = kline_coverage_table.c
+    overlapping = connection.execute(
+        select(c.start_time, c.end_time).where(
+            _key_filter(symbol, interval), c.start_time <= end_time, c.end_time >= start_time,
+        )
+    ).all()
+    if len(overlapping) == 1 and overlapping[0][0] <= start_time and overlapping[0][1] >= end_time:
+        return
+    if overlapping:
+        start_time = min(start_time, *(row[0] for row in overlapping))
+        end_time = max(end_time, *(row[1] for row in overlapping))
+        connection.execute(kline_coverage_table.delete().where(
+            _key_filter(symbol, interval), c.start_time.in_([row[0] for row in overlapping]),
+        ))
+    connection.execute(insert(kline_coverage_table).values(
+        symbol=symbol, interval=interval, start_time=start_time, end_time=end_time,
+    ))
+
+def covered_ranges(symbol, interval, start_time, end_time):
+    c = kline_coverage_table.c
+    stmt = select(c.start_time, c.end_time).where(
+        _key_filter(symbol, interval), c.start_time < end_time, c.end_time > start_time,
+    ).order_by(c.start_time)
+    with engine.connect() as connection:
+        return [tuple(row) for row in connection.execute(stmt)]
+
+def stored_symbols(interval):
+    """
+    Symbols with any stored `interval` candles, according to the coverage index
+    """
+    c = kline_coverage_table.c
+    stmt = select(c.symbol).where(c.interval == interval).distinct().order_by(c.symbol)
+    with engine.connect() as connection:
+        return list(connection.execute(stmt).scalars())
+
+def missing_ranges(symbol, interval, start_time, end_time, now_ms=None):
+    """
+    Return the [start, end) ranges of closed candles opening in [start_time, end_time] that
+    the coverage index doesn't know about. The forming candle is never reported missing.
+    """
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    first = int(bucket_open_times([start_time], interval)[0])
+    if first < start_time:
+        first = int(bucket_close_times([first], interval)[0]) + 1
+    last = int(bucket_open_times([end_time], interval)[0])
+    end = min(int(bucket_close_times([last], interval)[0]) + 1, int(bucket_open_times([now_ms], interval)[0]))
+    if first >= end:
+        return []
+
+    missing, cursor = [], first
+    for covered_start, covered_end in covered_ranges(symbol, interval, first, end):
+        if covered_start > cursor:
+            missing.append((cursor, covered_start))
+        cursor = max(cursor, covered_end)
+    if cursor < end:
+        missing.append((cursor, end))
+    return missing
+
+def fetch_missing_range(symbol, interval, start_time, end_time):
+    """
+    Fetch [start_time, end_time) from the exchange, store it, and mark it covered, including
+    stretches where the exchange has no candles so they aren't requested again
+    """
+    candles = 0
+    for window_start, window_end in split_windows(interval, start_time, end_time):
+        klines = parse_klines(fetch_kline_data(symbol, interval, window_start, window_end - 1, limit=KLINES_PER_REQUEST))
+        if klines and write_buffer.save(symbol, interval, klines) == 0:
+            raise RuntimeError("writer stored no rows")
+        candles += len(klines)
+    with engine.begin() as connection:
+        mark_covered(connection, symbol, interval, start_time, end_time)
+    return candles
+
+def ensure_coverage(symbol, interval, start_time, end_time):
+    """
+    Fetch only the parts of [start_time, end_time] that aren't stored yet. At most
+    COVERAGE_MAX_FILL candles are fetched per call, latest first, so an open-ended range
+    can't turn a read into a full history backfill. Fetch errors are logged and the read
+    goes ahead with what is stored. Returns the number of candles fetched.
+    """
+    if not missing_ranges(symbol, interval, start_time, end_time):
+        return 0
+    with fill_locks.hold(symbol, interval):
+        # Again under the lock: the fill this call waited for may have stored part of it
+        missing = missing_ranges(symbol, interval, start_time, end_time)
+        return _fill_ranges(symbol, interval, missing)
+
+def _fill_ranges(symbol, interval, missing):
+    budget = Config.COVERAGE_MAX_FILL * get_interval_milliseconds(interval)
+    fetched = 0
+    for gap_start, gap_end in reversed(missing):
+        if budget <= 0:
+            logger.warning(f"Not filling {symbol} {interval} before {gap_end}: over COVERAGE_MAX_FILL")
+            break
+        gap_start = max(gap_start, gap_end - budget)
+        budget -= gap_end - gap_start
+        try:
+            fetched += fetch_missing_range(symbol, interval, gap_start, gap_end)
+        except Exception as e:
+            logger.error(f"Error filling {symbol} {interval} [{gap_start}, {gap_end}): {e}")
+    return fetched
+
+def on_candles_saved(symbol, interval, rows):
+    """
+    Save listener marking each run of back-to-back closed candles in a write as covered
+    """
+    now = int(time.time() * 1000)
+    closed = sorted((row[2], row[8]) for row in rows if row[8] < now)
+    if not closed:
+        return
+    runs = [[closed[0][0], closed[0][1] + 1]]
+    for open_time, close_time in closed[1:]:
+        if open_time != runs[-1][1]:
+            runs.append([open_time, close_time + 1])
+        else:
+            runs[-1][1] = close_time + 1
+    with engine.begin() as connection:
+        for start_time, end_time in runs:
+            mark_covered(connection, symbol, interval, start_time, end_time)
+
+def register_coverage_updates():
+    add_save_listener(on_candles_saved)
@@ -0,0 +1,66 @@
+import math
+import numpy as np
+from backend.data.resample import aggregate_ohlcv
+
+def downsample_candles(columns, max_points):
+    """
+    Merge runs of consecutive candles so at most `max_points` remain. Each merged candle
+    keeps the first open, highest high, lowest low and last close of its run, so wicks
+    and gaps stay visible at any zoom level.
+    """
+    count = len(columns['openTime'])
+    if max_points is None or count <= max_points:
+        return columns
+    starts = np.arange(0, count, math.ceil(count / max_points))
+    return {
+        'openTime': columns['openTime'][starts],
+        **aggregate_ohlcv(columns, starts),
+        'closeTime': np.r_[columns['closeTime'][starts[1:] - 1], columns['closeTime'][-1]],
+    }
+
+def lttb_indices(x, y, threshold):
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets: always the first and last
+    point, and from each of threshold - 2 equal buckets in between the point forming the
+    largest triangle with the previously kept point and the next bucket's average.
+    """
+    count = len(x)
+    if threshold >= count:
+        return np.arange(count)
+    if threshold < 3:
+        return np.array([0, count - 1][:threshold], dtype=np.int64)
+
+    x = np.asarray(x, dtype=np.float64) - x[0]
+    y = np.asarray(y, dtype=np.float64)
+    # Bucket i covers [bounds[i], bounds[i + 1]); together they span every point but the ends
+    bounds = (np.arange(threshold - 1) * ((count - 2) / (threshold - 2))).astype(np.int64) + 1
+    bounds[-1] = count - 1
+    sizes = np.diff(bounds)
+    next_x = np.r_[np.add.reduceat(x[:count - 1], bounds[:-1])[1:] / sizes[1:], x[-1]]
+    next_y = np.r_[np.add.reduceat(y[:count - 1], bounds[:-1])[1:] / sizes[1:], y[-1]]
+
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, count - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = bounds[i], bounds[i + 1]
+        area = np.abs(
+            (x[previous] - next_x[i]) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y[i] - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        kept[i + 1] = previous
+    return kept
+
+def downsample_series(result, max_points, field):
+    """
+    Reduce an indicator result of column arrays to at most `max_points` rows with LTTB.
+    Points are chosen on `field` and the same rows are kept for every other column, so
+    e.g. MACD's signal and histogram stay aligned with its line. Leading NaNs (the warm-up
+    period) carry nothing to draw and are dropped first.
+    """
+    if max_points is None or len(result['timestamps']) <= max_points:
+        return result
+    valid = np.flatnonzero(np.isfinite(result[field]))
+    kept = valid[lttb_indices(result['timestamps'][valid], result[field][valid], max_points)]
+    return {name: values[kept] for name, values in result.items()}
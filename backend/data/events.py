@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from backend.config import Config
+from backend.data.storage import KLINE_FIELDS, add_save_listener
+
+logger = logging.getLogger(__name__)
+
+class Subscription:
+    """
+    Bounded mailbox of one subscriber to a (symbol, interval). When the subscriber falls
+    `maxsize` events behind, the oldest pending event is dropped and counted so a slow
+    consumer never blocks publishers or grows memory; the consumer learns about the gap
+    from take_dropped() and can re-read the range over REST.
+    """
+
+    def __init__(self, key, maxsize):
+        self.key = key
+        self.dropped = 0
+        self.closed = False
+        self._events = deque(maxlen=maxsize)
+        self._condition = threading.Condition()
+
+    def put(self, event):
+        with self._condition:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Next event, or None if none arrived within `timeout` seconds or the subscription closed
+        """
+        with self._condition:
+            if not self._events and not self.closed:
+                self._condition.wait(timeout)
+            return self._events.popleft() if self._events else None
+
+    def take_dropped(self):
+        with self._condition:
+            dropped, self.dropped = self.dropped, 0
+            return dropped
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def pending(self):
+        return len(self._events)
+
+class AsyncSubscription:
+    """
+    Subscription read from a coroutine on `loop`: events are handed to the loop and queued
+    on an asyncio.Queue, so a waiting subscriber holds no thread. Drops the oldest pending
+    event when `maxsize` behind, like Subscription.
+    """
+
+    def __init__(self, key, maxsize, loop):
+        self.key = key
+        self.dropped = 0
+        self.closed = False
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize)
+
+    def put(self, event):
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # the loop has closed; the subscriber is gone
+
+    def _put(self, event):
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """
+        Next event, or None if none arrived within `timeout` seconds
+        """
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def take_dropped(self):
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    def close(self):
+        self.closed = True
+
+    def pending(self):
+        return self._queue.qsize()
+
+class CandleHub:
+    """
+    In-process pub/sub of candle writes keyed by (symbol, interval). Publishing only appends
+    to each subscriber's bounded mailbox, so a save never waits on a consumer.
+    """
+
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or Config.EVENT_QUEUE_SIZE
+        self.published = 0
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, symbol, interval, loop=None):
+        """
+        Mailbox for (symbol, interval) events; an AsyncSubscription read on `loop` if given
+        """
+        if loop is None:
+            subscription = Subscription((symbol, interval), self.queue_size)
+        else:
+            subscription = AsyncSubscription((symbol, interval), self.queue_size, loop)
+        with self._lock:
+            self._subscriptions.setdefault(subscription.key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.key, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscriptions.pop(subscription.key, None)
+
+    def publish(self, symbol, interval, event):
+        with self._lock:
+            subscribers = list(self._subscriptions.get((symbol, interval), ()))
+        for subscription in subscribers:
+            subscription.put(event)
+        self.published += 1
+        return len(subscribers)
+
+    def on_candles_saved(self, symbol, interval, rows):
+        """
+        Save listener publishing a 'candles' event with the upserted candles as JSON-ready dicts
+        """
+        candles = [dict(zip(KLINE_FIELDS, row[2:])) for row in sorted(rows, key=lambda row: row[2])]
+        self.publish(symbol, interval, {'symbol': symbol, 'interval': interval, 'candles': candles})
+
+    def stats(self):
+        with self._lock:
+            subscriptions = [s for subscribers in self._subscriptions.values() for s in subscribers]
+        return {
+            'subscribers': len(subscriptions),
+            'published': self.published,
+            'pending': sum(s.pending() for s in subscriptions),
+        }
+
+hub = CandleHub()
+
+def register_event_publishing():
+    add_save_listener(hub.on_candles_saved)
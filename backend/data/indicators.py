@@ -0,0 +1,324 @@
+import json
+import logging
+import math
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, delete
+from backend.database import engine, indicator_state_table, indicator_values_table, upsert_statement
+from backend.data.storage import MAX_OPEN_TIME, get_kline_columns, add_save_listener
+from backend.metrics import span
+
+logger = logging.getLogger(__name__)
+
+VALUE_COLUMNS = ('value1', 'value2', 'value3')
+# Trailing candles that may still be revised by a later save (the forming candle and the one
+# before it). State is kept from before them so a revision is replayed instead of compounded.
+REVISABLE_CANDLES = 2
+
+def compute_macd(close, fast=12, slow=26, signal=9):
+    close = pd.Series(close, copy=False)
+    exp1 = close.ewm(span=fast, adjust=False).mean()
+    exp2 = close.ewm(span=slow, adjust=False).mean()
+    macd = exp1 - exp2
+    signal_line = macd.ewm(span=signal, adjust=False).mean()
+    histogram = macd - signal_line
+    return macd.to_numpy(), signal_line.to_numpy(), histogram.to_numpy()
+
+def compute_rsi(close, periods=14, ema=True):
+    close_delta = pd.Series(close, copy=False).diff()
+
+    # Same values as close_delta.clip(lower=0) and -1 * clip(upper=0), NaN and -0.0
+    # included, without pandas' per-call overhead on short series
+    delta = close_delta.to_numpy()
+    up = pd.Series(np.where(delta < 0, 0., delta), copy=False)
+    down = pd.Series(-1 * np.where(delta > 0, 0., delta), copy=False)
+
+    if ema:
+        ma_up = up.ewm(com=periods-1, adjust=True, min_periods=periods).mean()
+        ma_down = down.ewm(com=periods-1, adjust=True, min_periods=periods).mean()
+    else:
+        ma_up = up.rolling(window=periods).mean()
+        ma_down = down.rolling(window=periods).mean()
+
+    rsi = ma_up / ma_down
+    rsi = 100 - (100 / (1 + rsi))
+    return rsi.to_numpy()
+
+class EWM:
+    """
+    Streaming form of pandas' ewm(com=..., adjust=..., min_periods=...).mean(), performing
+    the same floating point operations in the same order so every output is bit-identical.
+    """
+
+    def __init__(self, com, adjust, min_periods=0):
+        self.alpha = 1. / (1. + com)
+        self.adjust = adjust
+        self.min_periods = max(int(min_periods), 1)
+        self.weighted = math.nan
+        self.old_wt = 1.
+        self.nobs = 0
+
+    def update(self, cur):
+        is_observation = cur == cur
+        self.nobs += is_observation
+        if self.weighted == self.weighted:
+            self.old_wt *= 1. - self.alpha
+            if is_observation:
+                new_wt = 1. if self.adjust else self.alpha
+                # Same guard as pandas against numerical drift on constant series
+                if self.weighted != cur:
+                    self.weighted = (self.old_wt * self.weighted + new_wt * cur) / (self.old_wt + new_wt)
+                if self.adjust:
+                    self.old_wt += new_wt
+                else:
+                    self.old_wt = 1.
+        elif is_observation:
+            self.weighted = cur
+        return self.weighted if self.nobs >= self.min_periods else math.nan
+
+    def seed(self, values, weighted):
+        """
+        Set the state reached after `values` (NaNs allowed only before the first observation),
+        given `weighted`, the unmasked pandas output for the last value
+        """
+        observations = int(np.count_nonzero(~np.isnan(values)))
+        self.nobs = observations
+        self.weighted = float(weighted) if observations else math.nan
+        self.old_wt = 1.
+        if self.adjust:
+            factor = 1. - self.alpha
+            for _ in range(observations - 1):
+                old_wt = self.old_wt * factor
+                old_wt += 1.
+                if old_wt == self.old_wt:  # reached its fixed point
+                    break
+                self.old_wt = old_wt
+
+    def snapshot(self):
+        return [self.weighted, self.old_wt, self.nobs]
+
+    def restore(self, snapshot):
+        self.weighted, self.old_wt, self.nobs = snapshot
+
+class MACD:
+    name = 'macd'
+    fields = ('macd', 'signal', 'histogram')
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.params = (fast, slow, signal)
+        # pandas turns span into com = (span - 1) / 2 before deriving alpha
+        self.fast = EWM((fast - 1) / 2, adjust=False)
+        self.slow = EWM((slow - 1) / 2, adjust=False)
+        self.signal = EWM((signal - 1) / 2, adjust=False)
+
+    def update(self, close):
+        macd = self.fast.update(close) - self.slow.update(close)
+        signal = self.signal.update(macd)
+        return macd, signal, macd - signal
+
+    def seed(self, closes):
+        close = pd.Series(closes, copy=False)
+        exp1 = close.ewm(span=self.params[0], adjust=False).mean()
+        exp2 = close.ewm(span=self.params[1], adjust=False).mean()
+        macd = exp1 - exp2
+        signal_line = macd.ewm(span=self.params[2], adjust=False).mean()
+        if len(close):
+            self.fast.seed(closes, exp1.iloc[-1])
+            self.slow.seed(closes, exp2.iloc[-1])
+            self.signal.seed(macd.to_numpy(), signal_line.iloc[-1])
+        return macd.to_numpy(), signal_line.to_numpy(), (macd - signal_line).to_numpy()
+
+    def snapshot(self):
+        return [self.fast.snapshot(), self.slow.snapshot(), self.signal.snapshot()]
+
+    def restore(self, snapshot):
+        for ewm, state in zip((self.fast, self.slow, self.signal), snapshot):
+            ewm.restore(state)
+
+class RSI:
+    name = 'rsi'
+    fields = ('rsi',)
+
+    def __init__(self, periods=14):
+        self.params = (periods,)
+        self.up = EWM(periods - 1, adjust=True, min_periods=periods)
+        self.down = EWM(periods - 1, adjust=True, min_periods=periods)
+        self.prev_close = math.nan
+
+    def update(self, close):
+        delta = close - self.prev_close
+        self.prev_close = close
+        # Mirrors clip(lower=0) / -1 * clip(upper=0), including NaN and -0.0 results
+        ma_up = self.up.update(0. if delta < 0 else delta)
+        ma_down = self.down.update(-1 * (0. if delta > 0 else delta))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rs = np.float64(ma_up) / np.float64(ma_down)
+            return (100 - (100 / (1 + rs)),)
+
+    def seed(self, closes):
+        rsi = compute_rsi(closes, self.params[0])
+        if len(closes):
+            delta = pd.Series(closes, copy=False).diff()
+            for ewm, moves in ((self.up, delta.clip(lower=0)), (self.down, -1 * delta.clip(upper=0))):
+                weighted = moves.ewm(com=self.params[0] - 1, adjust=True).mean().iloc[-1]
+                ewm.seed(moves.to_numpy(), weighted)
+            self.prev_close = float(closes[-1])
+        return (rsi,)
+
+    def snapshot(self):
+        return [self.up.snapshot(), self.down.snapshot(), self.prev_close]
+
+    def restore(self, snapshot):
+        self.up.restore(snapshot[0])
+        self.down.restore(snapshot[1])
+        self.prev_close = snapshot[2]
+
+INDICATORS = {indicator.name: indicator for indicator in (MACD, RSI)}
+
+def _params_key(indicator):
+    return ','.join(map(str, indicator.params))
+
+def _key_filter(table, indicator, symbol, interval):
+    return (
+        (table.c.indicator == indicator.name)
+        & (table.c.symbol == symbol)
+        & (table.c.interval == interval)
+        & (table.c.params == _params_key(indicator))
+    )
+
+def _write_values(connection, indicator, symbol, interval, open_times, outputs):
+    rows = [
+        {
+            'indicator': indicator.name,
+            'symbol': symbol,
+            'interval': interval,
+            'params': _params_key(indicator),
+            'open_time': int(open_time),
+            **{column: None if math.isnan(value) else float(value) for column, value in zip(VALUE_COLUMNS, values)},
+        }
+        for open_time, *values in zip(open_times, *outputs)
+    ]
+    if rows:
+        connection.execute(upsert_statement(connection.dialect.name, indicator_values_table), rows)
+
+def _save_state(connection, indicator, symbol, interval, base, tail):
+    connection.execute(upsert_statement(connection.dialect.name, indicator_state_table), [{
+        'indicator': indicator.name,
+        'symbol': symbol,
+        'interval': interval,
+        'params': _params_key(indicator),
+        'state': json.dumps({'base': base, 'tail': tail}),
+    }])
+
+def _load_state(connection, indicator, symbol, interval):
+    stmt = select(indicator_state_table.c.state).where(
+        _key_filter(indicator_state_table, indicator, symbol, interval)
+    ).with_for_update()
+    state = connection.execute(stmt).scalar()
+    return json.loads(state) if state is not None else None
+
+def _drop_state(connection, indicator, symbol, interval):
+    for table in (indicator_state_table, indicator_values_table):
+        connection.execute(delete(table).where(_key_filter(table, indicator, symbol, interval)))
+
+def _seed(connection, indicator, symbol, interval):
+    columns = get_kline_columns(symbol, interval, 0, MAX_OPEN_TIME)
+    open_times, closes = columns['openTime'], columns['close']
+    if not len(closes):
+        return
+    split = max(len(closes) - REVISABLE_CANDLES, 0)
+
+    with span('compute', indicator.name) as timing:
+        timing.rows = len(closes)
+        head_outputs = indicator.seed(closes[:split])
+        base = indicator.snapshot()
+        tail = [[int(t), float(c)] for t, c in zip(open_times[split:], closes[split:])]
+        tail_outputs = zip(*(indicator.update(close) for _, close in tail))
+        outputs = [np.concatenate([head, np.asarray(rest, dtype=np.float64)]) for head, rest in zip(head_outputs, tail_outputs)]
+    _write_values(connection, indicator, symbol, interval, open_times, outputs)
+    _save_state(connection, indicator, symbol, interval, base, tail)
+    logger.info(f"Seeded {indicator.name}({_params_key(indicator)}) for {symbol} {interval} from {len(closes)} candles")
+
+def _catch_up(connection, indicator, symbol, interval, state):
+    """
+    Apply the candles stored since the start of the state's revisable tail. Those are merged
+    into the tail and replayed from its base snapshot, so a revised forming candle replaces
+    its earlier value instead of being applied twice.
+    """
+    tail = {t: c for t, c in state['tail']}
+    columns = get_kline_columns(symbol, interval, state['tail'][0][0], MAX_OPEN_TIME)
+    for open_time, close in zip(columns['openTime'].tolist(), columns['close'].tolist()):
+        tail[open_time] = close
+    if len(tail) == len(state['tail']) and all(tail[t] == c for t, c in state['tail']):
+        return
+
+    with span('compute', indicator.name) as timing:
+        indicator.restore(state['base'])
+        open_times = sorted(tail)
+        timing.rows = len(open_times)
+        base = state['base']
+        outputs = []
+        for i, open_time in enumerate(open_times):
+            if i == len(open_times) - REVISABLE_CANDLES:
+                base = indicator.snapshot()
+            outputs.append(indicator.update(tail[open_time]))
+
+    _write_values(connection, indicator, symbol, interval, open_times, list(zip(*outputs)))
+    new_tail = [[t, tail[t]] for t in open_times[-REVISABLE_CANDLES:]]
+    _save_state(connection, indicator, symbol, interval, base, new_tail)
+
+def get_indicator_series(indicator, symbol, interval, start_time, end_time):
+    """
+    Serve [start_time, end_time] of an indicator from its precomputed series. The first
+    request for a (symbol, interval, params) seeds it from every stored candle; later ones
+    only apply candles stored since the state was last advanced.
+    Returns column arrays keyed by the indicator's fields plus 'timestamps'.
+    """
+    with engine.begin() as connection:
+        state = _load_state(connection, indicator, symbol, interval)
+        if state is None:
+            _seed(connection, indicator, symbol, interval)
+        else:
+            _catch_up(connection, indicator, symbol, interval, state)
+
+        stmt = select(
+            indicator_values_table.c.open_time,
+            *(indicator_values_table.c[column] for column in VALUE_COLUMNS[:len(indicator.fields)]),
+        ).where(
+            _key_filter(indicator_values_table, indicator, symbol, interval),
+            indicator_values_table.c.open_time >= start_time,
+            indicator_values_table.c.open_time <= end_time,
+        ).order_by(indicator_values_table.c.open_time)
+        with span('query', 'indicator_values') as timing:
+            rows = connection.execute(stmt).all()
+            timing.rows = len(rows)
+
+    values = list(zip(*rows)) or [[] for _ in range(len(indicator.fields) + 1)]
+    series = {'timestamps': np.asarray(values[0], dtype=np.int64)}
+    for field, column in zip(indicator.fields, values[1:]):
+        series[field] = np.asarray(column, dtype=np.float64)
+    return series
+
+def on_candles_saved(symbol, interval, rows):
+    """
+    Save listener advancing every stored indicator state of (symbol, interval), so reads find
+    the series already up to date. A write older than a state's revisable tail rewrites
+    history, so that state is dropped and re-seeded on its next read.
+    """
+    first_saved = min(row[2] for row in rows)
+    with engine.begin() as connection:
+        stmt = select(indicator_state_table.c.indicator, indicator_state_table.c.params).where(
+            (indicator_state_table.c.symbol == symbol) & (indicator_state_table.c.interval == interval)
+        )
+        for name, params in connection.execute(stmt).all():
+            indicator = INDICATORS[name](*map(int, params.split(',')))
+            state = _load_state(connection, indicator, symbol, interval)
+            if state is None:
+                continue
+            if first_saved < state['tail'][0][0]:
+                _drop_state(connection, indicator, symbol, interval)
+            else:
+                _catch_up(connection, indicator, symbol, interval, state)
+
+def register_indicator_updates():
+    add_save_listener(on_candles_saved)
@@ -0,0 +1,94 @@
+import logging
+import re
+import numpy as np
+import pandas as pd
+from backend.data.processing import INTERVAL_MILLISECONDS
+from backend.data.resample import bucket_open_times, bucket_close_times
+from backend.data.storage import KLINE_FIELDS, KLINE_DTYPES
+
+logger = logging.getLogger(__name__)
+
+# kline_data.symbol is a String(10)
+SYMBOL_PATTERN = re.compile(r'^[A-Z0-9]{1,10}$')
+
+class InvalidCandles(ValueError):
+    """
+    A batch failing validation; `problems` lists each failed check with the number of
+    candles failing it and the index of the first one within its (symbol, interval)
+    """
+
+    def __init__(self, message, problems=()):
+        super().__init__(message)
+        self.problems = list(problems)
+
+def group_candles(frame, symbol=None, interval=None):
+    """
+    Split a decoded ingest body (see formats.decode_candles) into (symbol, interval, columns)
+    batches in the order they first appear, each field as a float64 array for
+    validate_candles. `symbol` and `interval` fill in for rows that don't name their own.
+    """
+    if not len(frame):
+        raise InvalidCandles("No candles given")
+    frame = frame.copy(deep=False)
+    for key, default in (('symbol', symbol), ('interval', interval)):
+        if key not in frame:
+            frame[key] = default
+        elif default is not None:
+            frame[key] = frame[key].fillna(default)
+        if frame[key].isna().any():
+            raise InvalidCandles(f"Candles without a {key}: pass ?{key}= or a {key} field")
+    missing = [field for field in KLINE_FIELDS if field not in frame]
+    if missing:
+        raise InvalidCandles(f"Missing candle fields: {', '.join(missing)}")
+
+    batches = []
+    for (batch_symbol, batch_interval), group in frame.groupby(['symbol', 'interval'], sort=False):
+        columns = {field: _float_column(group[field]) for field in KLINE_FIELDS}
+        batches.append((str(batch_symbol), str(batch_interval), columns))
+    return batches
+
+def _float_column(values):
+    try:
+        # Binance sends prices as strings; astype parses them exactly, like float()
+        return values.to_numpy().astype(np.float64)
+    except (TypeError, ValueError):
+        # Anything that isn't a number becomes NaN and fails the 'finite' check
+        return pd.to_numeric(values, errors='coerce').to_numpy(np.float64)
+
+def validate_candles(symbol, interval, columns):
+    """
+    Vectorized checks of one batch's float64 columns; returns the failures as problem dicts
+    (empty when the batch is valid) and the columns with int64 open and close times
+    """
+    problems = []
+
+    def check(name, failed):
+        failed = np.flatnonzero(failed)
+        if len(failed):
+            problems.append({'symbol': symbol, 'interval': interval, 'check': name,
+                             'count': len(failed), 'firstIndex': int(failed[0])})
+
+    if not SYMBOL_PATTERN.match(symbol):
+        problems.append({'symbol': symbol, 'interval': interval, 'check': 'symbol'})
+    if interval not in INTERVAL_MILLISECONDS:
+        problems.append({'symbol': symbol, 'interval': interval, 'check': 'interval'})
+    if problems:
+        return problems, columns
+
+    matrix = np.vstack([columns[field] for field in KLINE_FIELDS])
+    check('finite', ~np.isfinite(matrix).all(axis=0))
+    if problems:
+        return problems, columns
+    open_, high, low, close, volume = (columns[field] for field in ('open', 'high', 'low', 'close', 'volume'))
+    # Millisecond timestamps are exact in float64, so a fractional part means a bad value
+    check('integerTimes', (columns['openTime'] % 1 != 0) | (columns['closeTime'] % 1 != 0))
+    typed = {field: values.astype(KLINE_DTYPES.get(field, np.float64)) for field, values in columns.items()}
+    open_times = typed['openTime']
+    check('monotonic', np.r_[False, open_times[1:] <= open_times[:-1]])
+    check('aligned', open_times != bucket_open_times(open_times, interval))
+    check('closeTime', typed['closeTime'] != bucket_close_times(open_times, interval))
+    check('high', high < np.maximum(open_, close))
+    check('low', low > np.minimum(open_, close))
+    check('positive', low <= 0)
+    check('volume', volume < 0)
+    return problems, typed
@@ -1,7 +1,8 @@
 import requests
 from backend.config import BINANCE_API_URL, BINANCE_API_KEY, BINANCE_API_SECRET
+from backend.metrics import span
 
-def fetch_kline_data(symbol, interval, start_time, end_time):
+def fetch_kline_data(symbol, interval, start_time, end_time, limit=None):
     endpoint = f"{BINANCE_API_URL}/api/v3/klines"
     params = {
         "symbol": symbol,
@@ -9,10 +10,15 @@ def fetch_kline_data(symbol, interval, start_time, end_time):
         "startTime": start_time,
         "endTime": end_time
     }
+    if limit:
+        params["limit"] = limit
     headers = {
         "X-MBX-APIKEY": BINANCE_API_KEY
     }
     
-    response = requests.get(endpoint, params=params, headers=headers)
-    response.raise_for_status()
-    return response.json()
\ No newline at end of file
+    with span('fetch', 'binance') as timing:
+        response = requests.get(endpoint, params=params, headers=headers)
+        response.raise_for_status()
+        klines = response.json()
+        timing.rows, timing.nbytes = len(klines), len(response.content)
+    return klines
@@ -0,0 +1,19 @@
+from backend.data.indicators import register_indicator_updates
+from backend.data.resample import register_rollups
+from backend.data.events import register_event_publishing
+from backend.data.coverage import register_coverage_updates
+
+def register_save_listeners():
+    """
+    Install every save listener, so stored candles keep their indicator state, rollups and
+    coverage current whichever entry point wrote them: create_app and the CLI tools
+    """
+    # Keep precomputed indicator series advancing as candles are stored
+    register_indicator_updates()
+    # Derive higher intervals from stored 1m candles as they arrive
+    register_rollups()
+    # Record which ranges are stored so reads only fetch what is missing
+    register_coverage_updates()
+    # Push stored candles to /api/stream subscribers; registered last so indicator state is
+    # already advanced when an event is sent
+    register_event_publishing()
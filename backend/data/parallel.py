@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from backend.data.storage import KLINE_FIELDS, KLINE_DTYPES, get_universe_columns
+
+class Universe:
+    """
+    Candles of many symbols packed into one memory-mapped .npy file (on /dev/shm where it
+    exists), so pool workers map the same pages instead of receiving pickled copies.
+    Symbol i owns columns offsets[i]:offsets[i + 1] of the (field, row) matrix.
+    """
+
+    def __init__(self, symbols, offsets, columns):
+        self.symbols = list(symbols)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        handle, self.path = tempfile.mkstemp(suffix='.npy', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+        os.close(handle)
+        shape = (len(KLINE_FIELDS), int(self.offsets[-1]))
+        matrix = np.lib.format.open_memmap(self.path, mode='w+', dtype=np.float64, shape=shape)
+        for i, field in enumerate(KLINE_FIELDS):
+            matrix[i] = columns[field]
+        matrix.flush()
+        del matrix
+
+    @classmethod
+    def load(cls, symbols, interval, start_time, end_time):
+        return cls(*get_universe_columns(symbols, interval, start_time, end_time))
+
+    @classmethod
+    def from_columns(cls, symbol, columns):
+        return cls([symbol], [0, len(columns['openTime'])], columns)
+
+    def close(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def map_universe(path):
+    # Read-only mapping of a Universe file; pages are shared with every other process mapping it
+    return np.load(path, mmap_mode='r')
+
+def universe_columns(matrix, start, end):
+    """
+    Column arrays like get_kline_columns for rows start:end of a mapped Universe. Prices
+    are views of the mapping; timestamps are converted back to int64.
+    """
+    return {
+        field: np.asarray(matrix[i, start:end], dtype=KLINE_DTYPES.get(field, np.float64))
+        for i, field in enumerate(KLINE_FIELDS)
+    }
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+# Modules the pool's tasks live in, imported once by the fork server rather than by each worker
+POOL_PRELOAD = ['backend.data.screener', 'backend.data.backtest']
+
+def pool_context():
+    """
+    Start method of the pool's workers. Forking this process would copy locks held by its
+    threads (the write buffer, the scheduler loop, database pool users, logging) into
+    workers that can then never take them; a fork server is a clean single-threaded parent.
+    Spawn where there is no fork server.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(POOL_PRELOAD)
+    return context
+
+def get_pool(workers):
+    """
+    Process pool kept across screener scans and backtest sweeps, so requests don't pay
+    for starting workers
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool, _pool_workers = ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()), workers
+        return _pool
@@ -1,8 +1,17 @@
 import pandas as pd
 import numpy as np
 from backend.data.ingestion import fetch_kline_data
-from backend.data.storage import save_kline_data, get_kline_data
-from functools import lru_cache
+from backend.config import Config
+from backend.data.buffer import write_buffer
+from backend.data.storage import get_kline_columns, add_save_listener, series_version
+from backend.data.indicators import MACD, RSI, compute_rsi, get_indicator_series
+from backend.data.cache import IndicatorCache
+from backend.metrics import span
+
+indicator_cache = IndicatorCache(Config.INDICATOR_CACHE_BYTES, Config.INDICATOR_CACHE_TTL)
+# Drops entries as soon as this process saves candles; writes by other processes are caught
+# by the series version each lookup passes
+add_save_listener(indicator_cache.on_candles_saved)
 
 def fetch_and_store_kline_data(symbol, interval, limit):
     # Fetch the latest data point
@@ -24,89 +33,85 @@ def fetch_and_store_kline_data(symbol, interval, limit):
             }
             for item in data
         ]
-        save_kline_data(symbol, interval, formatted_data)
+        write_buffer.save(symbol, interval, formatted_data)
     return data
 
+# Length of each supported candle interval; '1M' is nominal, months are bucketed by date
+INTERVAL_MILLISECONDS = {
+    '1m': 60000,
+    '3m': 180000,
+    '5m': 300000,
+    '15m': 900000,
+    '30m': 1800000,
+    '1h': 3600000,
+    '2h': 7200000,
+    '4h': 14400000,
+    '6h': 21600000,
+    '8h': 28800000,
+    '12h': 43200000,
+    '1d': 86400000,
+    '3d': 259200000,
+    '1w': 604800000,
+    '1M': 2592000000,
+}
+
 def get_interval_milliseconds(interval):
-    interval_map = {
-        '1m': 60000,
-        '3m': 180000,
-        '5m': 300000,
-        '15m': 900000,
-        '30m': 1800000,
-        '1h': 3600000,
-        '2h': 7200000,
-        '4h': 14400000,
-        '6h': 21600000,
-        '8h': 28800000,
-        '12h': 43200000,
-        '1d': 86400000,
-        '3d': 259200000,
-        '1w': 604800000,
-        '1M': 2592000000,
-    }
-    return interval_map.get(interval, 3600000)  # Default to 1h if interval not found
+    return INTERVAL_MILLISECONDS.get(interval, 3600000)  # Default to 1h if interval not found
 
-def process_kline_data(symbol, start_time, end_time, interval):
-    data = fetch_kline_data(symbol, interval, start_time, end_time)
-    df = pd.DataFrame(data, columns=['openTime', 'open', 'high', 'low', 'close', 'volume', 'closeTime'])
-    df['close'] = df['close'].astype(float)
-    save_kline_data(symbol, interval, df.to_dict('records'))
-    return df.to_dict('records')
+# Weekly candles open on Monday 00:00 UTC, four days after the epoch
+CANDLE_OFFSETS = {'1w': 4 * 86400000}
+
+def normalize_candle_range(interval, start_time, end_time):
+    """
+    Snap [start_time, end_time] inward to the open times of the first and last candles it
+    selects, so requests differing only within a candle share a cache entry. Monthly
+    candles have no fixed length and are left as requested.
+    """
+    if interval == '1M':
+        return start_time, end_time
+    step = get_interval_milliseconds(interval)
+    offset = CANDLE_OFFSETS.get(interval, 0)
+    start = -((offset - start_time) // step) * step + offset
+    end = (end_time - offset) // step * step + offset
+    return start, end
 
-@lru_cache(maxsize=100)
 def get_macd(symbol, interval, start_time, end_time, fast=12, slow=26, signal=9):
-    data = get_kline_data(symbol, interval, start_time, end_time)
-    if not data:
+    start_time, end_time = normalize_candle_range(interval, start_time, end_time)
+    return indicator_cache.get_or_compute(
+        ('macd', symbol, interval, start_time, end_time, fast, slow, signal),
+        lambda: _compute_macd(symbol, interval, start_time, end_time, fast, slow, signal),
+        series_version(symbol, interval, 0, end_time),
+    )
+
+def _compute_macd(symbol, interval, start_time, end_time, fast, slow, signal):
+    series = get_indicator_series(MACD(fast, slow, signal), symbol, interval, start_time, end_time)
+    if not len(series['timestamps']):
         return None
-    
-    df = pd.DataFrame(data)
-    df['close'] = df['close'].astype(float)
-    df['openTime'] = pd.to_datetime(df['openTime'], unit='ms')
-    df.set_index('openTime', inplace=True)
-    
-    # Calculate MACD
-    exp1 = df['close'].ewm(span=fast, adjust=False).mean()
-    exp2 = df['close'].ewm(span=slow, adjust=False).mean()
-    macd = exp1 - exp2
-    signal_line = macd.ewm(span=signal, adjust=False).mean()
-    histogram = macd - signal_line
-    
-    return {
-        'macd': macd.tolist(),
-        'signal': signal_line.tolist(),
-        'histogram': histogram.tolist(),
-        'timestamps': df.index.astype(int) // 10**6  # Convert to milliseconds
-    }
+    return series
 
-@lru_cache(maxsize=100)
 def get_rsi(symbol, interval, start_time, end_time, periods=14, ema=True):
-    data = get_kline_data(symbol, interval, start_time, end_time)
-    if not data:
-        return None
-    
-    df = pd.DataFrame(data)
-    df['close'] = df['close'].astype(float)
-    df['openTime'] = pd.to_datetime(df['openTime'], unit='ms')
-    df.set_index('openTime', inplace=True)
-    
-    # Calculate RSI
-    close_delta = df['close'].diff()
-    
-    up = close_delta.clip(lower=0)
-    down = -1 * close_delta.clip(upper=0)
-    
+    start_time, end_time = normalize_candle_range(interval, start_time, end_time)
+    return indicator_cache.get_or_compute(
+        ('rsi', symbol, interval, start_time, end_time, periods, ema),
+        lambda: _compute_rsi(symbol, interval, start_time, end_time, periods, ema),
+        series_version(symbol, interval, 0, end_time),
+    )
+
+def _compute_rsi(symbol, interval, start_time, end_time, periods, ema):
     if ema:
-        ma_up = up.ewm(com=periods-1, adjust=True, min_periods=periods).mean()
-        ma_down = down.ewm(com=periods-1, adjust=True, min_periods=periods).mean()
-    else:
-        ma_up = up.rolling(window=periods).mean()
-        ma_down = down.rolling(window=periods).mean()
-        
-    rsi = ma_up / ma_down
-    rsi = 100 - (100 / (1 + rsi))
-    
+        series = get_indicator_series(RSI(periods), symbol, interval, start_time, end_time)
+        if not len(series['timestamps']):
+            return None
+        return series
+
+    # The rolling-mean variant has no incremental state and is computed over the range
+    columns = get_kline_columns(symbol, interval, start_time, end_time)
+    if not len(columns['openTime']):
+        return None
+    with span('compute', 'rsi') as timing:
+        timing.rows = len(columns['close'])
+        rsi = compute_rsi(columns['close'], periods, ema=False)
     return {
-        'rsi': rsi.tolist(),
-        'timestamps': df.index.astype(int) // 10**6  # Convert to milliseconds
-    }
\ No newline at end of file
+        'rsi': rsi,
+        'timestamps': columns['openTime']
+    }
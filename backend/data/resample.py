@@ -0,0 +1,178 @@
+import argparse
+import logging
+import threading
+import numpy as np
+from backend.config import Config
+from backend.database import get_partition_bounds, partition_suffixes
+from backend.data.processing import get_interval_milliseconds, CANDLE_OFFSETS
+from backend.data.storage import (
+    MAX_OPEN_TIME, get_kline_columns, save_kline_data, columns_to_records, add_save_listener, stored_bounds,
+)
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400000
+
+def bucket_open_times(open_times, interval):
+    """
+    Open time of the `interval` candle containing each millisecond timestamp
+    """
+    open_times = np.asarray(open_times, dtype=np.int64)
+    if interval == '1M':
+        months = open_times.astype('datetime64[ms]').astype('datetime64[M]')
+        return months.astype('datetime64[ms]').astype(np.int64)
+    step = get_interval_milliseconds(interval)
+    offset = CANDLE_OFFSETS.get(interval, 0)
+    return (open_times - offset) // step * step + offset
+
+def bucket_close_times(bucket_opens, interval):
+    bucket_opens = np.asarray(bucket_opens, dtype=np.int64)
+    if interval == '1M':
+        months = bucket_opens.astype('datetime64[ms]').astype('datetime64[M]') + 1
+        return months.astype('datetime64[ms]').astype(np.int64) - 1
+    return bucket_opens + get_interval_milliseconds(interval) - 1
+
+def resample_columns(columns, interval):
+    """
+    Aggregate ordered candle columns (as returned by get_kline_columns) into `interval`
+    candles: first open, max high, min low, last close, summed volume.
+    """
+    open_times = columns['openTime']
+    buckets = bucket_open_times(open_times, interval)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]]) if len(buckets) else np.empty(0, dtype=np.int64)
+    if not len(starts):
+        return {name: values[:0] for name, values in columns.items()}
+    return {
+        'openTime': buckets[starts],
+        **aggregate_ohlcv(columns, starts),
+        'closeTime': bucket_close_times(buckets[starts], interval),
+    }
+
+def aggregate_ohlcv(columns, starts):
+    """
+    OHLCV of the groups of consecutive candles beginning at each index in `starts`
+    """
+    ends = np.r_[starts[1:], len(columns['close'])]
+    return {
+        'open': columns['open'][starts],
+        'high': np.maximum.reduceat(columns['high'], starts),
+        'low': np.minimum.reduceat(columns['low'], starts),
+        'close': columns['close'][ends - 1],
+        'volume': np.add.reduceat(columns['volume'], starts),
+    }
+
+def _divides(source, target):
+    # Whether every `target` bucket is an exact union of `source` buckets
+    source_step = get_interval_milliseconds(source)
+    if source == '1M':
+        return target == '1M'
+    if target == '1M':
+        return DAY % source_step == 0
+    target_step = get_interval_milliseconds(target)
+    offset = CANDLE_OFFSETS.get(target, 0) - CANDLE_OFFSETS.get(source, 0)
+    return target_step % source_step == 0 and offset % source_step == 0
+
+def _source_counts(candles, source):
+    # Number of `source` candles making up each complete candle of `candles`
+    if source == '1M':
+        return np.ones(len(candles['openTime']), dtype=np.int64)
+    return (candles['closeTime'] - candles['openTime'] + 1) // get_interval_milliseconds(source)
+
+def rollup_sources(intervals=None, base_interval=None):
+    """
+    Map each rollup interval to the interval it is aggregated from: the largest of the base
+    interval and the other rollups that tiles it exactly, so 1d is built from 4h rather
+    than from 1440 one-minute candles.
+    """
+    intervals = Config.ROLLUP_INTERVALS if intervals is None else intervals
+    base_interval = base_interval or Config.ROLLUP_BASE_INTERVAL
+    # '1M' has no fixed length; rank it after every fixed interval
+    by_length = sorted(intervals, key=lambda i: (i == '1M', get_interval_milliseconds(i)))
+    sources = {}
+    for target in by_length:
+        if target == base_interval:
+            continue
+        candidates = [c for c in [base_interval, *sources] if _divides(c, target)]
+        if not candidates:
+            logger.warning(f"Interval {target} can't be built from {base_interval} candles, skipping")
+            continue
+        sources[target] = max(candidates, key=lambda i: (i == '1M', get_interval_milliseconds(i)))
+    return sources
+
+def rollup_range(symbol, source, target, start_time, end_time):
+    """
+    Recompute the `target` candles whose buckets contain open times start_time..end_time from
+    the stored `source` candles. Only the forming bucket, the one holding the newest stored
+    source candle, may be built from part of its candles; any other bucket missing a source
+    candle (history starting mid-bucket, a gap not yet backfilled) is skipped rather than
+    stored with a wrong open or volume. Returns the number of candles written.
+    """
+    first_bucket = bucket_open_times([start_time], target)[0]
+    last_close = bucket_close_times(bucket_open_times([end_time], target), target)[0]
+    columns = get_kline_columns(symbol, source, int(first_bucket), int(last_close))
+    candles = resample_columns(columns, target)
+    buckets = bucket_open_times(columns['openTime'], target)
+    counts = np.diff(np.r_[np.searchsorted(buckets, candles['openTime']), len(buckets)])
+    complete = counts == _source_counts(candles, source)
+    if len(complete) and not complete[-1] and stored_bounds(symbol, source, int(last_close) + 1, MAX_OPEN_TIME)[0] is None:
+        # Nothing is stored after the last bucket, so it is forming and only needs its first candle
+        complete[-1] = columns['openTime'][-counts[-1]] == candles['openTime'][-1]
+    if not complete.all():
+        candles = {name: values[complete] for name, values in candles.items()}
+    if not len(candles['openTime']):
+        return 0
+    return save_kline_data(symbol, target, columns_to_records(candles))
+
+# Serializes recomputing the rollups of one (symbol, source) so a result read before a
+# concurrent write can't be stored after the result that includes it
+_rollup_locks = {}
+_rollup_locks_guard = threading.Lock()
+
+def _rollup_lock(symbol, source):
+    with _rollup_locks_guard:
+        return _rollup_locks.setdefault((symbol, source), threading.Lock())
+
+def on_candles_saved(symbol, interval, rows):
+    """
+    Save listener keeping rollups current. Saving a rollup notifies the listeners again, so
+    a new 1m candle ripples up through 5m, 15m, 1h and so on.
+    """
+    targets = [target for target, source in rollup_sources().items() if source == interval]
+    if not targets:
+        return
+    open_times = [row[2] for row in rows]
+    with _rollup_lock(symbol, interval):
+        for target in targets:
+            rollup_range(symbol, interval, target, min(open_times), max(open_times))
+
+def register_rollups():
+    add_save_listener(on_candles_saved)
+
+def materialize_rollups(symbol, start_time, end_time, intervals=None):
+    """
+    Build rollups for already stored base candles, one quarter at a time so memory stays
+    bounded. Use this after backfilling base candles without the save listener registered.
+    """
+    sources = rollup_sources(intervals)
+    written = {}
+    for target, source in sources.items():
+        written[target] = 0
+        for suffix in partition_suffixes(start_time, end_time):
+            quarter_start, quarter_end = get_partition_bounds(suffix)
+            written[target] += rollup_range(
+                symbol, source, target, max(start_time, quarter_start), min(end_time, quarter_end - 1)
+            )
+        logger.info(f"Materialized {written[target]} {symbol} {target} candles from {source}")
+    return written
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Roll stored base candles up into higher intervals')
+    parser.add_argument('symbol')
+    parser.add_argument('start_time', type=int, help='inclusive, milliseconds')
+    parser.add_argument('end_time', type=int, help='inclusive, milliseconds')
+    parser.add_argument('--intervals', help='comma separated, defaults to ROLLUP_INTERVALS')
+    args = parser.parse_args()
+
+    Config.setup_logging()
+    materialize_rollups(args.symbol, args.start_time, args.end_time,
+                        args.intervals.split(',') if args.intervals else None)
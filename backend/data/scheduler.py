@@ -0,0 +1,265 @@
+import aiohttp
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+import numpy as np
+from backend.config import Config, BINANCE_API_URL, BINANCE_API_KEY
+from backend.data.backfill import WeightBudget, fetch_window, split_windows
+from backend.data.processing import get_interval_milliseconds
+from backend.data.resample import bucket_open_times, bucket_close_times
+from backend.data.buffer import write_buffer
+from backend.data.storage import get_kline_columns
+
+logger = logging.getLogger(__name__)
+
+def find_gaps(open_times, interval):
+    """
+    Return the [start, end) open time ranges missing between consecutive stored candles
+    """
+    open_times = np.asarray(open_times, dtype=np.int64)
+    if len(open_times) < 2:
+        return []
+    expected = bucket_close_times(open_times[:-1], interval) + 1
+    holes = np.flatnonzero(open_times[1:] != expected)
+    return [(int(expected[i]), int(open_times[i + 1])) for i in holes]
+
+def next_close(now_ms, interval):
+    """
+    Close boundary (exclusive close time) of the candle forming at `now_ms`
+    """
+    return int(bucket_close_times(bucket_open_times([now_ms], interval), interval)[0]) + 1
+
+class Gap:
+    """
+    A hole in stored history of a job, with its failed fetches and when to retry it
+    """
+    __slots__ = ('start_time', 'end_time', 'failures', 'retry_at')
+
+    def __init__(self, start_time, end_time):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.failures = 0
+        self.retry_at = 0
+
+class IngestJob:
+    """
+    One (symbol, interval) kept current by the scheduler, with its lag metrics
+    """
+
+    def __init__(self, symbol, interval):
+        self.symbol = symbol
+        self.interval = interval
+        self.next_open_time = None  # First candle not stored yet
+        self.gaps = []  # Gaps found in stored history, waiting to be fetched
+        self.next_run = None
+        self.runs = 0
+        self.candles = 0
+        self.gaps_filled = 0
+        self.gaps_dropped = 0
+        self.errors = 0
+        self.lag_ms = None  # Last candle's close boundary to the moment it was stored
+        self.max_lag_ms = 0
+
+    def metrics(self):
+        return {
+            'symbol': self.symbol,
+            'interval': self.interval,
+            'next_open_time': self.next_open_time,
+            'next_run': self.next_run,
+            'runs': self.runs,
+            'candles': self.candles,
+            'gaps_filled': self.gaps_filled,
+            'pending_gaps': len(self.gaps),
+            'gaps_dropped': self.gaps_dropped,
+            'errors': self.errors,
+            'lag_ms': self.lag_ms,
+            'max_lag_ms': self.max_lag_ms,
+        }
+
+class IngestScheduler:
+    """
+    Keeps many (symbol, interval) pairs current by waking each one just after its candle
+    closes. Due jobs are handed to a bounded pool of workers that share one exchange weight
+    budget, so a boundary where hundreds of pairs close at once is fetched as fast as the
+    budget allows and no faster. `clock` and `sleep` can be replaced to drive it in tests.
+    """
+
+    def __init__(self, pairs, writer=write_buffer.save, base_url=None, workers=None, budget=None,
+                 clock=time.time, sleep=asyncio.sleep, tick_seconds=1.0):
+        self.jobs = [IngestJob(symbol, interval) for symbol, interval in pairs]
+        self.writer = writer
+        self.base_url = base_url or BINANCE_API_URL
+        self.workers = workers or Config.INGEST_WORKERS
+        self.budget = budget or WeightBudget(Config.BINANCE_WEIGHT_LIMIT)
+        self.clock = clock
+        self.sleep = sleep
+        self.tick_seconds = tick_seconds
+        self._heap = []
+        self._sequence = itertools.count()
+        self._queue = None
+        self._in_flight = 0
+
+    def now_ms(self):
+        return int(self.clock() * 1000)
+
+    def schedule(self, job, at_ms):
+        job.next_run = at_ms
+        heapq.heappush(self._heap, (at_ms, next(self._sequence), job))
+
+    def load_job(self, job):
+        """
+        Find where stored history of a job ends and the holes within its last
+        INGEST_LOOKBACK candles
+        """
+        now = self.now_ms()
+        lookback = Config.INGEST_LOOKBACK * get_interval_milliseconds(job.interval)
+        lookback_start = int(bucket_open_times([now], job.interval)[0]) - lookback
+        open_times = get_kline_columns(job.symbol, job.interval, lookback_start, now)['openTime']
+        if not len(open_times):
+            job.next_open_time = int(bucket_open_times([lookback_start], job.interval)[0])
+            return
+        job.gaps = [Gap(start_time, end_time) for start_time, end_time in find_gaps(open_times, job.interval)]
+        job.next_open_time = int(bucket_close_times(open_times[-1:], job.interval)[0]) + 1
+
+    async def _fetch_range(self, session, job, start_time, end_time):
+        # Returns the open time after the last candle stored, or None if none were
+        last_stored = None
+        for window_start, window_end in split_windows(job.interval, start_time, end_time):
+            candles = await fetch_window(session, self.budget, self.base_url, job.symbol, job.interval,
+                                         window_start, window_end)
+            if not candles:
+                continue
+            if await asyncio.to_thread(self.writer, job.symbol, job.interval, candles) == 0:
+                raise RuntimeError("writer stored no rows")
+            job.candles += len(candles)
+            last_stored = candles[-1]['openTime']
+        return last_stored
+
+    async def run_job(self, session, job):
+        """
+        Fetch every closed candle of `job` not stored yet, then the known holes that are due,
+        and schedule the next run at the following close (or a retry if the exchange lacks
+        the candle). Holes are fetched after the live candles and fail on their own: each
+        backs off and is dropped after INGEST_GAP_MAX_FAILURES, so one that always errors
+        can't hold the live series back.
+        """
+        job.runs += 1
+        now = self.now_ms()
+        # Candles opening before this boundary have closed (allowing for the fetch delay)
+        closed_before = int(bucket_open_times([now - Config.INGEST_CLOSE_DELAY_MS], job.interval)[0])
+        try:
+            if job.next_open_time < closed_before:
+                if closed_before - job.next_open_time > get_interval_milliseconds(job.interval):
+                    job.gaps_filled += 1  # catching up after downtime
+                last_stored = await self._fetch_range(session, job, job.next_open_time, closed_before)
+                if last_stored is not None:
+                    job.next_open_time = int(bucket_close_times([last_stored], job.interval)[0]) + 1
+        except Exception as e:
+            job.errors += 1
+            logger.error(f"Ingest run for {job.symbol} {job.interval} failed: {e}")
+            self.schedule(job, self.now_ms() + int(Config.INGEST_RETRY_SECONDS * 1000))
+            return
+        await self._fill_gaps(session, job)
+
+        if job.next_open_time < closed_before:
+            # The exchange hasn't published the closed candle yet
+            self.schedule(job, self._next_gap_retry(job, self.now_ms() + int(Config.INGEST_RETRY_SECONDS * 1000)))
+            return
+        job.lag_ms = self.now_ms() - closed_before
+        job.max_lag_ms = max(job.max_lag_ms, job.lag_ms)
+        next_run = next_close(self.now_ms(), job.interval) + Config.INGEST_CLOSE_DELAY_MS
+        self.schedule(job, self._next_gap_retry(job, next_run))
+
+    async def _fill_gaps(self, session, job):
+        for gap in [gap for gap in job.gaps if gap.retry_at <= self.now_ms()]:
+            try:
+                await self._fetch_range(session, job, gap.start_time, gap.end_time)
+            except Exception as e:
+                gap.failures += 1
+                job.errors += 1
+                if gap.failures >= Config.INGEST_GAP_MAX_FAILURES:
+                    job.gaps.remove(gap)
+                    job.gaps_dropped += 1
+                    logger.warning(
+                        f"Giving up on {job.symbol} {job.interval} hole {gap.start_time}-{gap.end_time} "
+                        f"after {gap.failures} failures: {e}"
+                    )
+                else:
+                    backoff = Config.INGEST_RETRY_SECONDS * 2 ** (gap.failures - 1)
+                    gap.retry_at = self.now_ms() + int(backoff * 1000)
+                    logger.error(f"Filling {job.symbol} {job.interval} hole {gap.start_time}-{gap.end_time} failed: {e}")
+                continue
+            job.gaps.remove(gap)
+            job.gaps_filled += 1
+
+    def _next_gap_retry(self, job, next_run):
+        # A hole backing off shouldn't wait for a daily or weekly close to be retried
+        return min([next_run] + [gap.retry_at for gap in job.gaps])
+
+    async def _worker(self, session):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self.run_job(session, job)
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def drain(self):
+        """
+        Wait until every dispatched job has finished its run
+        """
+        await self._queue.join()
+
+    async def run(self, until_ms=None):
+        """
+        Run until cancelled, or until the next due run is later than `until_ms`
+        """
+        for job in self.jobs:
+            await asyncio.to_thread(self.load_job, job)
+            self.schedule(job, self.now_ms())
+        logger.info(f"Ingest scheduler tracking {len(self.jobs)} symbol/interval pairs")
+
+        self._queue = asyncio.Queue()
+        headers = {"X-MBX-APIKEY": BINANCE_API_KEY} if BINANCE_API_KEY else None
+        connector = aiohttp.TCPConnector(limit=self.workers)
+        async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+            workers = [asyncio.create_task(self._worker(session)) for _ in range(self.workers)]
+            try:
+                while self._heap or self._in_flight:
+                    due = self._heap[0][0] if self._heap else self.now_ms() + self.tick_seconds * 1000
+                    if until_ms is not None and due > until_ms:
+                        break
+                    delay = due - self.now_ms()
+                    if delay > 0:
+                        # Short naps so a retry scheduled meanwhile isn't slept through
+                        await self.sleep(min(delay / 1000, self.tick_seconds))
+                        continue
+                    # Everything due at this boundary is queued together for the pool
+                    while self._heap and self._heap[0][0] <= self.now_ms():
+                        self._in_flight += 1
+                        self._queue.put_nowait(heapq.heappop(self._heap)[2])
+                await self.drain()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+
+    def metrics(self):
+        return [job.metrics() for job in self.jobs]
+
+active_scheduler = None
+
+def start_scheduler(pairs=None):
+    """
+    Run an IngestScheduler for `pairs` (default: every INGEST_SYMBOLS x INGEST_INTERVALS) in
+    a daemon thread with its own event loop
+    """
+    global active_scheduler
+    pairs = pairs or [(symbol, interval) for symbol in Config.INGEST_SYMBOLS for interval in Config.INGEST_INTERVALS]
+    active_scheduler = IngestScheduler(pairs)
+    thread = threading.Thread(target=asyncio.run, args=(active_scheduler.run(),), daemon=True)
+    thread.start()
+    return active_scheduler
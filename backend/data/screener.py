@@ -0,0 +1,223 @@
+import logging
+import math
+import operator
+import re
+import time
+import numpy as np
+from backend.config import Config
+from backend.data.batch import compute_batch, parse_specs
+from backend.data.coverage import stored_symbols
+from backend.data.parallel import Universe, get_pool, map_universe, universe_columns
+from backend.data.processing import get_interval_milliseconds
+from backend.data.resample import bucket_open_times
+
+logger = logging.getLogger(__name__)
+
+CANDLE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+COMPARISONS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+CROSSES = ('crosses_above', 'crosses_below')
+
+OPERAND = r'[A-Za-z_]\w*(?:\([^)]*\))?(?:\.\w+)?|-?\d+(?:\.\d+)?'
+CONDITION_PATTERN = re.compile(
+    rf'^\s*({OPERAND})\s*(<=|>=|<|>|crosses_above|crosses_below)\s*({OPERAND})(?:\s+within\s+(\d+))?\s*$'
+)
+REFERENCE_PATTERN = re.compile(r'^(\w+(?:\([^)]*\))?)(?:\.(\w+))?$')
+
+class Operand:
+    """
+    One side of a condition: a number, a candle field such as 'close', or an indicator
+    output in /api/indicators syntax, e.g. 'rsi(14)' or 'macd(12,26,9).signal'
+    """
+
+    def __init__(self, text):
+        self.value, self.column, self.spec = None, None, None
+        try:
+            self.value = float(text)
+            return
+        except ValueError:
+            pass
+        if text in CANDLE_FIELDS:
+            self.column = text
+            return
+        reference, field = REFERENCE_PATTERN.match(text).groups()
+        self.spec = parse_specs(reference)[0]
+        if field is None and len(self.spec.fields) > 1:
+            raise ValueError(f"Name one of {self.spec.label}'s outputs: {', '.join(self.spec.fields)}")
+        if field is not None and field not in self.spec.fields:
+            raise ValueError(f"{self.spec.label} has no output '{field}'")
+        self.column = self.spec.columns()[self.spec.fields.index(field) if field else 0]
+
+    def tail(self, series, count):
+        return self.value if self.column is None else series[self.column][-count:]
+
+class Condition:
+    """
+    `left op right`, tested on the last closed candle, or for crosses_above/crosses_below
+    on the last `within` candles (default 1): true if left moved from at or below right to
+    above it (or the reverse) at any of them
+    """
+
+    def __init__(self, text):
+        match = CONDITION_PATTERN.match(text)
+        if not match:
+            raise ValueError(f"Malformed condition: '{text.strip()}'")
+        left, self.op, right, within = match.groups()
+        if within is not None and self.op not in CROSSES:
+            raise ValueError("'within' only applies to crosses_above and crosses_below")
+        self.left, self.right = Operand(left), Operand(right)
+        if self.left.column is None and self.right.column is None:
+            raise ValueError(f"Condition compares two numbers: '{text.strip()}'")
+        self.within = int(within) if within is not None else 1
+        if self.within < 1:
+            raise ValueError("'within' must be at least 1")
+
+    def operands(self):
+        return (self.left, self.right)
+
+    def key(self):
+        return tuple(operand.column or operand.value for operand in self.operands()) + (self.op, self.within)
+
+    def signal(self, series):
+        """
+        Boolean array of the candles at which the condition holds, for backtesting
+        """
+        count = len(series['close'])
+        left, right = self.left.tail(series, count), self.right.tail(series, count)
+        if self.op in COMPARISONS:
+            return np.broadcast_to(COMPARISONS[self.op](left, right), count)
+        difference = np.broadcast_to(left - right, count)
+        if self.op == 'crosses_below':
+            difference = -difference
+        crossed = np.zeros(count, dtype=bool)
+        crossed[1:] = (difference[1:] > 0) & (difference[:-1] <= 0)
+        if self.within == 1:
+            return crossed
+        # Crosses in the last `within` candles: a running count minus the count `within` earlier
+        crosses = np.cumsum(crossed, dtype=np.int32)
+        recent = crosses.copy()
+        recent[self.within:] -= crosses[:-self.within]
+        return recent > 0
+
+    def evaluate(self, series):
+        if self.op in COMPARISONS:
+            return bool(COMPARISONS[self.op](self.left.tail(series, 1), self.right.tail(series, 1)).all())
+        count = self.within + 1
+        if len(series['close']) < count:
+            return False
+        difference = np.broadcast_to(self.left.tail(series, count) - self.right.tail(series, count), count)
+        if self.op == 'crosses_below':
+            difference = -difference
+        return bool(np.any((difference[1:] > 0) & (difference[:-1] <= 0)))
+
+class Screen:
+    """
+    A conjunction of conditions separated by ';', e.g.
+    'rsi(14) < 30; macd(12,26,9).macd crosses_above macd(12,26,9).signal within 3'.
+    Raises ValueError for anything it can't parse.
+    """
+
+    def __init__(self, text):
+        self.conditions = [Condition(part) for part in text.split(';') if part.strip()]
+        if not self.conditions:
+            raise ValueError("No screener conditions given")
+        operands = [operand for condition in self.conditions for operand in condition.operands()]
+        # Each indicator is computed once however many conditions use it
+        self.specs = list({operand.spec.label: operand.spec for operand in operands if operand.spec}.values())
+        self.reported = list(dict.fromkeys(operand.column for operand in operands if operand.column))
+
+    def history_start(self, interval, last_open_time):
+        """
+        Open time of the first candle needed to evaluate every condition at `last_open_time`
+        """
+        first_tested = last_open_time - max(c.within for c in self.conditions) * get_interval_milliseconds(interval)
+        return min([first_tested] + [spec.warmup_start(interval, first_tested) for spec in self.specs])
+
+    def signals(self, series, memo=None):
+        """
+        Boolean array of the candles at which every condition holds. `memo(key, compute)`,
+        such as batch.Inputs.memo, lets strategies sharing a condition compute it once.
+        """
+        if memo is None:
+            signals = [condition.signal(series) for condition in self.conditions]
+        else:
+            signals = [memo(('signal',) + c.key(), lambda c=c: c.signal(series)) for c in self.conditions]
+        return np.logical_and.reduce(signals)
+
+    def evaluate(self, columns):
+        """
+        The last candle's open time and referenced values if one symbol's candle columns
+        pass every condition, else None
+        """
+        if not len(columns['openTime']):
+            return None
+        series = {**columns, **compute_batch(columns, self.specs)}
+        if not all(condition.evaluate(series) for condition in self.conditions):
+            return None
+        values = {name: float(series[name][-1]) for name in self.reported}
+        return {
+            'openTime': int(columns['openTime'][-1]),
+            **{name: None if math.isnan(value) else value for name, value in values.items()},
+        }
+
+def _scan_file(path, symbols, offsets, screen):
+    # Runs in a pool worker: maps the universe file read-only and screens a run of symbols
+    matrix = map_universe(path)
+    matches = []
+    for symbol, start, end in zip(symbols, offsets[:-1], offsets[1:]):
+        try:
+            match = screen.evaluate(universe_columns(matrix, start, end))
+        except Exception as e:
+            logger.error(f"Error screening {symbol}: {e}")
+            continue
+        if match is not None:
+            matches.append({'symbol': symbol, **match})
+    return matches
+
+def _split(offsets, parts):
+    """
+    Cut the symbols into at most `parts` contiguous runs holding about as many candles each
+    """
+    targets = np.linspace(0, offsets[-1], parts + 1)[1:-1]
+    cuts = np.unique(np.r_[0, np.searchsorted(offsets, targets), len(offsets) - 1])
+    return list(zip(cuts[:-1], cuts[1:]))
+
+def scan(universe, screen, workers=None):
+    """
+    Screen every symbol of `universe`, over `workers` processes (WORKER_PROCESSES by
+    default; 1 screens in this process). Matches are ordered by symbol.
+    """
+    workers = workers or Config.WORKER_PROCESSES
+    if not universe.symbols:
+        return []
+    if workers <= 1:
+        return _scan_file(universe.path, universe.symbols, universe.offsets, screen)
+    pool = get_pool(workers)
+    # A few runs per worker evens out symbols with more history or slower conditions
+    futures = [
+        pool.submit(_scan_file, universe.path, universe.symbols[start:end], universe.offsets[start:end + 1], screen)
+        for start, end in _split(universe.offsets, workers * 4)
+    ]
+    return [match for future in futures for match in future.result()]
+
+def run_screen(screen, interval, symbols=None, workers=None, now_ms=None):
+    """
+    Screen `symbols` (default: every symbol stored at `interval`) on their last closed
+    candle. Candles are read in one query into a Universe and then scanned in parallel.
+    """
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    symbols = symbols or stored_symbols(interval)
+    last_open_time = int(bucket_open_times(bucket_open_times([now_ms], interval) - 1, interval)[0])
+    started = time.perf_counter()
+    with Universe.load(symbols, interval, max(screen.history_start(interval, last_open_time), 0), last_open_time) as universe:
+        loaded = time.perf_counter()
+        matches = scan(universe, screen, workers)
+    finished = time.perf_counter()
+    logger.info(f"Screened {len(universe.symbols)} {interval} symbols: {len(matches)} matches "
+                f"(load {loaded - started:.3f}s, scan {finished - loaded:.3f}s)")
+    return {
+        'interval': interval,
+        'scanned': len(universe.symbols),
+        'matches': matches,
+        'loadSeconds': loaded - started,
+        'scanSeconds': finished - loaded,
+    }
@@ -1,78 +1,385 @@
-from backend.database import Session, KLineData, Base
-from sqlalchemy import and_
-from datetime import datetime
+from backend.database import (
+    engine, kline_table, kline_versions_table, get_partition_suffix, get_partition_bounds,
+    partition_suffixes, ensure_partitions, upsert_statement, version_bump_statement, price_storage,
+    read_price, PRICE_COLUMNS, PRICE_SCALE,
+)
+from sqlalchemy import select, table, column, func
+from backend.config import Config
+from backend.data.tiers import QuarterFiles, slice_columns
+from backend.metrics import span
+import numpy as np
+import pandas as pd
+import io
+import itertools
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
-def get_partition_suffix(timestamp):
-    date = datetime.fromtimestamp(timestamp / 1000)
-    return f"{date.year}q{(date.month - 1) // 3 + 1}"
+KLINE_COLUMNS = ('symbol', 'interval', 'open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time')
 
-def save_kline_data(symbol, interval, data):
-    with Session() as session:
-        for item in data:
-            try:
-                suffix = get_partition_suffix(item['openTime'])
-                PartitionClass = KLineData.create_partition(suffix)
-                kline = PartitionClass(
-                    symbol=symbol,
-                    interval=interval,
-                    open_time=item['openTime'],
-                    open=item['open'],
-                    high=item['high'],
-                    low=item['low'],
-                    close=item['close'],
-                    volume=item['volume'],
-                    close_time=item['closeTime']
-                )
-                session.add(kline)
-            except Exception as e:
-                logger.error(f"Error saving kline data: {e}")
-                logger.error(f"Problematic item: {item}")
+# Column arrays returned by get_kline_columns, named like the JSON candle fields
+KLINE_FIELDS = ('openTime', 'open', 'high', 'low', 'close', 'volume', 'closeTime')
+KLINE_DTYPES = {'openTime': np.int64, 'closeTime': np.int64}
+# 9999-12-31T23:59:59.999Z, the last open time a partition suffix can name
+MAX_OPEN_TIME = 253402300799999
+
+_save_listeners = []
+
+def add_save_listener(listener):
+    """
+    Register `listener(symbol, interval, rows)` to run after every committed save_kline_data
+    write; rows are the normalized tuples ordered like KLINE_COLUMNS.
+    """
+    if listener not in _save_listeners:
+        _save_listeners.append(listener)
+
+# Sealed quarters are served from local files when HOT_TIER_DIR is set
+hot_tier = QuarterFiles(Config.HOT_TIER_DIR) if Config.HOT_TIER_DIR else None
+
+def _notify_save_listeners(symbol, interval, rows):
+    for listener in _save_listeners:
         try:
-            session.commit()
+            listener(symbol, interval, rows)
         except Exception as e:
-            logger.error(f"Error committing to database: {e}")
-            session.rollback()
+            logger.error(f"Error in kline save listener {listener.__name__}: {e}")
 
-def get_kline_data(symbol, interval, start_time, end_time):
-    with Session() as session:
-        start_suffix = get_partition_suffix(start_time)
-        end_suffix = get_partition_suffix(end_time)
-        
-        data = []
-        current_suffix = start_suffix
-        while current_suffix <= end_suffix:
-            PartitionClass = KLineData.create_partition(current_suffix)
-            query = session.query(PartitionClass).filter(
-                and_(
-                    PartitionClass.symbol == symbol,
-                    PartitionClass.interval == interval,
-                    PartitionClass.open_time >= start_time,
-                    PartitionClass.open_time <= end_time
-                )
-            ).order_by(PartitionClass.open_time)
-            
-            data.extend(query.all())
-            
-            # Move to the next quarter
-            year, quarter = map(int, current_suffix.split('q'))
-            if quarter == 4:
-                year += 1
-                quarter = 1
+def normalize_rows(symbol, interval, data):
+    """
+    Convert candle dicts into insert tuples ordered like KLINE_COLUMNS.
+    Duplicate open times within the batch are collapsed, last one wins.
+    """
+    rows = {}
+    for item in data:
+        open_time = int(item['openTime'])
+        rows[open_time] = (
+            symbol,
+            interval,
+            open_time,
+            float(item['open']),
+            float(item['high']),
+            float(item['low']),
+            float(item['close']),
+            float(item['volume']),
+            int(item['closeTime']),
+        )
+    return list(rows.values())
+
+def _stored_rows(rows):
+    # 'scaled' storage keeps OHLCV values as integer counts of 1 / PRICE_SCALE
+    if price_storage(kline_table) != 'scaled':
+        return rows
+    return [row[:3] + tuple(round(value * PRICE_SCALE) for value in row[3:8]) + row[8:] for row in rows]
+
+def _copy_rows(connection, stage_name, rows):
+    buffer = io.StringIO()
+    buffer.writelines('\t'.join(map(str, row)) + '\n' for row in rows)
+    buffer.seek(0)
+    copy_sql = f"COPY {stage_name} ({', '.join(KLINE_COLUMNS)}) FROM STDIN"
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):  # psycopg2
+            cursor.copy_expert(copy_sql, buffer)
+        else:  # psycopg 3
+            with cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+
+def _copy_upsert(connection, rows, stage_name='kline_data_stage'):
+    # COPY cannot resolve conflicts itself, so load into a temp table and upsert from it
+    connection.exec_driver_sql(
+        f"CREATE TEMP TABLE IF NOT EXISTS {stage_name} (LIKE {kline_table.name}) ON COMMIT DROP"
+    )
+    connection.exec_driver_sql(f"TRUNCATE {stage_name}")
+    _copy_rows(connection, stage_name, rows)
+    stage = table(stage_name, *(column(name) for name in KLINE_COLUMNS))
+    connection.execute(upsert_statement('postgresql', kline_table, select(*stage.c)))
+
+def _executemany_upsert(connection, rows):
+    connection.execute(
+        upsert_statement(connection.dialect.name, kline_table),
+        [dict(zip(KLINE_COLUMNS, row)) for row in rows],
+    )
+
+def save_kline_data(symbol, interval, data):
+    """
+    Bulk upsert candles into kline_data in one set-based write, creating any missing
+    quarter partitions first. Uses COPY on PostgreSQL and executemany elsewhere;
+    re-saving a candle updates it in place. Returns the number of rows written.
+    """
+    started = time.perf_counter()
+    try:
+        rows = normalize_rows(symbol, interval, data)
+    except (KeyError, TypeError, ValueError) as e:
+        logger.error(f"Error preparing kline data for {symbol} {interval}: {e}")
+        return 0
+    return _write_series({(symbol, interval): rows}, started)
+
+def save_kline_columns(symbol, interval, columns):
+    """
+    save_kline_data for candles already held as column arrays keyed by KLINE_FIELDS, such
+    as a validated ingest batch, without building a dict per candle. Duplicate open times
+    are collapsed, last one wins. Returns the number of rows written.
+    """
+    return save_kline_series([(symbol, interval, columns)])
+
+def save_kline_series(batches):
+    """
+    Write (symbol, interval, columns) batches of any number of series in one transaction,
+    as the write buffer's group commits do. Batches of the same series are merged, and
+    duplicate open times collapse to the last one given. Returns the number of rows
+    written, or 0 if the transaction failed.
+    """
+    started = time.perf_counter()
+    merged = {}
+    for symbol, interval, columns in batches:
+        merged.setdefault((symbol, interval), []).append(columns)
+    series = {}
+    for (symbol, interval), parts in merged.items():
+        columns = {name: np.concatenate([np.asarray(part[name]) for part in parts]) for name in KLINE_FIELDS}
+        open_times = columns['openTime'].astype(np.int64)
+        # The last occurrence of each open time, in open time order
+        _, last = np.unique(open_times[::-1], return_index=True)
+        keep = len(open_times) - 1 - last
+        fields = [columns[name][keep].astype(KLINE_DTYPES.get(name, np.float64)).tolist() for name in KLINE_FIELDS]
+        series[(symbol, interval)] = [(symbol, interval, *values) for values in zip(*fields)]
+    return _write_series(series, started)
+
+def _write_series(series, started):
+    rows = [row for series_rows in series.values() for row in series_rows]
+    if not rows:
+        return 0
+    open_times = [row[2] for row in rows]
+    names = ', '.join(f'{symbol} {interval}' for symbol, interval in series) if len(series) <= 3 else f'{len(series)} series of'
+    try:
+        with span('store') as timing, engine.begin() as connection:
+            timing.rows = len(rows)
+            ensure_partitions(connection, partition_suffixes(min(open_times), max(open_times)))
+            _bump_versions(connection, series)
+            if connection.dialect.name == 'postgresql':
+                _copy_upsert(connection, _stored_rows(rows))
             else:
-                quarter += 1
-            current_suffix = f"{year}q{quarter}"
-        
-        return [
-            {
-                "openTime": int(d.open_time),
-                "open": float(d.open),
-                "high": float(d.high),
-                "low": float(d.low),
-                "close": float(d.close),
-                "volume": float(d.volume),
-                "closeTime": int(d.close_time)
-            } for d in data
-        ]
\ No newline at end of file
+                _executemany_upsert(connection, _stored_rows(rows))
+    except Exception as e:
+        logger.error(f"Error writing kline data for {names}: {e}")
+        return 0
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Saved {len(rows)} {names} candles in {elapsed:.3f}s "
+        f"({len(rows) / elapsed if elapsed else 0:.0f} rows/s)"
+    )
+    for (symbol, interval), series_rows in series.items():
+        _notify_save_listeners(symbol, interval, series_rows)
+    return len(rows)
+
+def _bump_versions(connection, series):
+    # Every quarter between a series' first and last candle counts as written. Sorted, so
+    # concurrent writers take the version row locks in the same order.
+    keys = sorted(
+        (symbol, interval, suffix)
+        for (symbol, interval), rows in series.items()
+        for suffix in partition_suffixes(min(row[2] for row in rows), max(row[2] for row in rows))
+    )
+    connection.execute(
+        version_bump_statement(connection.dialect.name),
+        [{'symbol': symbol, 'interval': interval, 'quarter': suffix} for symbol, interval, suffix in keys],
+    )
+
+def quarter_versions(symbol, interval, start_time, end_time):
+    """
+    Versions of the quarters overlapping [start_time, end_time] that have ever been written,
+    as {quarter: version}; a quarter missing from it has version 0
+    """
+    # Open ended ranges reach past datetime's year 9999; suffixes are 'YYYYqN', so they
+    # order as strings
+    first, last = (get_partition_suffix(min(max(time, 0), MAX_OPEN_TIME)) for time in (start_time, end_time))
+    stmt = select(kline_versions_table.c.quarter, kline_versions_table.c.version).where(
+        kline_versions_table.c.symbol == symbol,
+        kline_versions_table.c.interval == interval,
+        kline_versions_table.c.quarter >= first,
+        kline_versions_table.c.quarter <= last,
+    )
+    with span('query', 'version'), engine.connect() as connection:
+        return dict(connection.execute(stmt).all())
+
+def _kline_select(symbol, interval, start_time, end_time):
+    return select(
+        kline_table.c.open_time,
+        *(read_price(kline_table.c[name]) for name in PRICE_COLUMNS),
+        kline_table.c.close_time,
+    ).where(
+        kline_table.c.symbol == symbol,
+        kline_table.c.interval == interval,
+        kline_table.c.open_time >= start_time,
+        kline_table.c.open_time <= end_time,
+    ).order_by(kline_table.c.open_time)
+
+def get_kline_columns(symbol, interval, start_time, end_time):
+    """
+    Fetch candles with open_time in [start_time, end_time] as contiguous NumPy arrays keyed
+    by KLINE_FIELDS: int64 openTime/closeTime and float64 OHLCV, ordered by openTime.
+    With the hot tier enabled, sealed quarters are mapped from local files and only the
+    open quarter is queried.
+    """
+    if hot_tier is not None and hot_tier.accepts(symbol, interval) and start_time <= end_time:
+        return _tiered_kline_columns(symbol, interval, start_time, end_time)
+    return _db_kline_columns(symbol, interval, start_time, end_time)
+
+def _db_kline_columns(symbol, interval, start_time, end_time):
+    # A single query on the parent; PostgreSQL prunes it to the partitions overlapping the range
+    with span('query', 'klines') as timing, engine.connect() as connection:
+        rows = connection.execute(_kline_select(symbol, interval, start_time, end_time)).all()
+        timing.rows = len(rows)
+    return rows_to_columns(rows)
+
+def _sealed_quarters(symbol, interval, suffixes):
+    """
+    Columns of each sealed quarter from its file for the quarter's current version,
+    exporting the missing ones from a single query spanning them first
+    """
+    if not suffixes:
+        return []
+    first, last = get_partition_bounds(suffixes[0])[0], get_partition_bounds(suffixes[-1])[0]
+    versions = quarter_versions(symbol, interval, first, last)
+    with span('query', 'hot_tier'):
+        quarters = {suffix: hot_tier.read(symbol, interval, suffix, versions.get(suffix, 0)) for suffix in suffixes}
+    missing = [suffix for suffix, columns in quarters.items() if columns is None]
+    if missing:
+        # Read after the versions, so a file never holds candles older than its version
+        start, end = get_partition_bounds(missing[0])[0], get_partition_bounds(missing[-1])[1]
+        columns = _db_kline_columns(symbol, interval, start, end - 1)
+        for suffix in missing:
+            quarter_start, quarter_end = get_partition_bounds(suffix)
+            quarters[suffix] = slice_columns(columns, quarter_start, quarter_end - 1)
+            hot_tier.write(symbol, interval, suffix, quarters[suffix], versions.get(suffix, 0))
+        logger.info(f"Exported {len(missing)} sealed {symbol} {interval} quarters to {hot_tier.root}")
+    return [quarters[suffix] for suffix in suffixes]
+
+def stored_bounds(symbol, interval, start_time, end_time):
+    """
+    Open times of the first and last stored candles in [start_time, end_time], or Nones
+    """
+    stmt = select(func.min(kline_table.c.open_time), func.max(kline_table.c.open_time)).where(
+        kline_table.c.symbol == symbol,
+        kline_table.c.interval == interval,
+        kline_table.c.open_time >= start_time,
+        kline_table.c.open_time <= end_time,
+    )
+    with span('query', 'bounds'), engine.connect() as connection:
+        return connection.execute(stmt).one()
+
+def _tiered_kline_columns(symbol, interval, start_time, end_time):
+    # Only the quarters holding candles are walked, so open-ended reads such as an indicator
+    # seed from 0 don't export a file for every empty quarter since 1970
+    first, last = stored_bounds(symbol, interval, start_time, end_time)
+    if first is None:
+        return rows_to_columns([])
+    suffixes = partition_suffixes(first, last)
+    sealed = [suffix for suffix in suffixes if hot_tier.is_sealed(suffix)]
+    parts = [
+        slice_columns(columns, first, last)
+        for columns in _sealed_quarters(symbol, interval, sealed)
+    ]
+    if len(sealed) < len(suffixes):
+        open_start = get_partition_bounds(suffixes[len(sealed)])[0]
+        parts.append(_db_kline_columns(symbol, interval, max(first, open_start), last))
+    parts = [part for part in parts if len(part['openTime'])] or parts[:1]
+    if len(parts) == 1:
+        return parts[0]  # zero-copy views when the range falls in one sealed quarter
+    return {name: np.concatenate([part[name] for part in parts]) for name in KLINE_FIELDS}
+
+def series_version(symbol, interval, start_time, end_time):
+    """
+    Changes whenever the stored candles of [start_time, end_time] may have, whichever
+    process wrote them: the versions of the quarters the range overlaps. Cheap enough to
+    check on every request; one index range scan.
+    """
+    return tuple(sorted(quarter_versions(symbol, interval, start_time, end_time).items()))
+
+def get_universe_columns(symbols, interval, start_time, end_time):
+    """
+    Fetch [start_time, end_time] for many symbols in one query. Returns the symbols that have
+    candles (sorted), their row offsets, and column arrays like get_kline_columns holding
+    every symbol's candles back to back: symbol i owns rows offsets[i]:offsets[i + 1].
+    """
+    stmt = select(
+        kline_table.c.open_time,
+        *(read_price(kline_table.c[name]) for name in PRICE_COLUMNS),
+        kline_table.c.close_time,
+        kline_table.c.symbol,
+    ).where(
+        kline_table.c.symbol.in_(symbols),
+        kline_table.c.interval == interval,
+        kline_table.c.open_time >= start_time,
+        kline_table.c.open_time <= end_time,
+    ).order_by(kline_table.c.symbol, kline_table.c.open_time)
+    with span('query', 'universe') as timing, engine.connect() as connection:
+        rows = connection.execute(stmt).all()
+        timing.rows = len(rows)
+    names = [row[-1] for row in rows]
+    starts = [i for i in range(len(names)) if i == 0 or names[i] != names[i - 1]]
+    columns = rows_to_columns([row[:-1] for row in rows])
+    return [names[i] for i in starts], np.array(starts + [len(names)], dtype=np.int64), columns
+
+def iter_kline_columns(symbol, interval, start_time, end_time, chunk_size=None):
+    """
+    Yield the candles of [start_time, end_time] like get_kline_columns, but as chunks of at
+    most `chunk_size` rows so memory stays constant however long the range is. Partitions
+    are walked in order with one server-side cursor each (stream_results on PostgreSQL),
+    or mapped from the hot tier when sealed.
+    """
+    chunk_size = chunk_size or Config.STREAM_CHUNK_SIZE
+    first, last = stored_bounds(symbol, interval, start_time, end_time)
+    if first is None:
+        return
+
+    tiered = hot_tier is not None and hot_tier.accepts(symbol, interval)
+    for suffix in partition_suffixes(first, last):
+        if tiered and hot_tier.is_sealed(suffix):
+            columns = slice_columns(_sealed_quarters(symbol, interval, [suffix])[0], first, last)
+            for offset in range(0, len(columns['openTime']), chunk_size):
+                yield {name: values[offset:offset + chunk_size] for name, values in columns.items()}
+            continue
+        partition_start, partition_end = get_partition_bounds(suffix)
+        stmt = _kline_select(symbol, interval, max(first, partition_start), min(last, partition_end - 1))
+        with engine.connect() as connection:
+            # Only the fetches are timed, not the consumer's work between chunks
+            with span('query', 'partition'):
+                result = connection.execution_options(yield_per=chunk_size).execute(stmt)
+            chunks = result.partitions()
+            while True:
+                with span('query', 'partition') as timing:
+                    rows = next(chunks, None)
+                    timing.rows = len(rows) if rows else 0
+                if rows is None:
+                    break
+                yield rows_to_columns(rows)
+
+def rows_to_columns(rows):
+    """
+    Convert (open_time, open, high, low, close, volume, close_time) rows into column arrays
+    """
+    with span('convert', 'columns') as timing:
+        timing.rows = len(rows)
+        # Millisecond timestamps are well below 2**53, so a float64 pass is exact for them too
+        matrix = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.float64, count=len(rows) * len(KLINE_FIELDS))
+        matrix = matrix.reshape(len(rows), len(KLINE_FIELDS))
+        return {
+            name: np.ascontiguousarray(matrix[:, i], dtype=KLINE_DTYPES.get(name, np.float64))
+            for i, name in enumerate(KLINE_FIELDS)
+        }
+
+def get_kline_frame(symbol, interval, start_time, end_time):
+    return pd.DataFrame(get_kline_columns(symbol, interval, start_time, end_time), copy=False)
+
+def columns_to_records(columns):
+    """
+    Build the per-candle JSON dicts from column arrays; only needed at the HTTP edge
+    """
+    fields = [columns[name].tolist() for name in KLINE_FIELDS]
+    return [dict(zip(KLINE_FIELDS, values)) for values in zip(*fields)]
+
+def get_kline_data(symbol, interval, start_time, end_time):
+    return columns_to_records(get_kline_columns(symbol, interval, start_time, end_time))
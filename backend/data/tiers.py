@@ -0,0 +1,132 @@
+import argparse
+import logging
+import os
+import re
+import threading
+import time
+import numpy as np
+from backend.config import Config
+from backend.database import get_partition_suffix
+
+logger = logging.getLogger(__name__)
+
+# Rows of a quarter file, ordered like storage.KLINE_FIELDS (which imports this module)
+FIELDS = ('openTime', 'open', 'high', 'low', 'close', 'volume', 'closeTime')
+TIME_FIELDS = ('openTime', 'closeTime')
+# Symbols and intervals become path components, so only plain names are stored
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9]+$')
+
+class QuarterFiles:
+    """
+    Candles of sealed quarters (every partition before the current one) as one .npy file
+    per (symbol, interval, quarter) under `root`/<symbol>/<interval>/<quarter>.v<version>.npy.
+    Each file is a (7, n) float64 matrix of KLINE_FIELDS rows; the openTime/closeTime rows
+    hold int64 bit patterns, so every column is read as a zero-copy view of the mapping.
+
+    The version is the quarter's kline_versions row (storage.quarter_versions) when the
+    export read the database. Every write bumps it in the database, so a file is only served
+    while no process has written to its quarter since, and an export that raced a write is
+    stored under a version nobody asks for.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.hits = 0
+        self.exports = 0
+        self.invalidations = 0
+        self._empty = {}  # (symbol, interval, quarter) -> version known to have no candles
+        self._lock = threading.Lock()
+
+    def accepts(self, symbol, interval):
+        return bool(NAME_PATTERN.match(symbol) and NAME_PATTERN.match(interval))
+
+    def is_sealed(self, suffix, now_ms=None):
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        # Suffixes are 'YYYYqN', so they order as strings
+        return suffix < get_partition_suffix(now_ms)
+
+    def path(self, symbol, interval, suffix, version):
+        return os.path.join(self.root, symbol, interval, f'{suffix}.v{version}.npy')
+
+    def read(self, symbol, interval, suffix, version):
+        """
+        Column arrays of a quarter's file for `version` as read-only views of its mapping, or
+        None if that version hasn't been exported
+        """
+        if self._empty.get((symbol, interval, suffix)) == version:
+            self.hits += 1
+            return empty_columns()
+        try:
+            matrix = np.load(self.path(symbol, interval, suffix, version), mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        self.hits += 1
+        if not matrix.shape[1]:
+            self._empty[(symbol, interval, suffix)] = version
+        return {
+            field: matrix[i].view(np.int64) if field in TIME_FIELDS else matrix[i]
+            for i, field in enumerate(FIELDS)
+        }
+
+    def write(self, symbol, interval, suffix, columns, version):
+        """
+        Store a quarter's columns as of `version`, taken before they were read, and delete
+        the files of its older versions. The file is written aside and renamed into place,
+        so readers never map a partial one.
+        """
+        path = self.path(symbol, interval, suffix, version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        matrix = np.empty((len(FIELDS), len(columns['openTime'])), dtype=np.float64)
+        for i, field in enumerate(FIELDS):
+            values = columns[field]
+            matrix[i] = np.asarray(values, dtype=np.int64).view(np.float64) if field in TIME_FIELDS else values
+        partial = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(partial, 'wb') as file:
+            np.save(file, matrix)
+        os.replace(partial, path)
+        with self._lock:
+            self.exports += 1
+        self._remove_older(symbol, interval, suffix, version)
+
+    def _remove_older(self, symbol, interval, suffix, version):
+        # A newer version may already be exported by another process; it is left alone
+        pattern = re.compile(rf'^{suffix}\.v(\d+)\.npy$')
+        directory = os.path.dirname(self.path(symbol, interval, suffix, version))
+        for name in os.listdir(directory):
+            match = pattern.match(name)
+            if match and int(match.group(1)) < version:
+                try:
+                    os.unlink(os.path.join(directory, name))
+                except FileNotFoundError:
+                    continue
+                with self._lock:
+                    self.invalidations += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'exports': self.exports, 'invalidations': self.invalidations}
+
+def empty_columns():
+    return {field: np.empty(0, dtype=np.int64 if field in TIME_FIELDS else np.float64) for field in FIELDS}
+
+def slice_columns(columns, start_time, end_time):
+    """
+    Candles with open time in [start_time, end_time] of ordered columns, as views
+    """
+    open_times = columns['openTime']
+    first = int(np.searchsorted(open_times, start_time, side='left'))
+    last = int(np.searchsorted(open_times, end_time, side='right'))
+    return {field: values[first:last] for field, values in columns.items()}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the sealed quarters of stored candles to HOT_TIER_DIR')
+    parser.add_argument('symbol')
+    parser.add_argument('interval')
+    parser.add_argument('--since', type=int, default=0, help='first open time to export, milliseconds')
+    args = parser.parse_args()
+
+    Config.setup_logging()
+    from backend.data import storage
+    if storage.hot_tier is None:
+        parser.error('HOT_TIER_DIR is not set')
+    columns = storage.get_kline_columns(args.symbol, args.interval, args.since, int(time.time() * 1000))
+    logger.info(f"{args.symbol} {args.interval}: {len(columns['openTime'])} candles, {storage.hot_tier.stats()}")
@@ -1,63 +1,470 @@
-from sqlalchemy import create_engine, Column, Integer, String, Numeric, BigInteger, Table
+from sqlalchemy import create_engine, Column, String, Numeric, BigInteger, Double, Float, Integer, Text, Table, MetaData, PrimaryKeyConstraint, select, func, true, cast, literal, literal_column
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy import inspect
+from datetime import datetime, timezone
 from backend.config import Config
+import argparse
 import logging
+import threading
+import time
 
-engine = create_engine(Config.DATABASE_URL)
+logger = logging.getLogger(__name__)
+
+class MeteredQueuePool(QueuePool):
+    """
+    QueuePool counting checkouts, how long they waited for a connection, and how many gave
+    up after DB_POOL_TIMEOUT, so pool saturation shows before requests fail
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.
+        self.max_wait_seconds = 0.
+        self.peak_checked_out = 0
+        self._metrics_lock = threading.Lock()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeout:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        waited = time.perf_counter() - started
+        with self._metrics_lock:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self.peak_checked_out = max(self.peak_checked_out, self.checkedout())
+        return connection
+
+    def stats(self):
+        capacity = self.size() + self._max_overflow
+        return {
+            'size': self.size(),
+            'maxOverflow': self._max_overflow,
+            'checkedOut': self.checkedout(),
+            'idle': self.checkedin(),
+            'overflow': max(self.overflow(), 0),
+            'saturation': self.checkedout() / capacity if capacity > 0 else None,
+            'peakCheckedOut': self.peak_checked_out,
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'meanWaitSeconds': self.wait_seconds / self.checkouts if self.checkouts else 0.,
+            'maxWaitSeconds': self.max_wait_seconds,
+        }
+
+def create_database_engine(url=None):
+    """
+    Engine for `url` (DATABASE_URL by default) with the DB_POOL_* settings and, on
+    PostgreSQL, DB_STATEMENT_TIMEOUT_MS on every connection. The process shares the one
+    module-level `engine`; this is for tools that need another database.
+    """
+    url = make_url(url or Config.DATABASE_URL)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return create_engine(url)  # one connection per thread by design, nothing to pool
+    connect_args = {}
+    if url.get_backend_name() == 'postgresql' and Config.DB_STATEMENT_TIMEOUT_MS:
+        connect_args['options'] = f'-c statement_timeout={Config.DB_STATEMENT_TIMEOUT_MS}'
+    return create_engine(
+        url,
+        poolclass=MeteredQueuePool,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_timeout=Config.DB_POOL_TIMEOUT,
+        pool_recycle=Config.DB_POOL_RECYCLE,
+        pool_pre_ping=Config.DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+engine = create_database_engine()
 Session = sessionmaker(bind=engine)
 Base = declarative_base()
 
-logger = logging.getLogger(__name__)
+def pool_stats(engine=engine):
+    # Pools are replaced when the engine is disposed, so always read the current one
+    pool = engine.pool
+    return pool.stats() if isinstance(pool, MeteredQueuePool) else {'pool': type(pool).__name__}
+
+def without_statement_timeout(connection):
+    """
+    Lift DB_STATEMENT_TIMEOUT_MS for the rest of `connection`'s transaction, for schema
+    work and migrations that rewrite whole tables
+    """
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql("SET LOCAL statement_timeout = 0")
+
+KLINE_TABLE = 'kline_data'
 
-def kline_data_table(suffix):
+# Column type of the stored OHLCV values per Config.PRICE_STORAGE mode. 'scaled' keeps
+# value * PRICE_SCALE as a BIGINT: exact to 8 decimals like NUMERIC(20, 8), but only up to
+# about 9.2e10 (NUMERIC(20, 8) goes to 1e12).
+PRICE_TYPES = {'numeric': lambda: Numeric(20, 8), 'double': Double, 'scaled': BigInteger}
+PRICE_SCALE = 10 ** 8
+PRICE_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+def build_kline_table(metadata, storage, name=KLINE_TABLE):
+    if storage not in PRICE_TYPES:
+        raise ValueError(f"PRICE_STORAGE must be one of {', '.join(PRICE_TYPES)}, got '{storage}'")
     return Table(
-        f'kline_data_{suffix}',
-        Base.metadata,
-        Column('id', Integer, primary_key=True, autoincrement=True),
+        name,
+        metadata,
         Column('symbol', String(10), nullable=False),
         Column('interval', String(5), nullable=False),
         Column('open_time', BigInteger, nullable=False),
-        Column('open', Numeric(20, 8), nullable=False),
-        Column('high', Numeric(20, 8), nullable=False),
-        Column('low', Numeric(20, 8), nullable=False),
-        Column('close', Numeric(20, 8), nullable=False),
-        Column('volume', Numeric(20, 8), nullable=False),
+        *(Column(column, PRICE_TYPES[storage](), nullable=False) for column in PRICE_COLUMNS),
         Column('close_time', BigInteger, nullable=False),
+        # Serves range scans ordered by open_time and is the conflict target of the bulk upsert
+        PrimaryKeyConstraint('symbol', 'interval', 'open_time', name=f'pk_{name}'),
+        postgresql_partition_by='RANGE (open_time)' if name == KLINE_TABLE else None,
     )
 
+# On PostgreSQL kline_data is a PARTITION BY RANGE (open_time) parent with one partition
+# per quarter (kline_data_2024q1, ...); other dialects get a plain table with the same shape.
+kline_table = build_kline_table(Base.metadata, Config.PRICE_STORAGE)
+
+def price_storage(table):
+    """
+    PRICE_STORAGE mode of a kline table (declared or reflected), from its OHLCV column type
+    """
+    price_type = table.c.close.type
+    if isinstance(price_type, Float):  # before Numeric, which Float subclasses
+        return 'double'
+    if isinstance(price_type, Integer):
+        return 'scaled'
+    return 'numeric'
+
+def read_price(column):
+    """
+    Select expression reading a stored OHLCV column of kline_table as double precision, so
+    no Decimal objects are created
+    """
+    storage = price_storage(column.table)
+    if storage == 'double':
+        return column
+    if storage == 'scaled':
+        # Exact integers divided by an exact power of ten: the same float a NUMERIC cast gives
+        return cast(column, Float) / literal(float(PRICE_SCALE), Float)
+    return cast(column, Float)
+
 class KLineData(Base):
-    __table__ = kline_data_table('default')
-
-    @classmethod
-    def create_partition(cls, suffix):
-        table_name = f'kline_data_{suffix}'
-        if table_name not in Base.metadata.tables:
-            table = kline_data_table(suffix)
-            return type(f'KLineData_{suffix}', (Base,), {
-                '__table__': table,
-                '__tablename__': table_name,
-            })
-        return type(f'KLineData_{suffix}', (Base,), {
-            '__table__': Base.metadata.tables[table_name],
-            '__tablename__': table_name,
-        })
+    __table__ = kline_table
+
+# Incremental indicator state per (indicator, symbol, interval, params), stored as JSON
+indicator_state_table = Table(
+    'indicator_state',
+    Base.metadata,
+    Column('indicator', String(16), nullable=False),
+    Column('symbol', String(10), nullable=False),
+    Column('interval', String(5), nullable=False),
+    Column('params', String(32), nullable=False),
+    Column('state', Text, nullable=False),
+    PrimaryKeyConstraint('indicator', 'symbol', 'interval', 'params', name='pk_indicator_state'),
+)
+
+# Precomputed indicator series, one row per candle; value1..3 hold the indicator's outputs in order
+indicator_values_table = Table(
+    'indicator_values',
+    Base.metadata,
+    Column('indicator', String(16), nullable=False),
+    Column('symbol', String(10), nullable=False),
+    Column('interval', String(5), nullable=False),
+    Column('params', String(32), nullable=False),
+    Column('open_time', BigInteger, nullable=False),
+    Column('value1', Float),
+    Column('value2', Float),
+    Column('value3', Float),
+    PrimaryKeyConstraint('indicator', 'symbol', 'interval', 'params', 'open_time', name='pk_indicator_values'),
+)
+
+# Contiguous [start_time, end_time) open time ranges known to be fully stored (or known to have
+# no candles on the exchange) per (symbol, interval), so reads only fetch what is missing
+kline_coverage_table = Table(
+    'kline_coverage',
+    Base.metadata,
+    Column('symbol', String(10), nullable=False),
+    Column('interval', String(5), nullable=False),
+    Column('start_time', BigInteger, nullable=False),
+    Column('end_time', BigInteger, nullable=False),
+    PrimaryKeyConstraint('symbol', 'interval', 'start_time', name='pk_kline_coverage'),
+)
+
+# Write count per (symbol, interval, quarter), bumped in the transaction of every candle write.
+# Any process can tell from it whether stored candles changed, unlike state held in memory.
+kline_versions_table = Table(
+    'kline_versions',
+    Base.metadata,
+    Column('symbol', String(10), nullable=False),
+    Column('interval', String(5), nullable=False),
+    Column('quarter', String(6), nullable=False),
+    Column('version', BigInteger, nullable=False),
+    PrimaryKeyConstraint('symbol', 'interval', 'quarter', name='pk_kline_versions'),
+)
+
+def upsert_statement(dialect_name, table, source=None):
+    """
+    INSERT into `table` that overwrites the non-key columns when the primary key already exists.
+    Rows come from executemany parameters or from the `source` SELECT (columns in table order).
+    """
+    key = [column.name for column in table.primary_key.columns]
+    columns = [column.name for column in table.columns]
+    if dialect_name == 'postgresql':
+        stmt = pg_insert(table)
+    elif dialect_name == 'sqlite':
+        stmt = sqlite_insert(table)
+    else:
+        return table.insert() if source is None else table.insert().from_select(columns, source)
+    if source is not None:
+        stmt = stmt.from_select(columns, source)
+    return stmt.on_conflict_do_update(
+        index_elements=key,
+        set_={name: stmt.excluded[name] for name in columns if name not in key},
+    )
+
+def version_bump_statement(dialect_name):
+    """
+    Executemany INSERT into kline_versions adding one to the version of each (symbol,
+    interval, quarter) given, starting it at 1
+    """
+    insert = pg_insert if dialect_name == 'postgresql' else sqlite_insert
+    stmt = insert(kline_versions_table).values(version=1)
+    return stmt.on_conflict_do_update(
+        index_elements=['symbol', 'interval', 'quarter'],
+        set_={'version': kline_versions_table.c.version + 1},
+    )
+
+def get_partition_suffix(timestamp):
+    date = datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc)
+    return f"{date.year}q{(date.month - 1) // 3 + 1}"
+
+def get_partition_bounds(suffix):
+    """
+    Return the [start, end) open_time range in milliseconds covered by a partition suffix
+    """
+    year, quarter = map(int, suffix.split('q'))
+    start = datetime(year, 3 * (quarter - 1) + 1, 1, tzinfo=timezone.utc)
+    end = datetime(year + quarter // 4, 3 * (quarter % 4) + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+def next_partition_suffix(suffix):
+    year, quarter = map(int, suffix.split('q'))
+    return f"{year + 1}q1" if quarter == 4 else f"{year}q{quarter + 1}"
+
+def partition_suffixes(start_time, end_time):
+    """
+    List the quarter suffixes covering open times from start_time to end_time inclusive
+    """
+    suffix, last_suffix = get_partition_suffix(start_time), get_partition_suffix(end_time)
+    suffixes = [suffix]
+    while suffix < last_suffix:
+        suffix = next_partition_suffix(suffix)
+        suffixes.append(suffix)
+    return suffixes
+
+# Partitions seen to exist; only filled from a lookup so a rolled back CREATE is never cached
+_known_partitions = set()
+
+def ensure_partitions(connection, suffixes):
+    """
+    Create the quarter partitions of kline_data that don't exist yet. No-op outside PostgreSQL.
+    """
+    if connection.dialect.name != 'postgresql':
+        return
+    for suffix in suffixes:
+        if suffix in _known_partitions:
+            continue
+        partition = f'{KLINE_TABLE}_{suffix}'
+        if connection.exec_driver_sql(f"SELECT to_regclass('{partition}')").scalar() is not None:
+            _known_partitions.add(suffix)
+            continue
+        start, end = get_partition_bounds(suffix)
+        logger.info(f"Creating partition {partition}")
+        connection.exec_driver_sql(
+            f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {KLINE_TABLE} "
+            f"FOR VALUES FROM ({start}) TO ({end})"
+        )
+
+def ensure_partitions_ahead(connection, quarters_ahead=None):
+    """
+    Create partitions from the current quarter through `quarters_ahead` quarters into the future
+    """
+    if quarters_ahead is None:
+        quarters_ahead = Config.PARTITIONS_AHEAD
+    suffixes = [get_partition_suffix(datetime.now(timezone.utc).timestamp() * 1000)]
+    for _ in range(quarters_ahead):
+        suffixes.append(next_partition_suffix(suffixes[-1]))
+    ensure_partitions(connection, suffixes)
+
+def _legacy_kline_tables(inspector):
+    # The hand-rolled quarter tables (and kline_data_default) carried a surrogate id column
+    return [
+        name for name in inspector.get_table_names()
+        if name.startswith(f'{KLINE_TABLE}_')
+        and 'id' in {column['name'] for column in inspector.get_columns(name)}
+    ]
+
+def migrate_legacy_kline_tables(connection):
+    """
+    Move candles from the old per-quarter kline_data_<suffix> tables into kline_data.
+    Each legacy table is renamed out of the way of the new partition names, copied
+    with duplicates skipped, and dropped.
+    """
+    legacy_tables = _legacy_kline_tables(inspect(connection))
+    if not legacy_tables:
+        return
+
+    for name in legacy_tables:
+        connection.exec_driver_sql(f"ALTER TABLE {name} RENAME TO legacy_{name}")
+    kline_table.create(connection, checkfirst=True)
+
+    metadata = MetaData()
+    columns = [column.name for column in kline_table.columns]
+    for name in legacy_tables:
+        legacy = Table(f'legacy_{name}', metadata, autoload_with=connection)
+        bounds = connection.execute(select(func.min(legacy.c.open_time), func.max(legacy.c.open_time))).one()
+        if bounds[0] is not None:
+            ensure_partitions(connection, partition_suffixes(*bounds))
+
+        insert = pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+        # WHERE true keeps SQLite from reading ON CONFLICT as part of the SELECT; legacy
+        # prices are NUMERIC and are converted to the configured storage
+        source = select(*(
+            literal_column(price_conversion_sql(connection.dialect.name, c, 'numeric', price_storage(kline_table)))
+            if c in PRICE_COLUMNS else legacy.c[c]
+            for c in columns
+        )).where(true())
+        stmt = insert(kline_table).from_select(columns, source)
+        copied = connection.execute(stmt.on_conflict_do_nothing()).rowcount
+        logger.info(f"Migrated {copied} candles from legacy table {name}")
+        legacy.drop(connection)
+
+# SQL turning a stored OHLCV value into NUMERIC, and NUMERIC into each stored form. SQLite
+# has no decimal type, so there values pass through REAL.
+_PRICE_SQL = {
+    'postgresql': (
+        {'numeric': '{}', 'double': '{}::numeric', 'scaled': f'{{}}::numeric / {PRICE_SCALE}'},
+        {'numeric': '{}', 'double': '({})::double precision', 'scaled': f'round(({{}}) * {PRICE_SCALE})::bigint'},
+    ),
+    'sqlite': (
+        {'numeric': '{}', 'double': '{}', 'scaled': f'({{}} / {PRICE_SCALE}.0)'},
+        {'numeric': '{}', 'double': 'CAST({} AS REAL)', 'scaled': f'CAST(round(({{}}) * {PRICE_SCALE}) AS INTEGER)'},
+    ),
+}
+
+def price_conversion_sql(dialect_name, column, source, target):
+    """
+    SQL expression converting `column` from the `source` to the `target` PRICE_STORAGE form
+    """
+    if dialect_name not in _PRICE_SQL:
+        raise ValueError(f"Price storage conversion isn't supported on {dialect_name}")
+    decode, encode = _PRICE_SQL[dialect_name]
+    return encode[target].format(decode[source].format(column))
+
+def migrate_price_storage(connection, target):
+    """
+    Convert the OHLCV columns of kline_data to the `target` PRICE_STORAGE mode in place and
+    return the mode they were in. PostgreSQL rewrites the partitions with one ALTER TABLE;
+    SQLite, which can't change a column's type, copies into a new table. Raises ValueError
+    for an unknown mode or values a 'scaled' BIGINT can't hold.
+    """
+    if target not in PRICE_TYPES:
+        raise ValueError(f"PRICE_STORAGE must be one of {', '.join(PRICE_TYPES)}, got '{target}'")
+    stored = Table(KLINE_TABLE, MetaData(), autoload_with=connection)
+    source = price_storage(stored)
+    if source == target:
+        return source
+    if target == 'scaled':
+        largest = connection.execute(select(*(func.max(func.abs(stored.c[name])) for name in PRICE_COLUMNS))).one()
+        if any(value is not None and float(value) * PRICE_SCALE >= 2 ** 63 for value in largest):
+            raise ValueError(f"Stored values over {2 ** 63 / PRICE_SCALE:.3g} don't fit 'scaled' storage")
+
+    dialect_name = connection.dialect.name
+    logger.info(f"Converting {KLINE_TABLE} prices from {source} to {target}")
+    if dialect_name == 'postgresql':
+        price_type = PRICE_TYPES[target]().compile(dialect=connection.dialect)
+        connection.exec_driver_sql(f"ALTER TABLE {KLINE_TABLE} " + ', '.join(
+            f"ALTER COLUMN {name} TYPE {price_type} USING {price_conversion_sql(dialect_name, name, source, target)}"
+            for name in PRICE_COLUMNS
+        ))
+    else:
+        converted = build_kline_table(MetaData(), target, name=f'{KLINE_TABLE}_converted')
+        converted.create(connection)
+        columns = [column.name for column in converted.columns]
+        connection.exec_driver_sql(
+            f"INSERT INTO {converted.name} ({', '.join(columns)}) SELECT " + ', '.join(
+                price_conversion_sql(dialect_name, name, source, target) if name in PRICE_COLUMNS else name
+                for name in columns
+            ) + f" FROM {KLINE_TABLE}"
+        )
+        stored.drop(connection)
+        connection.exec_driver_sql(f"ALTER TABLE {converted.name} RENAME TO {KLINE_TABLE}")
+    return source
+
+def rebuild_kline_coverage(connection):
+    """
+    Derive kline_coverage from the stored candles: each run of candles where one opens right
+    after the previous closes becomes one range. Used once, when the table is first created.
+    """
+    connection.execute(kline_coverage_table.delete())
+    connection.exec_driver_sql(f"""
+        INSERT INTO {kline_coverage_table.name} (symbol, interval, start_time, end_time)
+        SELECT symbol, interval, MIN(open_time), MAX(close_time) + 1
+        FROM (
+            SELECT symbol, interval, open_time, close_time,
+                   SUM(new_run) OVER (PARTITION BY symbol, interval ORDER BY open_time) AS run
+            FROM (
+                SELECT symbol, interval, open_time, close_time,
+                       CASE WHEN open_time = LAG(close_time) OVER (
+                           PARTITION BY symbol, interval ORDER BY open_time
+                       ) + 1 THEN 0 ELSE 1 END AS new_run
+                FROM {KLINE_TABLE}
+            ) marked
+        ) runs
+        GROUP BY symbol, interval, run
+    """)
 
 def init_db():
     logger.info("Initializing database...")
-    Base.metadata.create_all(engine)
-
-    inspector = inspect(engine)
-    
-    with engine.connect() as connection:
-        # Create partitions for different time ranges
-        for year in range(2023, 2025):  # Adjust the range as needed
-            for quarter in range(1, 5):
-                suffix = f"{year}q{quarter}"
-                partition_class = KLineData.create_partition(suffix)
-                if not inspector.has_table(partition_class.__tablename__):
-                    logger.info(f"Creating table: {partition_class.__tablename__}")
-                    partition_class.__table__.create(connection)
-    
-    logger.info("Database initialization complete.")
\ No newline at end of file
+
+    with engine.begin() as connection:
+        without_statement_timeout(connection)
+        migrate_legacy_kline_tables(connection)
+        coverage_exists = inspect(connection).has_table(kline_coverage_table.name)
+        Base.metadata.create_all(connection)
+        stored = price_storage(Table(KLINE_TABLE, MetaData(), autoload_with=connection))
+        if stored != Config.PRICE_STORAGE:
+            raise RuntimeError(
+                f"{KLINE_TABLE} stores prices as '{stored}' but PRICE_STORAGE is '{Config.PRICE_STORAGE}'; "
+                f"run python -m backend.database migrate-prices {Config.PRICE_STORAGE}"
+            )
+        ensure_partitions_ahead(connection)
+        if not coverage_exists:
+            logger.info("Building kline coverage index from stored candles")
+            rebuild_kline_coverage(connection)
+
+    logger.info("Database initialization complete.")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Database maintenance')
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate = commands.add_parser('migrate-prices', help='convert the stored OHLCV columns to a PRICE_STORAGE mode')
+    migrate.add_argument('mode', choices=sorted(PRICE_TYPES))
+    args = parser.parse_args()
+
+    Config.setup_logging()
+    with engine.begin() as connection:
+        without_statement_timeout(connection)
+        previous = migrate_price_storage(connection, args.mode)
+    if previous == args.mode:
+        logger.info(f"{KLINE_TABLE} already stores prices as {args.mode}")
+    else:
+        logger.info(f"Converted {KLINE_TABLE} prices from {previous} to {args.mode}; set PRICE_STORAGE={args.mode}")
@@ -0,0 +1,204 @@
+import hashlib
+import io
+import json
+import msgpack
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from flask import request, jsonify, Response
+from backend.data.storage import columns_to_records
+from backend.metrics import span
+
+JSON = 'application/json'
+ARROW = 'application/vnd.apache.arrow.stream'
+MSGPACK = 'application/msgpack'
+NDJSON = 'application/x-ndjson'
+
+# ?format= shortcuts for clients that can't set Accept, e.g. a browser address bar
+FORMAT_ALIASES = {'json': JSON, 'arrow': ARROW, 'msgpack': MSGPACK, 'ndjson': NDJSON}
+# Short format names labelling serialize spans
+FORMAT_NAMES = {**{mimetype: alias for alias, mimetype in FORMAT_ALIASES.items()}, 'application/x-msgpack': 'msgpack'}
+
+def negotiate_format():
+    """
+    Pick the response format from ?format= or the Accept header; JSON unless another
+    format is explicitly preferred
+    """
+    alias = request.args.get('format')
+    if alias in FORMAT_ALIASES:
+        return FORMAT_ALIASES[alias]
+    return request.accept_mimetypes.best_match([JSON, ARROW, MSGPACK, 'application/x-msgpack', NDJSON], default=JSON)
+
+def record_batch(columns):
+    # NumPy buffers are handed to Arrow without copying
+    return pa.RecordBatch.from_arrays([pa.array(values) for values in columns.values()], names=list(columns))
+
+def encode_arrow(columns):
+    """
+    Serialize column arrays as a single-batch Arrow IPC stream
+    """
+    batch = record_batch(columns)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+def encode_msgpack(columns):
+    """
+    Serialize column arrays as a MessagePack map of column name to array of numbers
+    """
+    return msgpack.packb({name: values.tolist() for name, values in columns.items()})
+
+def columns_response(columns, fmt, records=False):
+    """
+    Build the response for a dict of column arrays. JSON keeps each endpoint's existing
+    shape: a list of per-row objects when `records` is set, else a map of column lists.
+    """
+    if fmt == NDJSON:
+        return stream_response([columns], fmt)
+    with span('serialize', FORMAT_NAMES.get(fmt, 'json')) as timing:
+        if fmt == ARROW:
+            response = Response(encode_arrow(columns), mimetype=ARROW)
+        elif fmt in (MSGPACK, 'application/x-msgpack'):
+            response = Response(encode_msgpack(columns), mimetype=MSGPACK)
+        elif records:
+            response = jsonify(columns_to_records(columns))
+        else:
+            response = jsonify({name: values.tolist() for name, values in columns.items()})
+        timing.rows = len(next(iter(columns.values()), ()))
+        timing.nbytes = response.calculate_content_length()
+    response.vary.add('Accept')
+    return response
+
+def _stream_chunks(chunks, fmt):
+    # Each chunk's encoding is timed on its own, leaving out the reads producing the chunks
+    # and the writes of the server consuming them
+    name = FORMAT_NAMES.get(fmt, 'json')
+    if fmt == NDJSON:
+        for columns in chunks:
+            with span('serialize', name) as timing:
+                records = columns_to_records(columns)
+                # One dumps call per chunk; candle objects hold only numbers, so '}, {' only
+                # occurs between records
+                chunk = (json.dumps(records)[1:-1].replace('}, {', '}\n{') + '\n').encode() if records else b''
+                timing.rows, timing.nbytes = len(records), len(chunk)
+            if chunk:
+                yield chunk
+    elif fmt == ARROW:
+        # One record batch per chunk, flushed as soon as it is written
+        buffer, writer = io.BytesIO(), None
+        for columns in chunks:
+            with span('serialize', name) as timing:
+                batch = record_batch(columns)
+                writer = writer or pa.ipc.new_stream(buffer, batch.schema)
+                writer.write_batch(batch)
+                chunk = buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                timing.rows, timing.nbytes = batch.num_rows, len(chunk)
+            yield chunk
+        if writer is not None:
+            writer.close()
+            yield buffer.getvalue()
+    elif fmt in (MSGPACK, 'application/x-msgpack'):
+        # Concatenated column maps, one per chunk; msgpack.Unpacker reads them in turn
+        for columns in chunks:
+            with span('serialize', name) as timing:
+                chunk = encode_msgpack(columns)
+                timing.rows, timing.nbytes = len(columns['openTime']), len(chunk)
+            yield chunk
+    else:
+        separator = b'['
+        for columns in chunks:
+            with span('serialize', name) as timing:
+                records = columns_to_records(columns)
+                chunk = separator + json.dumps(records)[1:-1].encode() if records else b''
+                timing.rows, timing.nbytes = len(records), len(chunk)
+            if chunk:
+                yield chunk
+                separator = b','
+        yield b'[]' if separator == b'[' else b']'
+
+def _or_empty(chunks, empty):
+    produced = False
+    for columns in chunks:
+        produced = True
+        yield columns
+    if not produced and empty is not None:
+        yield empty
+
+def stream_response(chunks, fmt, empty=None):
+    """
+    Stream an iterable of column-array chunks (see storage.iter_kline_columns) as one
+    response, encoding each chunk as it is produced. JSON becomes a chunked array of
+    candle objects, NDJSON one candle object per line. `empty`, zero-length columns, is
+    encoded when there are no chunks, so an empty Arrow or MessagePack stream still has
+    its schema or column map like the buffered response.
+    """
+    mimetype = MSGPACK if fmt == 'application/x-msgpack' else fmt
+    response = Response(_stream_chunks(_or_empty(chunks, empty), fmt), mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+def decode_candles(body, mimetype):
+    """
+    Parse a POST /api/ingest body into a DataFrame with one row per candle: a JSON array of
+    candle objects or a JSON object of column lists, NDJSON candle objects, an Arrow IPC
+    stream, or a MessagePack column map. Symbol and interval may be columns (a single string
+    applies to every row). Raises ValueError for a body that can't be parsed.
+    """
+    if mimetype == ARROW:
+        with pa.ipc.open_stream(body) as reader:
+            return reader.read_pandas()
+    if mimetype in (MSGPACK, 'application/x-msgpack'):
+        data = msgpack.unpackb(body)
+    elif mimetype == NDJSON:
+        data = [json.loads(line) for line in body.splitlines() if line.strip()]
+    else:
+        data = json.loads(body)
+    if isinstance(data, dict):
+        # Scalars such as "symbol": "BTCUSDT" are broadcast over the column lists
+        return pd.DataFrame({name: values if isinstance(values, list) else [values] * _column_length(data)
+                             for name, values in data.items()})
+    if isinstance(data, list) and all(isinstance(item, dict) for item in data):
+        return pd.DataFrame.from_records(data)
+    raise ValueError("Expected candle objects or a map of columns")
+
+def _column_length(data):
+    return max((len(values) for values in data.values() if isinstance(values, list)), default=0)
+
+def response_etag(version):
+    """
+    Strong ETag for the current request given the version of the data behind it (see
+    storage.series_version). The URL and negotiated format are part of it, since responses
+    vary on Accept.
+    """
+    key = (request.path, sorted(request.args.items(multi=True)), negotiate_format(), version)
+    return hashlib.sha1(repr(key).encode()).hexdigest()[:32]
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.vary.add('Accept')
+    return response
+
+def sse_message(event, data):
+    """
+    Encode one Server-Sent Events message carrying `data` as JSON
+    """
+    return f"event: {event}\ndata: {json.dumps(data, allow_nan=False)}\n\n"
+
+def json_columns(columns):
+    """
+    Column arrays as lists with NaN replaced by None, for strict JSON consumers
+    """
+    return {
+        name: [None if value != value else value for value in values.tolist()]
+        for name, values in columns.items()
+    }
+
+def empty_columns(fields):
+    """
+    Zero-length columns for an indicator with no data: int64 timestamps, float64 values
+    """
+    return {field: np.empty(0, dtype=np.int64 if field == 'timestamps' else np.float64) for field in fields}
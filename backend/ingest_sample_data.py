@@ -6,7 +6,9 @@ BASE_URL = "http://localhost:5001/api"
 
 def generate_sample_data(symbol, interval, start_time, end_time, step):
     data = []
-    current_time = start_time
+    # Candles open on multiples of their interval
+    step_ms = int(step.total_seconds() * 1000)
+    current_time = datetime.fromtimestamp(int(start_time.timestamp() * 1000) // step_ms * step_ms / 1000)
     while current_time < end_time:
         price = 35000 + (current_time.timestamp() % 1000)  # Simple price variation
         kline = {
@@ -37,7 +39,7 @@ if __name__ == "__main__":
     intervals = {
         "1m": timedelta(minutes=1),
         "5m": timedelta(minutes=5),
-        "60m": timedelta(hours=1)
+        "1h": timedelta(hours=1)
     }
 
     for interval, step in intervals.items():
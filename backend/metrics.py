@@ -0,0 +1,127 @@
+import bisect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds in seconds of the stage duration histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+PREFIX = 'quantm'
+
+class Span:
+    """
+    Timing of one stage; set `rows` and `nbytes` inside the block to record its volume
+    """
+    __slots__ = ('rows', 'nbytes')
+
+    def __init__(self):
+        self.rows = None
+        self.nbytes = None
+
+class StageMetrics:
+    """
+    Thread-safe per (stage, detail) duration histograms with row and byte counters,
+    rendered in the Prometheus text format
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._series = {}  # (stage, detail) -> [bucket counts..., count, seconds, rows, bytes]
+        self._lock = threading.Lock()
+
+    def observe(self, stage, detail, seconds, rows=None, nbytes=None):
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get((stage, detail))
+            if series is None:
+                series = self._series[(stage, detail)] = [0] * (len(self.buckets) + 5)
+            series[bucket] += 1  # the slot after the last bound is +Inf
+            series[-4] += 1
+            series[-3] += seconds
+            series[-2] += rows or 0
+            series[-1] += nbytes or 0
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    def render(self):
+        lines = [
+            f'# HELP {PREFIX}_stage_seconds Time spent in each hot-path stage',
+            f'# TYPE {PREFIX}_stage_seconds histogram',
+        ]
+        snapshot = sorted(self.snapshot().items())
+        for (stage, detail), series in snapshot:
+            labels = f'stage="{stage}",detail="{detail}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append(f'{PREFIX}_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{PREFIX}_stage_seconds_sum{{{labels}}} {series[-3]}')
+            lines.append(f'{PREFIX}_stage_seconds_count{{{labels}}} {series[-4]}')
+        for name, index, help_text in (('rows', -2, 'Rows handled'), ('bytes', -1, 'Bytes produced or received')):
+            lines.append(f'# HELP {PREFIX}_stage_{name}_total {help_text} by each hot-path stage')
+            lines.append(f'# TYPE {PREFIX}_stage_{name}_total counter')
+            for (stage, detail), series in snapshot:
+                lines.append(f'{PREFIX}_stage_{name}_total{{stage="{stage}",detail="{detail}"}} {series[index]}')
+        return '\n'.join(lines) + '\n'
+
+stage_metrics = StageMetrics()
+
+# Spans of the current request, set while a Server-Timing header is being collected. It
+# reaches asyncio.to_thread workers because they run in a copy of the request's context.
+_request_spans = ContextVar('request_spans', default=None)
+
+@contextmanager
+def span(stage, detail=''):
+    """
+    Time a block as `stage` (fetch, store, query, convert, compute, serialize, ...) with an
+    optional low-cardinality `detail` such as an indicator or format name:
+
+        with span('query') as timing:
+            rows = connection.execute(stmt).all()
+            timing.rows = len(rows)
+    """
+    timing = Span()
+    started = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_metrics.observe(stage, detail, elapsed, timing.rows, timing.nbytes)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+def collect_request_spans():
+    """
+    Start collecting the spans of the current request; returns the list they are added to
+    """
+    spans = []
+    _request_spans.set(spans)
+    return spans
+
+def server_timing(spans):
+    """
+    Server-Timing header value with the total milliseconds per stage, in first-seen order
+    """
+    totals = {}
+    for stage, elapsed in spans:
+        totals[stage] = totals.get(stage, 0.) + elapsed
+    return ', '.join(f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in totals.items())
+
+def render_stats(group, stats, counters=()):
+    """
+    Prometheus text for a component's stats() dict as quantm_<group>_<name> samples: names
+    in `counters` become counters, other numbers gauges, and anything else is skipped
+    """
+    lines = []
+    for name, value in stats.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        kind = 'counter' if name in counters else 'gauge'
+        metric = f"{PREFIX}_{group}_{re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()}" + ('_total' if kind == 'counter' else '')
+        lines += [f'# HELP {metric} {group} {name}', f'# TYPE {metric} {kind}', f'{metric} {value}']
+    return '\n'.join(lines) + '\n' if lines else ''
@@ -1,15 +1,88 @@
-from flask import Blueprint, request, jsonify
-from backend.data.processing import process_kline_data, get_macd, get_rsi
-from backend.data.storage import get_kline_data
+from flask import Blueprint, Response, g, request, jsonify
+from backend.data.processing import get_macd, get_rsi, indicator_cache
+from backend.data.cache import SingleFlight
+from backend.data.coverage import ensure_coverage, fill_locks
+from backend.data.batch import parse_specs, get_indicator_batch
+from backend.data.screener import Screen, run_screen
+from backend.data.backtest import Strategy, run_backtest, run_sweep, strategies_for_grid
+from backend.data import storage
+from backend.data.storage import get_kline_columns, iter_kline_columns, rows_to_columns, series_version
+from backend.data.downsample import downsample_candles, downsample_series
+from backend.formats import (
+    NDJSON, negotiate_format, columns_response, stream_response, empty_columns, sse_message, json_columns,
+    response_etag, not_modified, decode_candles,
+)
+from backend.data.events import hub
+from backend.data.buffer import write_buffer
+from backend.data.ingest import InvalidCandles, group_candles, validate_candles
+from backend.data import scheduler
+from backend.database import pool_stats
+from backend.metrics import stage_metrics, collect_request_spans, server_timing, render_stats
+from backend.config import Config
 from flask_cors import CORS
 import asyncio
 import logging
 
 api = Blueprint('api', __name__)
 CORS(api)
+# Operational endpoints served outside /api, such as /metrics for Prometheus
+ops = Blueprint('ops', __name__)
 
 logger = logging.getLogger(__name__)
 
+class InvalidParameter(ValueError):
+    pass
+
+# Identical chart requests in flight share one read, computation and encoding
+response_flights = SingleFlight('response')
+
+@api.before_request
+def start_server_timing():
+    if Config.SERVER_TIMING:
+        g.spans = collect_request_spans()
+
+@api.after_request
+def add_server_timing(response):
+    # Streamed bodies are encoded after this runs, so their serialize time isn't included
+    spans = g.pop('spans', None)
+    if spans:
+        response.headers['Server-Timing'] = server_timing(spans)
+    return response
+
+async def series_etag(symbol, interval, start_time, end_time):
+    """
+    ETag of a response built from the stored candles of [start_time, end_time]. Indicators
+    carry state from every earlier candle, so their routes pass 0 as start_time.
+    """
+    return response_etag(await asyncio.to_thread(series_version, symbol, interval, start_time, end_time))
+
+async def shared_response(build, etag):
+    """
+    Run `build()`, which returns a Response, in a worker thread and tag it with `etag`.
+    Requests for the same URL, format and ETag arriving while it runs wait for its body
+    instead of building their own; a write changing the ETag starts a new build.
+    """
+    key = (request.path, tuple(sorted(request.args.items(multi=True))), negotiate_format(), etag)
+
+    def render():
+        response = build()
+        return response.status_code, response.mimetype, response.get_data()
+
+    status, mimetype, body = await asyncio.to_thread(response_flights.do, key, render)
+    response = Response(body, status=status, mimetype=mimetype)
+    response.vary.add('Accept')
+    response.set_etag(etag)
+    return response
+
+def get_max_points():
+    """
+    Optional maxPoints query parameter bounding the rows returned; None when absent
+    """
+    max_points = request.args.get('maxPoints', type=int)
+    if max_points is not None and max_points < 1:
+        raise InvalidParameter('maxPoints must be a positive integer')
+    return max_points
+
 @api.route('/kline', methods=['GET'])
 async def kline():
     try:
@@ -17,13 +90,28 @@ async def kline():
         interval = request.args.get('interval', '1m')
         start_time = int(request.args.get('startTime', 0))
         end_time = int(request.args.get('endTime', 0))
+        max_points = get_max_points()
+        fmt = negotiate_format()
         
         logger.info(f"Fetching kline data for {symbol} with interval {interval}")
-        data = await asyncio.to_thread(get_kline_data, symbol, interval, start_time, end_time)
-        if not data:
-            logger.info(f"No data found, processing new data for {symbol}")
-            data = await asyncio.to_thread(process_kline_data, symbol, start_time, end_time, interval)
-        return jsonify(data)
+        # Fetch only the sub-ranges that aren't stored yet, then serve everything from storage
+        await asyncio.to_thread(ensure_coverage, symbol, interval, start_time, end_time)
+
+        # NDJSON, or stream=true with any format, sends the range in chunks as it is read;
+        # maxPoints already bounds the response so it takes the buffered path
+        if max_points is None and (fmt == NDJSON or request.args.get('stream') in ('1', 'true')):
+            return stream_response(iter_kline_columns(symbol, interval, start_time, end_time), fmt, rows_to_columns([]))
+        etag = await series_etag(symbol, interval, start_time, end_time)
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+
+        def build():
+            columns = get_kline_columns(symbol, interval, start_time, end_time)
+            return columns_response(downsample_candles(columns, max_points), fmt, records=True)
+        response = await shared_response(build, etag)
+        return response
+    except InvalidParameter as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in kline endpoint: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -35,14 +123,24 @@ async def macd():
         interval = request.args.get('interval', '1h')
         start_time = int(request.args.get('startTime', 0))
         end_time = int(request.args.get('endTime', 0))
+        max_points = get_max_points()
+        fmt = negotiate_format()
         
         logger.info(f"Calculating MACD for {symbol} with interval {interval}")
-        macd_data = await asyncio.to_thread(get_macd, symbol, interval, start_time, end_time)
-        if not macd_data:
-            logger.warning(f"No MACD data available for {symbol}")
-            return jsonify({'macd': [], 'signal': [], 'histogram': [], 'timestamps': []}), 200
-        
-        return jsonify(macd_data)
+        etag = await series_etag(symbol, interval, 0, end_time)
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+
+        def build():
+            macd_data = get_macd(symbol, interval, start_time, end_time)
+            if not macd_data:
+                logger.warning(f"No MACD data available for {symbol}")
+                return columns_response(empty_columns(['macd', 'signal', 'histogram', 'timestamps']), fmt)
+            return columns_response(downsample_series(macd_data, max_points, 'macd'), fmt)
+        response = await shared_response(build, etag)
+        return response
+    except InvalidParameter as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in MACD endpoint: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -54,22 +152,314 @@ async def rsi():
         interval = request.args.get('interval', '1h')
         start_time = int(request.args.get('startTime', 0))
         end_time = int(request.args.get('endTime', 0))
+        max_points = get_max_points()
+        fmt = negotiate_format()
         
         logger.info(f"Calculating RSI for {symbol} with interval {interval}")
-        rsi_data = await asyncio.to_thread(get_rsi, symbol, interval, start_time, end_time)
-        if not rsi_data:
-            logger.warning(f"No RSI data available for {symbol}")
-            return jsonify({'rsi': [], 'timestamps': []}), 200
-        
-        return jsonify(rsi_data)
+        etag = await series_etag(symbol, interval, 0, end_time)
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+
+        def build():
+            rsi_data = get_rsi(symbol, interval, start_time, end_time)
+            if not rsi_data:
+                logger.warning(f"No RSI data available for {symbol}")
+                return columns_response(empty_columns(['rsi', 'timestamps']), fmt)
+            return columns_response(downsample_series(rsi_data, max_points, 'rsi'), fmt)
+        response = await shared_response(build, etag)
+        return response
+    except InvalidParameter as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in RSI endpoint: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@api.route('/indicators', methods=['GET'])
+async def indicators():
+    """
+    Several indicators over one candle range, e.g. ?indicators=macd(12,26,9),rsi(14),bbands,
+    computed from a single read and returned as columns aligned to one 'timestamps' vector
+    """
+    try:
+        symbol = request.args.get('symbol', 'BTCUSDT')
+        interval = request.args.get('interval', '1h')
+        start_time = int(request.args.get('startTime', 0))
+        end_time = int(request.args.get('endTime', 0))
+        max_points = get_max_points()
+        fmt = negotiate_format()
+        try:
+            specs = parse_specs(request.args.get('indicators', ''))
+        except ValueError as e:
+            raise InvalidParameter(str(e))
+
+        logger.info(f"Calculating {len(specs)} indicators for {symbol} with interval {interval}")
+        etag = await series_etag(symbol, interval, 0, end_time)
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+
+        def build():
+            result = get_indicator_batch(symbol, interval, start_time, end_time, specs)
+            if not result:
+                logger.warning(f"No indicator data available for {symbol}")
+                fields = ['timestamps'] + [column for spec in specs for column in spec.columns()]
+                return columns_response(empty_columns(fields), fmt)
+            # Points are picked on the first requested indicator and kept for every column
+            return columns_response(downsample_series(result, max_points, specs[0].columns()[0]), fmt)
+        response = await shared_response(build, etag)
+        return response
+    except InvalidParameter as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in indicators endpoint: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api.route('/screener', methods=['GET'])
+async def screener():
+    """
+    Symbols whose last closed candle passes every ';'-separated condition, e.g.
+    ?interval=1h&conditions=rsi(14) < 30; macd(12,26,9).macd crosses_above macd(12,26,9).signal within 3
+    Optional ?symbols=A,B limits the scan; by default every stored symbol is screened.
+    """
+    try:
+        interval = request.args.get('interval', '1h')
+        symbols = [symbol for symbol in request.args.get('symbols', '').split(',') if symbol]
+        try:
+            screen = Screen(request.args.get('conditions', ''))
+        except ValueError as e:
+            raise InvalidParameter(str(e))
+
+        logger.info(f"Screening {len(symbols) or 'all'} symbols with interval {interval}")
+        return jsonify(await asyncio.to_thread(run_screen, screen, interval, symbols))
+    except InvalidParameter as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in screener endpoint: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def get_backtest_request():
+    """
+    Common fields of a backtest JSON body; entry and exit are screener conditions
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise InvalidParameter('Expected a JSON object body')
+    for field in ('entry', 'exit'):
+        if not isinstance(body.get(field), str):
+            raise InvalidParameter(f"'{field}' must be a string of conditions")
+    try:
+        return body, int(body.get('startTime', 0)), int(body.get('endTime', 0))
+    except (TypeError, ValueError):
+        raise InvalidParameter('startTime and endTime must be integers')
+
+@api.route('/backtest', methods=['POST'])
+async def backtest():
+    """
+    Long-only backtest of {"entry": ..., "exit": ..., "fee": 0.001, "size": 1} over stored
+    candles; returns metrics, trades and the equity curve (bounded by ?maxPoints)
+    """
+    try:
+        body, start_time, end_time = get_backtest_request()
+        symbol = body.get('symbol', 'BTCUSDT')
+        interval = body.get('interval', '1h')
+        max_points = get_max_points()
+        try:
+            strategy = Strategy(body['entry'], body['exit'], body.get('fee'), body.get('size'))
+        except (TypeError, ValueError) as e:
+            raise InvalidParameter(str(e))
+
+        logger.info(f"Backtesting {symbol} with interval {interval}")
+        result = await asyncio.to_thread(run_backtest, strategy, symbol, interval, start_time, end_time)
+        if result is None:
+            return jsonify({'error': 'No candles stored in the backtest range'}), 404
+        equity = downsample_series(result['equity'], max_points, 'equity')
+        return jsonify({**result, 'equity': {name: values.tolist() for name, values in equity.items()}})
+    except InvalidParameter as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in backtest endpoint: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api.route('/backtest/sweep', methods=['POST'])
+async def backtest_sweep():
+    """
+    Backtest every combination of "grid" ({"fast": [8, 12], ...}) filled into the '{fast}'
+    placeholders of "entry" and "exit", across the worker processes. Returns the "top"
+    combinations (default 20) by total return.
+    """
+    try:
+        body, start_time, end_time = get_backtest_request()
+        symbol = body.get('symbol', 'BTCUSDT')
+        interval = body.get('interval', '1h')
+        grid = body.get('grid')
+        top = body.get('top', 20)
+        if not isinstance(grid, dict) or not isinstance(top, int) or top < 1:
+            raise InvalidParameter("'grid' must be an object of value lists and 'top' a positive integer")
+
+        try:
+            combinations, strategies = strategies_for_grid(body['entry'], body['exit'], grid, body.get('fee'), body.get('size'))
+        except (TypeError, ValueError) as e:
+            raise InvalidParameter(str(e))
+
+        logger.info(f"Sweeping {len(strategies)} backtests for {symbol} with interval {interval}")
+        result = await asyncio.to_thread(run_sweep, combinations, strategies, symbol, interval, start_time, end_time)
+        if result is None:
+            return jsonify({'error': 'No candles stored in the backtest range'}), 404
+        return jsonify({**result, 'results': result['results'][:top]})
+    except InvalidParameter as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in backtest sweep endpoint: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+# Indicators /api/stream can attach to each candle event
+STREAM_INDICATORS = {'macd': get_macd, 'rsi': get_rsi}
+
+def stream_params(args):
+    """
+    (symbol, interval, indicators) of a /api/stream request's query arguments
+    """
+    symbol = args.get('symbol', 'BTCUSDT')
+    interval = args.get('interval', '1m')
+    indicators = [name for name in args.get('indicators', '').split(',') if name]
+    unknown = set(indicators) - set(STREAM_INDICATORS)
+    if unknown:
+        raise InvalidParameter(f"Unknown indicators: {', '.join(sorted(unknown))}")
+    return symbol, interval, indicators
+
+def stream_message(symbol, interval, indicators, event):
+    """
+    The 'candles' SSE message for a hub event, with the indicator values at its candles.
+    Reads the indicators from storage, so it blocks.
+    """
+    open_times = [candle['openTime'] for candle in event['candles']]
+    for name in indicators:
+        result = STREAM_INDICATORS[name](symbol, interval, open_times[0], open_times[-1])
+        event = {**event, name: json_columns(result) if result else None}
+    return sse_message('candles', event)
+
+# Sent when no event arrived for EVENT_HEARTBEAT_SECONDS. Keeps proxies from timing out and
+# detects disconnected clients.
+KEEP_ALIVE = ': keep-alive\n\n'
+
+@api.route('/stream', methods=['GET'])
+def stream():
+    """
+    Server-Sent Events feed of candle upserts for one (symbol, interval). Each 'candles'
+    event carries the written candles and, for ?indicators=macd,rsi, the indicator values
+    at those candles. A 'lagged' event reports events dropped because the client read too
+    slowly; it should re-read the range over REST.
+
+    This holds a request thread per subscriber; backend.asgi serves the same feed from the
+    event loop instead.
+    """
+    try:
+        symbol, interval, indicators = stream_params(request.args)
+    except InvalidParameter as e:
+        return jsonify({'error': str(e)}), 400
+
+    subscription = hub.subscribe(symbol, interval)
+    logger.info(f"Stream subscriber added for {symbol} {interval}")
+
+    def events():
+        try:
+            while True:
+                event = subscription.get(timeout=Config.EVENT_HEARTBEAT_SECONDS)
+                dropped = subscription.take_dropped()
+                if dropped:
+                    yield sse_message('lagged', {'dropped': dropped})
+                if event is None:
+                    yield KEEP_ALIVE
+                    continue
+                yield stream_message(symbol, interval, indicators, event)
+        except Exception as e:
+            logger.error(f"Error in stream for {symbol} {interval}: {str(e)}")
+        finally:
+            hub.unsubscribe(subscription)
+            logger.info(f"Stream subscriber removed for {symbol} {interval}")
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@api.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(indicator_cache.stats())
+
+@api.route('/db/pool', methods=['GET'])
+def db_pool_stats():
+    # Connections in use against the pool's capacity, and how long checkouts waited
+    return jsonify(pool_stats())
+
+@ops.route('/metrics', methods=['GET'])
+def metrics():
+    # Per-stage time, rows and bytes, plus the pool and cache counters, in Prometheus text format
+    body = ''.join([
+        stage_metrics.render(),
+        render_stats('db_pool', pool_stats(), counters=('checkouts', 'timeouts')),
+        render_stats('indicator_cache', indicator_cache.stats(),
+                     counters=('hits', 'misses', 'evictions', 'expirations', 'invalidations', 'coalesced')),
+        render_stats('response_flights', response_flights.stats(), counters=('runs', 'shared')),
+        render_stats('coverage_fills', fill_locks.stats(), counters=('fills', 'waits')),
+        render_stats('write_buffer', write_buffer.stats(),
+                     counters=('accepted', 'rejected', 'written', 'deduplicated', 'failed', 'flushes')),
+        render_stats('hot_tier', storage.hot_tier.stats() if storage.hot_tier else {},
+                     counters=('hits', 'exports', 'invalidations')),
+    ])
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api.route('/ingest', methods=['POST'])
+def ingest():
+    # Validate a batch of candles pushed by a collector and hand it to the write buffer; 202
+    # once buffered, 503 while the buffer is too full to take it
+    try:
+        frame = decode_candles(request.get_data(), request.mimetype)
+        batches = group_candles(frame, request.args.get('symbol'), request.args.get('interval'))
+        problems, valid = [], []
+        for symbol, interval, columns in batches:
+            batch_problems, typed = validate_candles(symbol, interval, columns)
+            problems += batch_problems
+            valid.append((symbol, interval, typed))
+        if problems:
+            raise InvalidCandles('Invalid candles', problems)
+
+        candles = len(frame)
+        if candles > write_buffer.max_candles:
+            return jsonify({'error': f'Batch of {candles} candles is over WRITE_BUFFER_MAX_CANDLES ({write_buffer.max_candles})'}), 413
+        if write_buffer.put(valid) is None:
+            response = jsonify({'error': 'Write buffer is full, retry later', **write_buffer.stats()})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+        logger.info(f"Buffered {candles} ingested candles in {len(valid)} batches")
+        return jsonify({
+            'accepted': candles,
+            'batches': [{'symbol': symbol, 'interval': interval, 'candles': len(columns['openTime'])}
+                        for symbol, interval, columns in valid],
+            'bufferedCandles': write_buffer.stats()['bufferedCandles'],
+        }), 202
+    except InvalidCandles as e:
+        return jsonify({'error': str(e), 'problems': e.problems}), 400
+    except ValueError as e:
+        return jsonify({'error': f'Unreadable ingest body: {e}'}), 400
+    except Exception as e:
+        logger.error(f"Error in ingest endpoint: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api.route('/ingest/buffer', methods=['GET'])
+def write_buffer_stats():
+    # Candles waiting in the write buffer, and its commit totals so far
+    return jsonify(write_buffer.stats())
+
+@api.route('/ingest/jobs', methods=['GET'])
+def ingest_jobs():
+    # Per symbol/interval lag and progress of the live ingestion scheduler, if it runs here
+    if scheduler.active_scheduler is None:
+        return jsonify([])
+    return jsonify(scheduler.active_scheduler.metrics())
+
 @api.route('/symbols', methods=['GET'])
 def symbols():
     try:
-        symbols = ['BTCUSDT']
+        symbols = sorted(set(Config.INGEST_SYMBOLS))
         logger.info("Fetching available symbols")
         return jsonify(symbols)
     except Exception as e:
@@ -34,5 +34,12 @@ class TestAPI(unittest.TestCase):
         self.assertIsInstance(data, list)
         self.assertIn('BTCUSDT', data)
 
+    def test_db_pool_endpoint(self):
+        response = self.client.get('/api/db/pool')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertIn('checkedOut', data)
+        self.assertGreater(data['checkouts'], 0)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
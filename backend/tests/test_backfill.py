@@ -0,0 +1,129 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from sqlalchemy import create_engine
+from backend.database import Base
+from backend.data import coverage, indicators, storage
+from backend.data.backfill import BackfillCheckpoint, WeightBudget, backfill_async, main, split_windows
+from backend.data.buffer import WriteBuffer
+from backend.data.coverage import missing_ranges
+
+HOUR = 3600000
+START = 1704067200000  # 2024-01-01 00:00 UTC
+
+class FakeBinance:
+    """
+    Serves /api/v3/klines for an hourly series covering [START, START + 5000h), reporting
+    the weight used this minute like the real exchange does
+    """
+
+    def __init__(self, fail_first=0):
+        self.requests = []
+        self.used_weight = 0
+        self.fail_first = fail_first
+        self.app = web.Application()
+        self.app.router.add_get('/api/v3/klines', self.klines)
+
+    async def klines(self, request):
+        self.requests.append(dict(request.query))
+        self.used_weight += 2
+        headers = {'X-MBX-USED-WEIGHT-1M': str(self.used_weight)}
+        if self.fail_first:
+            self.fail_first -= 1
+            return web.json_response({'code': -1003}, status=429, headers={**headers, 'Retry-After': '0'})
+
+        start, end = int(request.query['startTime']), int(request.query['endTime'])
+        limit = int(request.query['limit'])
+        first = max(start, START)
+        first += -(first - START) % HOUR
+        open_times = range(first, min(end + 1, START + 5000 * HOUR), HOUR)[:limit]
+        klines = [
+            [t, '100.0', '101.0', '99.0', str(100.0 + (t - START) / HOUR), '5.0', t + HOUR - 1]
+            for t in open_times
+        ]
+        return web.json_response(klines, headers=headers)
+
+class TestBackfill(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.exchange = FakeBinance()
+        self.server = TestServer(self.exchange.app)
+        await self.server.start_server()
+        self.base_url = str(self.server.make_url('')).rstrip('/')
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.written = []
+
+    async def asyncTearDown(self):
+        await self.server.close()
+        self.tmpdir.cleanup()
+
+    def writer(self, symbol, interval, candles):
+        self.written.append(candles)
+
+    def checkpoint(self, start, end):
+        return BackfillCheckpoint.for_job('BTCUSDT', '1h', start, end, directory=self.tmpdir.name)
+
+    async def test_backfill_streams_every_window(self):
+        end = START + 3500 * HOUR
+        stats = await backfill_async('BTCUSDT', '1h', START, end, writer=self.writer,
+                                     checkpoint=self.checkpoint(START, end), base_url=self.base_url, concurrency=3)
+
+        self.assertEqual(stats, {'windows': 4, 'candles': 3500, 'failed': 0})
+        self.assertEqual(len(self.written), 4)
+        open_times = sorted(c['openTime'] for window in self.written for c in window)
+        self.assertEqual(open_times, list(range(START, end, HOUR)))
+
+    async def test_resume_skips_completed_windows(self):
+        end = START + 3500 * HOUR
+        checkpoint = self.checkpoint(START, end)
+        checkpoint.mark_done(START)
+        checkpoint.mark_done(START + 2000 * HOUR)
+
+        resumed = self.checkpoint(START, end)
+        stats = await backfill_async('BTCUSDT', '1h', START, end, writer=self.writer,
+                                     checkpoint=resumed, base_url=self.base_url)
+
+        self.assertEqual(stats['windows'], 2)
+        self.assertEqual(sorted(int(r['startTime']) for r in self.exchange.requests),
+                         [START + 1000 * HOUR, START + 3000 * HOUR])
+        self.assertEqual(resumed.done, {start for start, _ in split_windows('1h', START, end)})
+        self.assertTrue(os.path.exists(resumed.path))
+
+    async def test_rate_limited_window_is_retried(self):
+        self.exchange.fail_first = 1
+        end = START + 10 * HOUR
+        stats = await backfill_async('BTCUSDT', '1h', START, end, writer=self.writer,
+                                     checkpoint=self.checkpoint(START, end), base_url=self.base_url)
+
+        self.assertEqual(stats['candles'], 10)
+        self.assertEqual(len(self.exchange.requests), 2)
+
+    async def test_cli_updates_coverage(self):
+        engine = create_engine(f"sqlite:///{os.path.join(self.tmpdir.name, 'klines.db')}")
+        self.addCleanup(engine.dispose)
+        Base.metadata.create_all(engine)
+        end = START + 1500 * HOUR
+        with patch.object(storage, 'engine', engine), patch.object(coverage, 'engine', engine), \
+                patch.object(indicators, 'engine', engine), patch.object(storage, '_save_listeners', []), \
+                patch('backend.data.backfill.write_buffer', WriteBuffer(10000, 1000, 0.1)), \
+                patch('backend.data.backfill.BINANCE_API_URL', self.base_url), \
+                patch('backend.data.backfill.Config.BACKFILL_CHECKPOINT_DIR', self.tmpdir.name):
+            stats = await asyncio.to_thread(main, ['BTCUSDT', '1h', str(START), str(end)])
+            self.assertEqual(stats['candles'], 1500)
+            # A later /api/kline read of the range has nothing left to fetch
+            self.assertEqual(missing_ranges('BTCUSDT', '1h', START, end - 1), [])
+
+    async def test_budget_waits_for_next_window(self):
+        budget = WeightBudget(limit=4, window_seconds=1)
+        budget.update(4)
+        exhausted_window = budget.window_start
+        await budget.acquire(2)
+        self.assertGreater(budget.window_start, exhausted_window)
+        self.assertEqual(budget.used, 2)
+
+if __name__ == '__main__':
+    unittest.main()
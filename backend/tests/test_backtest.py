@@ -0,0 +1,114 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+from backend.app import create_app
+from backend.benchmarks.synthetic import synthetic_candles
+from backend.data import backtest
+from backend.data.backtest import Strategy, positions, simulate, run_backtest, strategies_for_grid, sweep_universe
+from backend.data.parallel import Universe
+
+def reference(open_, close, entries, exits, fee, size):
+    # The per-candle loop the vectorized engine replaces
+    equity, held, curve, position = 1.0, False, [], []
+    for i in range(len(close)):
+        if i and not held and entries[i - 1] and not exits[i - 1]:
+            held, start, entry_price = True, equity, open_[i]
+        elif i and held and exits[i - 1]:
+            held, equity = False, start * ((1 - size) + size * (1 - fee) ** 2 * open_[i] / entry_price)
+        position.append(held)
+        curve.append(start * ((1 - size) + size * (1 - fee) * close[i] / entry_price) if held else equity)
+    if held:
+        equity = start * ((1 - size) + size * (1 - fee) ** 2 * close[-1] / entry_price)
+    return np.array(position), np.array(curve), equity
+
+class TestBacktest(unittest.TestCase):
+
+    def test_matches_per_candle_loop(self):
+        rng = np.random.default_rng(4)
+        columns = synthetic_candles(5000, seed=4)
+        for fee, size in ((0.0, 1.0), (0.001, 1.0), (0.002, 0.25)):
+            entries, exits = rng.random(5000) < 0.02, rng.random(5000) < 0.02
+            held = positions(entries, exits)
+            equity, multipliers, _, _ = simulate(columns['open'], columns['close'], held, fee, size)
+
+            expected_held, expected_curve, expected_final = reference(columns['open'], columns['close'], entries, exits, fee, size)
+            np.testing.assert_array_equal(held, expected_held)
+            np.testing.assert_allclose(equity, expected_curve, rtol=1e-12)
+            self.assertAlmostEqual(np.prod(multipliers), expected_final, places=12)
+
+    def test_fills_at_next_open_and_charges_fees(self):
+        open_ = np.array([10., 10., 11., 12., 13., 14.])
+        close = np.array([10., 11., 12., 13., 14., 15.])
+        entries = np.array([True, False, False, False, False, False])
+        exits = np.array([False, False, True, False, False, False])
+        held = positions(entries, exits)
+        equity, multipliers, entry_bars, exit_bars = simulate(open_, close, held, fee=0.01, size=0.5)
+
+        np.testing.assert_array_equal(held, [False, True, True, False, False, False])
+        self.assertEqual((entry_bars.tolist(), exit_bars.tolist()), ([1], [3]))
+        # Half the equity bought at 10 and sold at 12, paying 1% on both fills
+        self.assertAlmostEqual(multipliers[0], 0.5 + 0.5 * 0.99 * 0.99 * 1.2)
+        self.assertAlmostEqual(equity[2], 0.5 + 0.5 * 0.99 * 1.2)
+        self.assertEqual(equity[-1], multipliers[0])
+
+    def test_run_backtest_warms_up_before_the_range(self):
+        columns = synthetic_candles(3000, seed=1)
+        start = int(columns['openTime'][1000])
+
+        def get_kline_columns(symbol, interval, start_time, end_time):
+            selected = (columns['openTime'] >= start_time) & (columns['openTime'] <= end_time)
+            return {name: values[selected] for name, values in columns.items()}
+
+        strategy = Strategy('macd.macd crosses_above macd.signal', 'macd.macd crosses_below macd.signal', fee=0)
+        with patch.object(backtest, 'get_kline_columns', get_kline_columns):
+            result = run_backtest(strategy, 'BTCUSDT', '1m', start, int(columns['openTime'][-1]))
+            self.assertIsNone(run_backtest(strategy, 'BTCUSDT', '1m', 2 ** 50, 2 ** 51))
+
+        self.assertEqual(result['equity']['timestamps'][0], start)
+        self.assertEqual(len(result['equity']['equity']), 2000)
+        self.assertGreater(result['metrics']['trades'], 10)
+        self.assertEqual(result['metrics']['trades'], len(result['trades']))
+        self.assertTrue(all(trade['entryTime'] >= start for trade in result['trades']))
+        compounded = np.prod([1 + trade['return'] for trade in result['trades']])
+        self.assertAlmostEqual(result['metrics']['totalReturn'], compounded - 1)
+
+    def test_sweep_over_process_pool(self):
+        combinations, strategies = strategies_for_grid(
+            'macd({fast},26,9).macd crosses_above macd({fast},26,9).signal; rsi(14) < {rsi}',
+            'macd({fast},26,9).macd crosses_below macd({fast},26,9).signal',
+            {'fast': [8, 12], 'rsi': [60, 80, 100]},
+        )
+        self.assertEqual(combinations[1], {'fast': 8, 'rsi': 80})
+        with Universe.from_columns('BTCUSDT', synthetic_candles(2000)) as universe:
+            in_process = sweep_universe(universe, strategies, '1m', workers=1)
+            self.assertEqual(sweep_universe(universe, strategies, '1m', workers=2), in_process)
+        self.assertLessEqual(in_process[0]['trades'], in_process[1]['trades'])
+
+    def test_invalid_grids(self):
+        for entry, grid in (('rsi({p}) < 30', {'q': [1]}), ('rsi({p}) < 30', {'p': []}), ('rsi({p}) < 30', {'p': [0]}),
+                            ('rsi({p}) < 30', {'p': list(range(1, 10001)), 'q': [1, 2]})):
+            with self.assertRaises(ValueError):
+                strategies_for_grid(entry, 'rsi > 70', grid)
+
+    def test_endpoint(self):
+        columns = synthetic_candles(500)
+        client = create_app().test_client()
+        body = {'interval': '1m', 'startTime': int(columns['openTime'][100]), 'endTime': int(columns['openTime'][-1]),
+                'entry': 'rsi(14) < 40', 'exit': 'rsi(14) > 60'}
+        with patch.object(backtest, 'get_kline_columns', return_value=columns):
+            response = client.post('/api/backtest?maxPoints=50', json=body)
+            self.assertEqual(response.status_code, 200)
+            data = response.get_json()
+            self.assertLessEqual(len(data['equity']['equity']), 50)
+            self.assertIn('sharpe', data['metrics'])
+
+            response = client.post('/api/backtest/sweep', json={**body, 'entry': 'rsi(14) < {low}', 'grid': {'low': [30, 40]}, 'top': 1})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()['combinations'], 2)
+            self.assertEqual(len(response.get_json()['results']), 1)
+
+        self.assertEqual(client.post('/api/backtest', json={**body, 'entry': 'rsi <'}).status_code, 400)
+        self.assertEqual(client.post('/api/backtest', json={**body, 'size': 2}).status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
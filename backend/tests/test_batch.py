@@ -0,0 +1,115 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from backend.app import create_app
+from backend.data import batch
+from backend.data.batch import compute_batch, get_indicator_batch, parse_specs
+from backend.data.indicators import compute_macd, compute_rsi
+from backend.data.processing import indicator_cache
+
+HOUR = 3600000
+START = 1704067200000
+
+def candles(count):
+    rng = np.random.default_rng(11)
+    close = 100 + np.cumsum(rng.normal(0, 1, count))
+    open_times = START + np.arange(count, dtype=np.int64) * HOUR
+    return {
+        'openTime': open_times,
+        'open': close - 0.5,
+        'high': close + rng.uniform(0, 2, count),
+        'low': close - rng.uniform(0, 2, count),
+        'close': close,
+        'volume': rng.uniform(1, 10, count),
+        'closeTime': open_times + HOUR - 1,
+    }
+
+class FakeStorage:
+    """
+    Serves ranges of one in-memory candle series and counts the reads
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.reads = 0
+
+    def __call__(self, symbol, interval, start_time, end_time):
+        self.reads += 1
+        open_times = self.columns['openTime']
+        selected = (open_times >= start_time) & (open_times <= end_time)
+        return {name: values[selected] for name, values in self.columns.items()}
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        indicator_cache.clear()
+        self.addCleanup(indicator_cache.clear)
+
+    def test_outputs_match_the_single_indicator_functions(self):
+        columns = candles(500)
+        result = compute_batch(columns, parse_specs('macd(12,26,9),rsi(14),ema(12),sma(5)'))
+
+        macd, signal, histogram = compute_macd(columns['close'])
+        np.testing.assert_array_equal(result['macd(12,26,9).macd'], macd)
+        np.testing.assert_array_equal(result['macd(12,26,9).signal'], signal)
+        np.testing.assert_array_equal(result['macd(12,26,9).histogram'], histogram)
+        np.testing.assert_array_equal(result['rsi(14)'], compute_rsi(columns['close']))
+        np.testing.assert_array_equal(result['ema(12)'], pd.Series(columns['close']).ewm(span=12, adjust=False).mean())
+        np.testing.assert_allclose(result['sma(5)'][4:], np.convolve(columns['close'], np.ones(5) / 5, 'valid'))
+        np.testing.assert_array_equal(result['timestamps'], columns['openTime'])
+
+    def test_bollinger_atr_and_vwap(self):
+        columns = candles(100)
+        result = compute_batch(columns, parse_specs('bbands(20,2),atr(14),vwap'))
+
+        window = columns['close'][-20:]
+        self.assertAlmostEqual(result['bbands(20,2.0).upper'][-1], window.mean() + 2 * window.std())
+        self.assertAlmostEqual(result['bbands(20,2.0).lower'][-1], window.mean() - 2 * window.std())
+        self.assertTrue(np.isnan(result['atr(14)'][:13]).all())
+        self.assertTrue((result['atr(14)'][13:] > 0).all())
+
+        # Hourly candles from midnight: the VWAP restarts every 24 candles
+        typical = (columns['high'] + columns['low'] + columns['close']) / 3
+        day = slice(24, 48)
+        expected = np.cumsum(typical[day] * columns['volume'][day]) / np.cumsum(columns['volume'][day])
+        np.testing.assert_allclose(result['vwap(1d)'][day], expected)
+        self.assertEqual(result['vwap(1d)'][24], typical[24])
+
+    def test_one_read_warms_up_every_indicator(self):
+        columns = candles(2000)
+        storage = FakeStorage(columns)
+        specs = parse_specs('macd,rsi,ema(50),bbands,atr,vwap')
+        start, end = int(columns['openTime'][1500]), int(columns['openTime'][1599])
+
+        with patch.object(batch, 'get_kline_columns', storage):
+            result = get_indicator_batch('BTCUSDT', '1h', start, end, specs)
+            get_indicator_batch('BTCUSDT', '1h', start, end, specs)
+
+        self.assertEqual(storage.reads, 1)
+        full = compute_batch(columns, specs)
+        self.assertEqual(result.keys(), full.keys())
+        for name, values in result.items():
+            np.testing.assert_allclose(values, full[name][1500:1600], rtol=1e-7, err_msg=name)
+
+    def test_invalid_specs(self):
+        for text in ('', 'foo', 'ema(0)', 'ema(2.5)', 'vwap(3d)', 'rsi(14,2)', 'rsi,rsi(14)', 'macd(12'):
+            with self.assertRaises(ValueError, msg=text):
+                parse_specs(text)
+
+    def test_endpoint(self):
+        client = create_app().test_client()
+        with patch.object(batch, 'get_kline_columns', FakeStorage(candles(300))):
+            response = client.get(f'/api/indicators?interval=1h&startTime={START}&endTime={START + 299 * HOUR}'
+                                  '&indicators=macd,rsi(7)&maxPoints=100')
+            self.assertEqual(response.status_code, 200)
+            data = response.get_json()
+            self.assertEqual(set(data), {'timestamps', 'macd(12,26,9).macd', 'macd(12,26,9).signal',
+                                         'macd(12,26,9).histogram', 'rsi(7)'})
+            self.assertEqual(len(data['timestamps']), 100)
+
+            response = client.get('/api/indicators?indicators=nope')
+            self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import threading
+import unittest
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from backend.database import Base
+from backend.data import storage
+from backend.data.buffer import WriteBuffer
+from backend.tests.test_storage import make_candles
+
+START = 1704067200000
+
+class TestWriteBuffer(unittest.TestCase):
+
+    def setUp(self):
+        # Shared with the buffer's writer thread
+        self.engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+        Base.metadata.create_all(self.engine)
+        for patcher in (patch.object(storage, 'engine', self.engine), patch.object(storage, '_save_listeners', [])):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def buffer(self, **kwargs):
+        buffer = WriteBuffer(**{'max_candles': 1000, 'flush_candles': 1000, 'flush_seconds': 60, **kwargs})
+        self.addCleanup(buffer.close)
+        return buffer
+
+    def stored(self, symbol='BTCUSDT'):
+        return storage.get_kline_data(symbol, '1m', 0, 2 ** 62)
+
+    def test_forming_candle_updates_collapse_last_write_wins(self):
+        buffer = self.buffer()
+        candles = make_candles(START, 3)
+        buffer.put([('BTCUSDT', '1m', storage.rows_to_columns([tuple(c.values()) for c in candles]))])
+        forming = dict(candles[-1], close=42.0)
+        flush = buffer.put([('BTCUSDT', '1m', storage.rows_to_columns([tuple(forming.values())]))])
+        self.assertTrue(buffer.flush(timeout=5))
+        self.assertTrue(flush.done.is_set())
+
+        self.assertEqual([c['close'] for c in self.stored()], [100.5, 101.5, 42.0])
+        stats = buffer.stats()
+        self.assertEqual((stats['flushes'], stats['written'], stats['deduplicated']), (1, 4, 1))
+
+    def test_concurrent_saves_share_group_commits(self):
+        buffer = self.buffer(flush_seconds=0.05)
+        results = []
+        threads = [
+            threading.Thread(target=lambda i=i: results.append(buffer.save(f'S{i}', '1m', make_candles(START, 2))))
+            for i in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(results, [2] * 20)
+        self.assertLess(buffer.stats()['flushes'], 20)
+        self.assertEqual(len(self.stored('S7')), 2)
+
+    def test_size_threshold_flushes_without_waiting_for_age(self):
+        buffer = self.buffer(flush_candles=3)
+        self.assertEqual(buffer.save('BTCUSDT', '1m', make_candles(START, 3)), 3)
+        self.assertEqual(len(self.stored()), 3)
+
+    def test_failed_series_is_isolated(self):
+        def writer(batches):
+            if any(symbol == 'BAD' for symbol, _, _ in batches):
+                return 0
+            return storage.save_kline_series(batches)
+
+        buffer = self.buffer(writer=writer)
+        good = buffer.put([('GOOD', '1m', storage.rows_to_columns([tuple(c.values()) for c in make_candles(START, 2)]))])
+        buffer.put([('BAD', '1m', storage.rows_to_columns([tuple(c.values()) for c in make_candles(START, 1)]))])
+        self.assertTrue(buffer.flush(timeout=5))
+        self.assertEqual(good.failed, {('BAD', '1m')})
+        self.assertEqual(len(self.stored('GOOD')), 2)
+        self.assertEqual((buffer.stats()['written'], buffer.stats()['failed']), (2, 1))
+
+    def test_close_flushes_and_refuses_later_writes(self):
+        buffer = self.buffer()
+        columns = storage.rows_to_columns([tuple(c.values()) for c in make_candles(START, 2)])
+        buffer.put([('BTCUSDT', '1m', columns)])
+        buffer.close(timeout=5)
+        self.assertEqual(len(self.stored()), 2)
+        self.assertIsNone(buffer.put([('BTCUSDT', '1m', columns)]))
+        self.assertEqual(buffer.save('BTCUSDT', '1m', make_candles(START, 1)), 0)
+
+    def test_full_buffer_refuses_until_written(self):
+        release = threading.Event()
+        buffer = self.buffer(max_candles=3, flush_candles=1, writer=lambda batches: release.wait(5))
+        columns = storage.rows_to_columns([tuple(c.values()) for c in make_candles(START, 2)])
+        self.assertIsNotNone(buffer.put([('A', '1m', columns)]))
+        self.assertIsNone(buffer.put([('B', '1m', columns)]))
+        release.set()
+        self.assertTrue(buffer.flush(timeout=5))
+        self.assertIsNotNone(buffer.put([('B', '1m', columns)]))
+        self.assertEqual(buffer.stats()['rejected'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import threading
+import unittest
+from unittest.mock import patch
+import numpy as np
+from backend.data import processing
+from backend.data.cache import IndicatorCache, SingleFlight
+from backend.data.processing import get_macd, normalize_candle_range
+
+HOUR = 3600000
+START = 1704067200000
+
+def result(size):
+    return {'timestamps': np.zeros(size, dtype=np.int64), 'value': np.zeros(size)}
+
+class TestIndicatorCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used_beyond_byte_budget(self):
+        cache = IndicatorCache(max_bytes=3 * 1600, ttl_seconds=60)
+        for start in range(3):
+            cache.get_or_compute(('macd', 'BTCUSDT', '1h', start, start), lambda: result(100))
+        cache.get_or_compute(('macd', 'BTCUSDT', '1h', 0, 0), lambda: self.fail('should hit'))
+        cache.get_or_compute(('macd', 'BTCUSDT', '1h', 3, 3), lambda: result(100))
+
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['bytes'], stats['evictions']), (3, 3 * 1600, 1))
+        self.assertEqual((stats['hits'], stats['misses']), (1, 4))
+        cache.get_or_compute(('macd', 'BTCUSDT', '1h', 1, 1), lambda: result(100))
+        self.assertEqual(cache.stats()['misses'], 5)
+
+    def test_expired_entries_are_recomputed(self):
+        cache = IndicatorCache(max_bytes=1 << 20, ttl_seconds=10)
+        key = ('rsi', 'BTCUSDT', '1h', 0, 0)
+        with patch('backend.data.cache.time.monotonic', return_value=100.0):
+            cache.get_or_compute(key, lambda: result(1))
+        with patch('backend.data.cache.time.monotonic', return_value=111.0):
+            cache.get_or_compute(key, lambda: result(1))
+        self.assertEqual(cache.stats()['expirations'], 1)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_entry_from_another_version_is_recomputed(self):
+        # Another process wrote the series: no invalidate() call, only a new stored version
+        cache = IndicatorCache(max_bytes=1 << 20, ttl_seconds=60)
+        key = ('macd', 'BTCUSDT', '1h', START, START + HOUR)
+        cache.get_or_compute(key, lambda: result(1), (('2024q1', 1),))
+        cache.get_or_compute(key, lambda: self.fail('should hit'), (('2024q1', 1),))
+        self.assertEqual(len(cache.get_or_compute(key, lambda: result(2), (('2024q1', 2),))['value']), 2)
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['invalidations']), (1, 2, 1))
+
+    def test_write_drops_only_ranges_reaching_it(self):
+        cache = IndicatorCache(max_bytes=1 << 20, ttl_seconds=60)
+        old = ('macd', 'BTCUSDT', '1h', START, START + 10 * HOUR)
+        recent = ('macd', 'BTCUSDT', '1h', START, START + 50 * HOUR)
+        other = ('macd', 'ETHUSDT', '1h', START, START + 50 * HOUR)
+        for key in (old, recent, other):
+            cache.get_or_compute(key, lambda: result(10))
+
+        cache.on_candles_saved('BTCUSDT', '1h', [('BTCUSDT', '1h', START + 20 * HOUR)])
+
+        self.assertEqual(cache.stats()['invalidations'], 1)
+        self.assertEqual(set(cache._entries), {old, other})
+
+    def test_result_computed_across_a_write_is_not_stored(self):
+        cache = IndicatorCache(max_bytes=1 << 20, ttl_seconds=60)
+        key = ('macd', 'BTCUSDT', '1h', START, START + HOUR)
+
+        def compute():
+            cache.invalidate('BTCUSDT', '1h')
+            return result(1)
+
+        cache.get_or_compute(key, compute)
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_concurrent_misses_compute_once(self):
+        cache = IndicatorCache(max_bytes=1 << 20, ttl_seconds=60)
+        key = ('macd', 'BTCUSDT', '1h', START, START + HOUR)
+        release, calls, results = threading.Event(), [], []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return result(1)
+
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute(key, compute))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while cache.stats()['coalesced'] < 2:
+            threading.Event().wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(value is results[0] for value in results))
+        self.assertEqual(cache.stats()['entries'], 1)
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_failure_reaches_every_waiter_and_is_not_kept(self):
+        flights, release, errors = SingleFlight(), threading.Event(), []
+
+        def fail():
+            release.wait(5)
+            raise RuntimeError('exchange down')
+
+        def call():
+            try:
+                flights.do('key', fail)
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while flights.shared < 2:
+            threading.Event().wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, ['exchange down'] * 3)
+        self.assertEqual(flights.do('key', lambda: 42), 42)
+        self.assertEqual(flights.stats(), {'runs': 2, 'shared': 2, 'inflight': 0})
+
+class TestCachedIndicators(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(processing, 'indicator_cache', IndicatorCache(1 << 20, 60))
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.version = [()]
+        patcher = patch.object(processing, 'series_version', side_effect=lambda *args: self.version[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_range_snaps_to_candle_open_times(self):
+        self.assertEqual(normalize_candle_range('1h', START + 1, START + 5 * HOUR - 1), (START + HOUR, START + 4 * HOUR))
+        self.assertEqual(normalize_candle_range('1h', START, START + 5 * HOUR), (START, START + 5 * HOUR))
+        monday = 1704067200000  # 2024-01-01 was a Monday
+        self.assertEqual(normalize_candle_range('1w', monday - 1, monday + 1), (monday, monday))
+
+    @patch('backend.data.processing.get_indicator_series')
+    def test_nearby_requests_share_an_entry(self, mock_series):
+        mock_series.return_value = {'timestamps': np.array([START]), 'macd': np.array([1.0])}
+        get_macd('BTCUSDT', '1h', START, START + 10 * HOUR + 5)
+        get_macd('BTCUSDT', '1h', START, START + 10 * HOUR + 59000)
+
+        self.assertEqual(mock_series.call_count, 1)
+        self.assertEqual(mock_series.call_args[0][3:], (START, START + 10 * HOUR))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    @patch('backend.data.processing.get_indicator_series')
+    def test_write_by_another_process_is_not_served_from_cache(self, mock_series):
+        mock_series.return_value = {'timestamps': np.array([START]), 'macd': np.array([1.0])}
+        get_macd('BTCUSDT', '1h', START, START + 10 * HOUR)
+        self.version[0] = (('2024q1', 1),)
+        get_macd('BTCUSDT', '1h', START, START + 10 * HOUR)
+
+        self.assertEqual(mock_series.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from backend.database import Base, rebuild_kline_coverage
+from backend.data import coverage, storage
+from backend.data.coverage import covered_ranges, ensure_coverage, mark_covered, missing_ranges
+
+MINUTE = 60000
+START = 1704067200000
+NOW = START + 1000 * MINUTE + 30000  # halfway through a candle
+
+def candles(start_time, end_time):
+    return [
+        {'openTime': t, 'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': 1.0, 'volume': 1.0, 'closeTime': t + MINUTE - 1}
+        for t in range(start_time, end_time, MINUTE)
+    ]
+
+class FakeKlines:
+    """
+    Stands in for ingestion.fetch_kline_data, returning raw klines for [start, end]
+    """
+
+    def __init__(self, hole=None):
+        self.calls = []
+        self.hole = hole
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, symbol, interval, start_time, end_time, limit=None):
+        self.calls.append((start_time, end_time))
+        self.release.wait(5)
+        return [
+            [c['openTime'], '1', '1', '1', '1', '1', c['closeTime']]
+            for c in candles(start_time, end_time + 1)[:limit]
+            if not (self.hole and self.hole[0] <= c['openTime'] < self.hole[1])
+        ]
+
+class TestCoverage(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.engine = create_engine(f"sqlite:///{os.path.join(tmpdir.name, 'klines.db')}")
+        self.addCleanup(self.engine.dispose)
+        Base.metadata.create_all(self.engine)
+        self.exchange = FakeKlines()
+        for patcher in (
+            patch.object(storage, 'engine', self.engine),
+            patch.object(coverage, 'engine', self.engine),
+            patch.object(storage, '_save_listeners', [coverage.on_candles_saved]),
+            patch.object(coverage, 'fetch_kline_data', self.exchange),
+            patch('backend.data.coverage.time.time', return_value=NOW / 1000),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def ranges(self):
+        return covered_ranges('BTCUSDT', '1m', 0, 2 ** 62)
+
+    def test_ranges_merge_when_they_touch(self):
+        with self.engine.begin() as connection:
+            mark_covered(connection, 'BTCUSDT', '1m', START, START + 10 * MINUTE)
+            mark_covered(connection, 'BTCUSDT', '1m', START + 20 * MINUTE, START + 30 * MINUTE)
+            mark_covered(connection, 'BTCUSDT', '1m', START + 40 * MINUTE, START + 50 * MINUTE)
+        self.assertEqual(len(self.ranges()), 3)
+        with self.engine.begin() as connection:
+            mark_covered(connection, 'BTCUSDT', '1m', START + 10 * MINUTE, START + 25 * MINUTE)
+        self.assertEqual(self.ranges(), [(START, START + 30 * MINUTE), (START + 40 * MINUTE, START + 50 * MINUTE)])
+
+    def test_saved_runs_are_covered_except_the_forming_candle(self):
+        storage.save_kline_data('BTCUSDT', '1m', candles(START, START + 5 * MINUTE) + candles(START + 995 * MINUTE, START + 1001 * MINUTE))
+        self.assertEqual(self.ranges(), [(START, START + 5 * MINUTE), (START + 995 * MINUTE, START + 1000 * MINUTE)])
+
+    def test_only_missing_sub_ranges_are_fetched(self):
+        storage.save_kline_data('BTCUSDT', '1m', candles(START + 10 * MINUTE, START + 20 * MINUTE))
+        self.assertEqual(missing_ranges('BTCUSDT', '1m', START + 1, START + 30 * MINUTE, NOW),
+                         [(START + MINUTE, START + 10 * MINUTE), (START + 20 * MINUTE, START + 31 * MINUTE)])
+
+        self.assertEqual(ensure_coverage('BTCUSDT', '1m', START + 1, START + 30 * MINUTE), 20)
+        self.assertEqual(sorted(self.exchange.calls), [(START + MINUTE, START + 10 * MINUTE - 1),
+                                                       (START + 20 * MINUTE, START + 31 * MINUTE - 1)])
+        self.assertEqual(ensure_coverage('BTCUSDT', '1m', START + MINUTE, START + 30 * MINUTE), 0)
+        self.assertEqual(len(self.exchange.calls), 2)
+        stored = storage.get_kline_columns('BTCUSDT', '1m', START, START + 30 * MINUTE)['openTime']
+        self.assertEqual(stored.tolist(), list(range(START + MINUTE, START + 31 * MINUTE, MINUTE)))
+
+    def test_exchange_holes_are_not_refetched(self):
+        self.exchange.hole = (START + 3 * MINUTE, START + 6 * MINUTE)
+        ensure_coverage('BTCUSDT', '1m', START, START + 9 * MINUTE)
+        ensure_coverage('BTCUSDT', '1m', START, START + 9 * MINUTE)
+
+        self.assertEqual(len(self.exchange.calls), 1)
+        self.assertEqual(self.ranges(), [(START, START + 10 * MINUTE)])
+
+    def test_forming_candle_is_never_missing(self):
+        self.assertEqual(missing_ranges('BTCUSDT', '1m', START + 1000 * MINUTE, START + 2000 * MINUTE, NOW), [])
+
+    def fill_concurrently(self, *ranges):
+        """
+        ensure_coverage of each range from its own thread, the first holding up the exchange
+        until every other one waits for it; returns each call's result
+        """
+        self.exchange.release.clear()
+        results = [None] * len(ranges)
+
+        def fill(i, start_time, end_time):
+            results[i] = ensure_coverage('BTCUSDT', '1m', start_time, end_time)
+
+        waits = coverage.fill_locks.waits
+        threads = [threading.Thread(target=fill, args=(i, *r)) for i, r in enumerate(ranges)]
+        threads[0].start()
+        while not self.exchange.calls:
+            threading.Event().wait(0.01)
+        for thread in threads[1:]:
+            thread.start()
+        while coverage.fill_locks.waits - waits < len(ranges) - 1:
+            threading.Event().wait(0.01)
+        self.exchange.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_requests_share_one_fetch(self):
+        self.assertEqual(self.fill_concurrently(*[(START, START + 9 * MINUTE)] * 4), [10, 0, 0, 0])
+        self.assertEqual(len(self.exchange.calls), 1)
+
+    def test_overlapping_requests_fetch_the_shared_part_once(self):
+        self.fill_concurrently((START, START + 9 * MINUTE), (START + 5 * MINUTE, START + 19 * MINUTE))
+        self.assertEqual(self.exchange.calls, [(START, START + 10 * MINUTE - 1), (START + 10 * MINUTE, START + 20 * MINUTE - 1)])
+        self.assertEqual(self.ranges(), [(START, START + 20 * MINUTE)])
+
+    def test_rebuild_from_stored_candles(self):
+        with patch.object(storage, '_save_listeners', []):
+            storage.save_kline_data('BTCUSDT', '1m', candles(START, START + 5 * MINUTE) + candles(START + 7 * MINUTE, START + 9 * MINUTE))
+            storage.save_kline_data('BTCUSDT', '1h', candles(START, START + MINUTE))
+        with self.engine.begin() as connection:
+            rebuild_kline_coverage(connection)
+
+        self.assertEqual(self.ranges(), [(START, START + 5 * MINUTE), (START + 7 * MINUTE, START + 9 * MINUTE)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from backend.config import Config
+from backend.database import MeteredQueuePool, create_database_engine, pool_stats
+
+class TestEngine(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.url = f"sqlite:///{os.path.join(directory.name, 'pool.db')}"
+
+    def make_engine(self, **settings):
+        with patch.multiple(Config, **settings):
+            engine = create_database_engine(self.url)
+        self.addCleanup(engine.dispose)
+        return engine
+
+    def test_pool_uses_config(self):
+        engine = self.make_engine(DB_POOL_SIZE=3, DB_MAX_OVERFLOW=2, DB_POOL_RECYCLE=60)
+        self.assertIsInstance(engine.pool, MeteredQueuePool)
+        self.assertEqual(engine.pool.size(), 3)
+        self.assertEqual(engine.pool._recycle, 60)
+        with engine.connect(), engine.connect():
+            stats = pool_stats(engine)
+        self.assertEqual(stats['checkedOut'], 2)
+        self.assertEqual(stats['saturation'], 2 / 5)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(pool_stats(engine)['checkedOut'], 0)
+        self.assertEqual(pool_stats(engine)['peakCheckedOut'], 2)
+
+    def test_saturated_pool_counts_waits_and_timeouts(self):
+        engine = self.make_engine(DB_POOL_SIZE=1, DB_MAX_OVERFLOW=0, DB_POOL_TIMEOUT=0.05)
+        with engine.connect():
+            with self.assertRaises(PoolTimeout):
+                engine.connect()
+            self.assertEqual(pool_stats(engine)['saturation'], 1.0)
+
+        held = engine.connect()
+        released = threading.Timer(0.05, held.close)
+        released.start()
+        with patch.object(engine.pool, '_timeout', 5):
+            engine.connect().close()
+        released.join()
+        stats = pool_stats(engine)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreaterEqual(stats['maxWaitSeconds'], 0.04)
+
+    def test_in_memory_sqlite_is_not_pooled(self):
+        engine = create_database_engine('sqlite://')
+        self.assertNotIsInstance(engine.pool, MeteredQueuePool)
+        self.assertIn('pool', pool_stats(engine))
+
+if __name__ == '__main__':
+    unittest.main()
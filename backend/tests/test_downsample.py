@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+from backend.data.downsample import downsample_candles, downsample_series, lttb_indices
+from backend.data.indicators import compute_rsi
+
+MINUTE = 60000
+START = 1704067200000
+
+def candles(count):
+    close = 100 + np.cumsum(np.random.default_rng(5).normal(0, 1, count))
+    open_times = START + np.arange(count, dtype=np.int64) * MINUTE
+    return {
+        'openTime': open_times,
+        'open': close - 0.5,
+        'high': close + 1.0,
+        'low': close - 1.0,
+        'close': close,
+        'volume': np.ones(count),
+        'closeTime': open_times + MINUTE - 1,
+    }
+
+class TestDownsample(unittest.TestCase):
+
+    def test_candles_keep_extremes_and_cover_the_range(self):
+        columns = candles(10007)
+        reduced = downsample_candles(columns, 1000)
+
+        self.assertLessEqual(len(reduced['openTime']), 1000)
+        self.assertEqual(reduced['openTime'][0], columns['openTime'][0])
+        self.assertEqual(reduced['closeTime'][-1], columns['closeTime'][-1])
+        self.assertEqual(reduced['high'].max(), columns['high'].max())
+        self.assertEqual(reduced['low'].min(), columns['low'].min())
+        self.assertEqual(reduced['volume'].sum(), columns['volume'].sum())
+        self.assertEqual(reduced['open'][0], columns['open'][0])
+        self.assertEqual(reduced['close'][-1], columns['close'][-1])
+        np.testing.assert_array_equal(reduced['closeTime'][:-1], reduced['openTime'][1:] - 1)
+
+    def test_short_ranges_are_untouched(self):
+        columns = candles(50)
+        self.assertIs(downsample_candles(columns, 50), columns)
+        self.assertIs(downsample_candles(columns, None), columns)
+
+    def test_lttb_keeps_ends_and_spikes(self):
+        x = np.arange(5000)
+        y = np.sin(x / 200.0)
+        y[1234] = 50.0
+        kept = lttb_indices(x, y, 200)
+
+        self.assertEqual(len(kept), 200)
+        self.assertEqual((kept[0], kept[-1]), (0, 4999))
+        self.assertIn(1234, kept)
+        self.assertTrue(np.all(np.diff(kept) > 0))
+
+    def test_series_rows_stay_aligned(self):
+        columns = candles(3000)
+        result = {'rsi': compute_rsi(columns['close']), 'timestamps': columns['openTime']}
+        reduced = downsample_series(result, 300, 'rsi')
+
+        self.assertEqual(len(reduced['timestamps']), 300)
+        self.assertFalse(np.isnan(reduced['rsi']).any())
+        positions = np.searchsorted(columns['openTime'], reduced['timestamps'])
+        np.testing.assert_array_equal(reduced['rsi'], result['rsi'][positions])
+
+if __name__ == '__main__':
+    unittest.main()
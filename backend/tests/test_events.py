@@ -0,0 +1,165 @@
+import asyncio
+import json
+import threading
+import unittest
+from unittest.mock import patch
+import numpy as np
+from flask import Flask
+from backend.config import Config
+from backend.data.events import CandleHub
+from backend.routes import api
+
+START = 1704067200000
+
+def saved_row(open_time, close):
+    return ('BTCUSDT', '1m', open_time, close, close, close, close, 1.0, open_time + 59999)
+
+def parse_sse(chunk):
+    lines = dict(line.split(': ', 1) for line in chunk.decode().strip().splitlines())
+    return lines['event'], json.loads(lines['data'])
+
+class TestCandleHub(unittest.TestCase):
+
+    def test_publish_reaches_only_matching_subscribers(self):
+        hub = CandleHub(queue_size=4)
+        btc, eth = hub.subscribe('BTCUSDT', '1m'), hub.subscribe('ETHUSDT', '1m')
+        hub.on_candles_saved('BTCUSDT', '1m', [saved_row(START + 60000, 2.0), saved_row(START, 1.0)])
+
+        event = btc.get(timeout=0)
+        self.assertEqual([c['openTime'] for c in event['candles']], [START, START + 60000])
+        self.assertEqual(event['candles'][0]['close'], 1.0)
+        self.assertIsNone(eth.get(timeout=0))
+
+        hub.unsubscribe(btc)
+        self.assertEqual(hub.publish('BTCUSDT', '1m', {}), 0)
+
+    def test_slow_subscriber_drops_oldest_events(self):
+        hub = CandleHub(queue_size=3)
+        subscription = hub.subscribe('BTCUSDT', '1m')
+        for i in range(5):
+            hub.publish('BTCUSDT', '1m', {'n': i})
+
+        self.assertEqual(subscription.take_dropped(), 2)
+        self.assertEqual([subscription.get(timeout=0)['n'] for _ in range(3)], [2, 3, 4])
+        self.assertEqual(subscription.take_dropped(), 0)
+
+class TestStreamEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(api, url_prefix='/api')
+        self.client = app.test_client()
+        self.hub = CandleHub(queue_size=8)
+        for patcher in (
+            patch('backend.routes.hub', self.hub),
+            patch.object(Config, 'EVENT_HEARTBEAT_SECONDS', 0.01),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_candle_events_carry_indicators(self):
+        rsi = lambda *args: {'rsi': np.array([np.nan]), 'timestamps': np.array([START])}
+        patcher = patch.dict('backend.routes.STREAM_INDICATORS', {'rsi': rsi})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        response = self.client.get('/api/stream?symbol=BTCUSDT&interval=1m&indicators=rsi', buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        chunks = iter(response.response)
+
+        self.assertEqual(next(chunks), b': keep-alive\n\n')
+        self.hub.on_candles_saved('BTCUSDT', '1m', [saved_row(START, 1.0)])
+        name, data = parse_sse(next(chunks))
+        self.assertEqual(name, 'candles')
+        self.assertEqual(data['candles'][0]['openTime'], START)
+        self.assertEqual(data['rsi'], {'rsi': [None], 'timestamps': [START]})
+
+        response.close()
+        self.assertEqual(self.hub.stats()['subscribers'], 0)
+
+    def test_unknown_indicator_is_rejected(self):
+        response = self.client.get('/api/stream?indicators=foo')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.hub.stats()['subscribers'], 0)
+
+class TestAsgiStream(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        from backend import asgi
+        self.app = asgi.app
+        self.hub = CandleHub(queue_size=8)
+        for patcher in (
+            patch('backend.routes.hub', self.hub),
+            patch('backend.routes.ensure_coverage', lambda *args: None),
+            patch.object(Config, 'EVENT_HEARTBEAT_SECONDS', 0.05),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def request(self, path, query=b'', disconnect=None):
+        """
+        Run one request through the ASGI app; returns the messages it sent
+        """
+        sent = []
+        received = asyncio.Event()
+
+        async def receive():
+            if not received.is_set():
+                received.set()
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await (disconnect or asyncio.Event()).wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                 'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query,
+                 'root_path': '', 'headers': [], 'client': ('127.0.0.1', 1), 'server': ('testserver', 80)}
+        await self.app(scope, receive, send)
+        return sent
+
+    async def test_streams_beyond_the_request_threads_leave_the_api_responsive(self):
+        disconnect = asyncio.Event()
+        count = Config.ASGI_THREADS + 1
+        streams = [
+            asyncio.create_task(self.request('/api/stream', b'symbol=BTCUSDT&interval=1m', disconnect))
+            for _ in range(count)
+        ]
+        while self.hub.stats()['subscribers'] < count:
+            await asyncio.sleep(0.01)
+
+        # A write from another thread, as the write buffer's flush makes
+        threading.Thread(target=self.hub.on_candles_saved, args=('BTCUSDT', '1m', [saved_row(START, 1.0)])).start()
+        kline = await asyncio.wait_for(self.request('/api/kline', b'symbol=BTCUSDT&interval=1m'), 10)
+        self.assertEqual(kline[0]['status'], 200)
+
+        disconnect.set()
+        sent = await asyncio.wait_for(asyncio.gather(*streams), 10)
+        self.assertEqual(self.hub.stats()['subscribers'], 0)
+        for messages in sent:
+            self.assertEqual(messages[0]['status'], 200)
+            events = [parse_sse(m['body']) for m in messages[1:] if m['body'].startswith(b'event:')]
+            self.assertEqual([data['candles'][0]['openTime'] for _, data in events], [START])
+
+    async def test_unknown_indicator_is_rejected(self):
+        sent = await self.request('/api/stream', b'indicators=foo')
+        self.assertEqual(sent[0]['status'], 400)
+        self.assertEqual(self.hub.stats()['subscribers'], 0)
+
+    async def test_lifespan_starts_the_scheduler(self):
+        messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message)
+
+        with patch('backend.asgi.start_scheduler') as start:
+            await self.app({'type': 'lifespan', 'asgi': {'version': '3.0'}}, receive, send)
+        start.assert_called_once_with()
+        self.assertEqual([m['type'] for m in sent], ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+if __name__ == '__main__':
+    unittest.main()
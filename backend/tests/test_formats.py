@@ -0,0 +1,170 @@
+import json
+import threading
+import unittest
+from unittest.mock import patch
+import msgpack
+import numpy as np
+import pyarrow as pa
+from flask import Flask
+from backend import routes
+from backend.config import Config
+from backend.routes import api
+from backend.data import storage
+
+START = 1704067200000
+
+def kline_columns(count=5):
+    open_times = START + np.arange(count, dtype=np.int64) * 60000
+    prices = np.linspace(100.0, 101.0, count)
+    return {
+        'openTime': open_times, 'open': prices, 'high': prices + 1, 'low': prices - 1,
+        'close': prices, 'volume': np.ones(count), 'closeTime': open_times + 59999,
+    }
+
+class TestResponseFormats(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(api, url_prefix='/api')
+        self.client = self.app.test_client()
+        self.version = [(START, 0)]
+        for patcher in (
+            patch('backend.routes.get_kline_columns', return_value=kline_columns()),
+            patch('backend.routes.ensure_coverage'),
+            patch('backend.routes.series_version', side_effect=lambda *args: self.version[0]),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_json_stays_the_default(self):
+        response = self.client.get('/api/kline', headers={'Accept': '*/*'})
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(response.get_json()[0]['openTime'], START)
+
+    def test_arrow_stream_round_trips_columns(self):
+        response = self.client.get('/api/kline', headers={'Accept': 'application/vnd.apache.arrow.stream'})
+        self.assertEqual(response.mimetype, 'application/vnd.apache.arrow.stream')
+        self.assertIn('Accept', response.headers['Vary'])
+
+        table = pa.ipc.open_stream(response.data).read_all()
+        self.assertEqual(table.schema.field('openTime').type, pa.int64())
+        for name, values in kline_columns().items():
+            np.testing.assert_array_equal(table.column(name).to_numpy(), values)
+
+    def test_msgpack_by_query_parameter(self):
+        response = self.client.get('/api/kline?format=msgpack')
+        self.assertEqual(response.mimetype, 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.data), {name: v.tolist() for name, v in kline_columns().items()})
+
+    @patch('backend.routes.iter_kline_columns')
+    def test_streamed_formats_concatenate_chunks(self, mock_iter):
+        chunks = [kline_columns(3), {name: values[:2] for name, values in kline_columns(2).items()}]
+        mock_iter.side_effect = lambda *args: iter(chunks)
+        expected = [record for chunk in chunks for record in storage.columns_to_records(chunk)]
+
+        response = self.client.get('/api/kline', headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertTrue(response.is_streamed)
+        self.assertEqual([json.loads(line) for line in response.data.splitlines()], expected)
+
+        self.assertEqual(json.loads(self.client.get('/api/kline?stream=true').data), expected)
+
+        table = pa.ipc.open_stream(self.client.get('/api/kline?stream=true&format=arrow').data).read_all()
+        self.assertEqual(table.to_pylist(), expected)
+
+    @patch('backend.routes.iter_kline_columns', side_effect=lambda *args: iter(()))
+    def test_empty_stream_matches_the_buffered_response(self, _):
+        empty = storage.rows_to_columns([])
+        for fmt in ('arrow', 'msgpack'):
+            with patch('backend.routes.get_kline_columns', return_value=empty):
+                buffered = self.client.get(f'/api/kline?format={fmt}&startTime=1').data
+            streamed = self.client.get(f'/api/kline?format={fmt}&stream=true')
+            self.assertTrue(streamed.is_streamed)
+            self.assertEqual(streamed.data, buffered, fmt)
+        self.assertEqual(json.loads(self.client.get('/api/kline?stream=true').data), [])
+        table = pa.ipc.open_stream(self.client.get('/api/kline?format=arrow&stream=true').data).read_all()
+        self.assertEqual(table.schema.names, list(storage.KLINE_FIELDS))
+
+    @patch('backend.routes.get_rsi', return_value=None)
+    def test_empty_indicator_in_every_format(self, _):
+        self.assertEqual(self.client.get('/api/rsi').get_json(), {'rsi': [], 'timestamps': []})
+        table = pa.ipc.open_stream(self.client.get('/api/rsi?format=arrow').data).read_all()
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.schema.names, ['rsi', 'timestamps'])
+
+    def test_unchanged_data_is_not_modified(self):
+        first = self.client.get('/api/kline?symbol=BTCUSDT')
+        etag = first.headers['ETag']
+        revalidated = self.client.get('/api/kline?symbol=BTCUSDT', headers={'If-None-Match': etag})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.data, b'')
+        self.assertEqual(revalidated.headers['ETag'], etag)
+
+        # Another format or range of the same data is a different representation
+        other = self.client.get('/api/kline?symbol=BTCUSDT&format=arrow', headers={'If-None-Match': etag})
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other.headers['ETag'], etag)
+
+        self.version[0] = (START + 60000, 1)
+        changed = self.client.get('/api/kline?symbol=BTCUSDT', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+
+    def test_identical_requests_in_flight_share_one_build(self):
+        release, calls = threading.Event(), []
+
+        def read(*args):
+            calls.append(args)
+            release.wait(5)
+            return kline_columns()
+
+        shared = routes.response_flights.shared
+        responses = []
+        with patch('backend.routes.get_kline_columns', side_effect=read), patch.object(Config, 'SERVER_TIMING', True):
+            threads = [
+                threading.Thread(target=lambda: responses.append(self.app.test_client().get('/api/kline?startTime=1')))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            while routes.response_flights.shared - shared < 3:
+                threading.Event().wait(0.01)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        bodies = [response.data for response in responses]
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(bodies), 4)
+        self.assertEqual(len(set(bodies)), 1)
+        self.assertEqual(json.loads(bodies[0])[0]['openTime'], START)
+        # The request that built the body times its serialize, the others their wait for it
+        timings = sorted(response.headers['Server-Timing'] for response in responses)
+        self.assertEqual([timing.split(';')[0] for timing in timings], ['serialize', 'wait', 'wait', 'wait'])
+
+    def test_write_during_a_flight_starts_a_new_build(self):
+        release, calls = threading.Event(), []
+
+        def read(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                release.wait(5)
+            return kline_columns(len(calls))
+
+        responses = []
+        with patch('backend.routes.get_kline_columns', side_effect=read):
+            first = threading.Thread(target=lambda: responses.append(self.app.test_client().get('/api/kline?startTime=1')))
+            first.start()
+            while not calls:
+                threading.Event().wait(0.01)
+            self.version[0] = (START + 60000, 1)
+            changed = self.client.get('/api/kline?startTime=1')
+            release.set()
+            first.join()
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(json.loads(changed.data)), 2)
+        self.assertNotEqual(changed.headers['ETag'], responses[0].headers['ETag'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from sqlalchemy import create_engine
+from backend.database import Base
+from backend.data import indicators, storage
+from backend.data.indicators import MACD, RSI, compute_macd, compute_rsi, get_indicator_series
+
+HOUR = 3600000
+START = 1704067200000
+
+def random_walk(count, seed=7):
+    closes = 30000 + np.cumsum(np.random.default_rng(seed).normal(0, 50, count))
+    closes[40:60] = closes[40]  # flat stretch exercises the constant-series guard
+    return closes
+
+def assert_bitwise_equal(test, actual, expected):
+    test.assertEqual(np.asarray(actual, dtype=np.float64).tobytes(), np.asarray(expected, dtype=np.float64).tobytes())
+
+class TestStreamingIndicators(unittest.TestCase):
+
+    def test_macd_updates_match_pandas(self):
+        closes = random_walk(2000)
+        macd = MACD()
+        outputs = list(zip(*(macd.update(close) for close in closes)))
+        for actual, expected in zip(outputs, compute_macd(closes)):
+            assert_bitwise_equal(self, actual, expected)
+
+    def test_rsi_updates_match_pandas(self):
+        closes = random_walk(2000)
+        rsi = RSI(14)
+        assert_bitwise_equal(self, [rsi.update(close)[0] for close in closes], compute_rsi(closes, 14))
+
+    def test_seed_then_update_matches_pandas(self):
+        closes = random_walk(3000)
+        for indicator, expected in ((MACD(8, 21, 5), compute_macd(closes, 8, 21, 5)), (RSI(10), (compute_rsi(closes, 10),))):
+            indicator.seed(closes[:2500])
+            outputs = list(zip(*(indicator.update(close) for close in closes[2500:])))
+            for actual, full in zip(outputs, expected):
+                assert_bitwise_equal(self, actual, full[2500:])
+
+class TestIndicatorEngine(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.engine = create_engine(f"sqlite:///{os.path.join(tmpdir.name, 'klines.db')}")
+        self.addCleanup(self.engine.dispose)
+        Base.metadata.create_all(self.engine)
+        for patcher in (
+            patch.object(storage, 'engine', self.engine),
+            patch.object(indicators, 'engine', self.engine),
+            patch.object(storage, '_save_listeners', [indicators.on_candles_saved]),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.closes = random_walk(500)
+        self.save(range(len(self.closes) - 1))
+
+    def save(self, positions, closes=None):
+        closes = self.closes if closes is None else closes
+        storage.save_kline_data('BTCUSDT', '1h', [
+            {
+                'openTime': START + i * HOUR, 'open': closes[i], 'high': closes[i], 'low': closes[i],
+                'close': closes[i], 'volume': 1.0, 'closeTime': START + (i + 1) * HOUR - 1,
+            }
+            for i in positions
+        ])
+
+    def series(self, indicator):
+        return get_indicator_series(indicator, 'BTCUSDT', '1h', START, START + len(self.closes) * HOUR)
+
+    def test_appended_and_revised_candles_match_full_recompute(self):
+        self.series(MACD())
+        self.series(RSI())
+
+        # A forming candle is stored, then revised with its final close
+        forming = self.closes.copy()
+        forming[-1] += 123.0
+        self.save([len(self.closes) - 1], forming)
+        self.save([len(self.closes) - 1])
+
+        macd = self.series(MACD())
+        self.assertEqual(macd['timestamps'].tolist(), [START + i * HOUR for i in range(len(self.closes))])
+        for field, expected in zip(MACD.fields, compute_macd(self.closes)):
+            assert_bitwise_equal(self, macd[field], expected)
+        assert_bitwise_equal(self, self.series(RSI())['rsi'], compute_rsi(self.closes))
+
+    def test_rewriting_history_reseeds(self):
+        self.series(MACD())
+        changed = self.closes.copy()
+        changed[10] += 500.0
+        self.save([10], changed)
+        self.closes = changed
+
+        for field, expected in zip(MACD.fields, compute_macd(self.closes[:-1])):
+            assert_bitwise_equal(self, self.series(MACD())[field], expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import io
+import json
+import threading
+import unittest
+from unittest.mock import patch
+import msgpack
+import numpy as np
+import pyarrow as pa
+from flask import Flask
+from backend.benchmarks.synthetic import synthetic_candles
+from backend.data.buffer import WriteBuffer
+from backend.data.ingest import InvalidCandles, group_candles, validate_candles
+from backend.data.storage import columns_to_records
+from backend.formats import decode_candles, record_batch
+from backend.routes import api
+
+def candle_columns(count=5):
+    return synthetic_candles(count, '1m')
+
+def float_columns(columns):
+    return {name: values.astype(np.float64) for name, values in columns.items()}
+
+class TestValidation(unittest.TestCase):
+
+    def checks(self, columns, interval='1m', symbol='BTCUSDT'):
+        problems, _ = validate_candles(symbol, interval, float_columns(columns))
+        return {problem['check']: problem for problem in problems}
+
+    def test_valid_batch_is_typed(self):
+        problems, typed = validate_candles('BTCUSDT', '1m', float_columns(candle_columns()))
+        self.assertEqual(problems, [])
+        self.assertEqual(typed['openTime'].dtype, np.int64)
+        np.testing.assert_array_equal(typed['openTime'], candle_columns()['openTime'])
+
+    def test_each_check_reports_count_and_first_index(self):
+        columns = candle_columns()
+        columns['high'][1] = columns['open'][1] - 1
+        columns['high'][3] = columns['close'][3] - 1
+        columns['volume'][4] = -1
+        checks = self.checks(columns)
+        self.assertEqual(set(checks), {'high', 'volume'})
+        self.assertEqual((checks['high']['count'], checks['high']['firstIndex']), (2, 1))
+
+    def test_time_checks(self):
+        columns = candle_columns()
+        columns['openTime'][2], columns['closeTime'][2] = columns['openTime'][1], columns['closeTime'][1]
+        self.assertIn('monotonic', self.checks(columns))
+        columns = candle_columns()
+        columns['openTime'] = columns['openTime'] + 1
+        self.assertEqual(set(self.checks(columns)), {'aligned', 'closeTime'})
+
+    def test_missing_values_stop_further_checks(self):
+        columns = float_columns(candle_columns())
+        columns['close'][0] = np.nan
+        self.assertEqual(set(self.checks(columns)), {'finite'})
+
+    def test_unknown_interval_and_symbol(self):
+        self.assertEqual(set(self.checks(candle_columns(), interval='7m', symbol='btc-usd')), {'symbol', 'interval'})
+
+class TestDecoding(unittest.TestCase):
+
+    def setUp(self):
+        self.columns = candle_columns()
+        self.records = [{'symbol': 'BTCUSDT', 'interval': '1m', **record} for record in columns_to_records(self.columns)]
+
+    def assert_batch(self, frame, symbol=None, interval=None):
+        [(batch_symbol, batch_interval, columns)] = group_candles(frame, symbol, interval)
+        self.assertEqual((batch_symbol, batch_interval), ('BTCUSDT', '1m'))
+        for name, values in self.columns.items():
+            np.testing.assert_array_equal(columns[name], values)
+
+    def test_every_format_decodes_to_the_same_batch(self):
+        self.assert_batch(decode_candles(json.dumps(self.records).encode(), 'application/json'))
+        ndjson = '\n'.join(json.dumps(record) for record in self.records).encode()
+        self.assert_batch(decode_candles(ndjson, 'application/x-ndjson'))
+        column_map = {'symbol': 'BTCUSDT', 'interval': '1m', **{k: v.tolist() for k, v in self.columns.items()}}
+        self.assert_batch(decode_candles(json.dumps(column_map).encode(), 'application/json'))
+        self.assert_batch(decode_candles(msgpack.packb(column_map), 'application/msgpack'))
+        sink = io.BytesIO()
+        batch = record_batch(self.columns)
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        self.assert_batch(decode_candles(sink.getvalue(), 'application/vnd.apache.arrow.stream'), 'BTCUSDT', '1m')
+
+    def test_string_prices_and_default_keys(self):
+        records = [{k: str(v) if k in ('open', 'close') else v for k, v in record.items() if k != 'symbol'}
+                   for record in self.records]
+        self.assert_batch(decode_candles(json.dumps(records).encode(), 'application/json'), symbol='BTCUSDT')
+        with self.assertRaises(InvalidCandles):
+            group_candles(decode_candles(json.dumps(records).encode(), 'application/json'))
+
+    def test_batches_split_by_symbol_and_interval(self):
+        records = self.records + [{**record, 'symbol': 'ETHUSDT'} for record in self.records[:2]]
+        batches = group_candles(decode_candles(json.dumps(records).encode(), 'application/json'))
+        self.assertEqual([(s, i, len(c['openTime'])) for s, i, c in batches], [('BTCUSDT', '1m', 5), ('ETHUSDT', '1m', 2)])
+
+class TestIngestEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(api, url_prefix='/api')
+        self.client = self.app.test_client()
+        self.written = []
+        self.buffer = WriteBuffer(10, flush_candles=1, flush_seconds=0, writer=lambda batches: self.written.extend(batches) or 1)
+        self.addCleanup(self.buffer.close)
+        patcher = patch('backend.routes.write_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, columns, **kwargs):
+        return self.client.post('/api/ingest?symbol=BTCUSDT&interval=1m', json=columns_to_records(columns), **kwargs)
+
+    def test_accepts_and_queues(self):
+        response = self.post(candle_columns(4))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json()['batches'], [{'symbol': 'BTCUSDT', 'interval': '1m', 'candles': 4}])
+        self.assertTrue(self.buffer.flush(timeout=5))
+        symbol, interval, columns = self.written[0]
+        np.testing.assert_array_equal(columns['closeTime'], candle_columns(4)['closeTime'])
+
+    def test_rejects_invalid_candles(self):
+        columns = candle_columns(4)
+        columns['low'][2] = columns['high'][2] + 1
+        response = self.post(columns)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['problems'][0]['check'], 'low')
+        response = self.client.post('/api/ingest', data=b'{not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_backpressure(self):
+        self.assertEqual(self.post(candle_columns(11)).status_code, 413)
+        release = threading.Event()
+        self.buffer.writer = lambda batches: release.wait(5)
+        self.assertEqual(self.post(candle_columns(6)).status_code, 202)
+        response = self.post(candle_columns(6))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        release.set()
+        self.assertTrue(self.buffer.flush(timeout=5))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+from flask import Flask
+from backend import metrics
+from backend.metrics import StageMetrics, span, collect_request_spans, server_timing, render_stats
+from backend.routes import api, ops
+from backend.tests.test_formats import START, kline_columns
+
+class TestStageMetrics(unittest.TestCase):
+
+    def test_observations_fill_cumulative_buckets(self):
+        stages = StageMetrics(buckets=(0.01, 0.1))
+        stages.observe('query', 'klines', 0.005, rows=10)
+        stages.observe('query', 'klines', 0.05, rows=20)
+        stages.observe('query', 'klines', 5, rows=30, nbytes=100)
+        text = stages.render()
+        labels = 'stage="query",detail="klines"'
+        self.assertIn(f'quantm_stage_seconds_bucket{{{labels},le="0.01"}} 1', text)
+        self.assertIn(f'quantm_stage_seconds_bucket{{{labels},le="0.1"}} 2', text)
+        self.assertIn(f'quantm_stage_seconds_bucket{{{labels},le="+Inf"}} 3', text)
+        self.assertIn(f'quantm_stage_seconds_count{{{labels}}} 3', text)
+        self.assertIn(f'quantm_stage_seconds_sum{{{labels}}} 5.055', text)
+        self.assertIn(f'quantm_stage_rows_total{{{labels}}} 60', text)
+        self.assertIn(f'quantm_stage_bytes_total{{{labels}}} 100', text)
+
+    def test_span_records_volume_even_when_the_block_raises(self):
+        stages = StageMetrics()
+        with patch.object(metrics, 'stage_metrics', stages):
+            with self.assertRaises(RuntimeError):
+                with span('store') as timing:
+                    timing.rows = 3
+                    raise RuntimeError('write failed')
+        series = stages.snapshot()[('store', '')]
+        self.assertEqual(series[-4], 1)
+        self.assertEqual(series[-2], 3)
+
+    def test_request_spans_sum_per_stage(self):
+        spans = collect_request_spans()
+        try:
+            with span('query'):
+                pass
+            with span('compute', 'rsi'):
+                pass
+            with span('query'):
+                pass
+        finally:
+            metrics._request_spans.set(None)
+        self.assertEqual([stage for stage, _ in spans], ['query', 'compute', 'query'])
+        self.assertEqual(server_timing([('query', 0.001), ('compute', 0.002), ('query', 0.0005)]),
+                         'query;dur=1.50, compute;dur=2.00')
+
+    def test_render_stats_types_and_skips_non_numbers(self):
+        text = render_stats('db_pool', {'checkedOut': 2, 'checkouts': 7, 'saturation': None, 'healthy': True},
+                            counters=('checkouts',))
+        self.assertIn('# TYPE quantm_db_pool_checked_out gauge\nquantm_db_pool_checked_out 2', text)
+        self.assertIn('# TYPE quantm_db_pool_checkouts_total counter\nquantm_db_pool_checkouts_total 7', text)
+        self.assertNotIn('saturation', text)
+        self.assertNotIn('healthy', text)
+        self.assertEqual(render_stats('hot_tier', {}), '')
+
+class TestMetricsEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(api, url_prefix='/api')
+        self.app.register_blueprint(ops)
+        self.client = self.app.test_client()
+        for patcher in (
+            patch('backend.routes.get_kline_columns', return_value=kline_columns()),
+            patch('backend.routes.ensure_coverage'),
+            patch('backend.routes.series_version', return_value=(START, 0)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_metrics_exposes_stage_histograms_and_component_stats(self):
+        self.client.get('/api/kline?symbol=METRICS&startTime=1')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/plain')
+        text = response.get_data(as_text=True)
+        self.assertIn('quantm_stage_seconds_count{stage="serialize",detail="json"}', text)
+        self.assertIn('quantm_indicator_cache_hits_total', text)
+        self.assertIn('quantm_response_flights_runs_total', text)
+
+    def test_server_timing_header_only_when_enabled(self):
+        response = self.client.get('/api/kline?symbol=METRICS&startTime=2')
+        self.assertNotIn('Server-Timing', response.headers)
+        with patch('backend.routes.Config.SERVER_TIMING', True):
+            response = self.client.get('/api/kline?symbol=METRICS&startTime=3')
+        self.assertRegex(response.headers['Server-Timing'], r'^serialize;dur=\d+\.\d{2}$')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,42 +1,50 @@
 import unittest
 from unittest.mock import patch, MagicMock
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from backend.database import Base
 from backend.data.processing import get_macd, get_rsi
 
 class TestProcessing(unittest.TestCase):
 
-    @patch('backend.data.processing.get_kline_data')
-    def test_get_macd(self, mock_get_kline_data):
+    def setUp(self):
+        # Indicator series are precomputed into the database on first read
+        engine = create_engine('sqlite://', poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        patcher = patch('backend.data.indicators.engine', engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('backend.data.indicators.get_kline_columns')
+    def test_get_macd(self, mock_get_kline_columns):
         # Mock data
-        mock_data = [
-            {'openTime': 1625097600000, 'close': 100},
-            {'openTime': 1625184000000, 'close': 105},
-            {'openTime': 1625270400000, 'close': 110},
-            {'openTime': 1625356800000, 'close': 115},
-        ]
-        mock_get_kline_data.return_value = mock_data
+        mock_data = {
+            'openTime': np.array([1625097600000, 1625184000000, 1625270400000, 1625356800000]),
+            'close': np.array([100.0, 105.0, 110.0, 115.0]),
+        }
+        mock_get_kline_columns.return_value = mock_data
 
-        result = get_macd('BTCUSDT', '1d')
+        result = get_macd('BTCUSDT', '1d', 1625097600000, 1625356800000)
 
         self.assertIsNotNone(result)
         self.assertIn('macd', result)
         self.assertIn('signal', result)
         self.assertIn('histogram', result)
 
-    @patch('backend.data.processing.get_kline_data')
-    def test_get_rsi(self, mock_get_kline_data):
+    @patch('backend.data.indicators.get_kline_columns')
+    def test_get_rsi(self, mock_get_kline_columns):
         # Mock data
-        mock_data = [
-            {'openTime': 1625097600000, 'close': 100},
-            {'openTime': 1625184000000, 'close': 105},
-            {'openTime': 1625270400000, 'close': 110},
-            {'openTime': 1625356800000, 'close': 115},
-        ]
-        mock_get_kline_data.return_value = mock_data
+        mock_data = {
+            'openTime': np.array([1625097600000, 1625184000000, 1625270400000, 1625356800000]),
+            'close': np.array([100.0, 105.0, 110.0, 115.0]),
+        }
+        mock_get_kline_columns.return_value = mock_data
 
-        result = get_rsi('BTCUSDT', '1d')
+        result = get_rsi('BTCUSDT', '1d', 1625097600000, 1625356800000)
 
         self.assertIsNotNone(result)
-        self.assertEqual(len(result), len(mock_data))
+        self.assertEqual(len(result['rsi']), len(mock_data['close']))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
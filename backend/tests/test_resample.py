@@ -0,0 +1,137 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from backend.config import Config
+from backend.database import Base
+from backend.data import resample, storage
+from backend.data.resample import bucket_open_times, resample_columns, rollup_sources, materialize_rollups
+
+MINUTE = 60000
+START = 1704067200000  # 2024-01-01 00:00 UTC, a Monday
+
+def minute_candles(count, start=START, seed=3):
+    rng = np.random.default_rng(seed)
+    close = 40000 + np.cumsum(rng.normal(0, 10, count))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = rng.uniform(0, 5, count)
+    open_times = start + np.arange(count, dtype=np.int64) * MINUTE
+    return {
+        'openTime': open_times,
+        'open': open_,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+        'close': close,
+        'volume': rng.uniform(1, 3, count),
+        'closeTime': open_times + MINUTE - 1,
+    }
+
+def pandas_resample(columns, rule):
+    frame = pd.DataFrame(columns).set_index(pd.to_datetime(columns['openTime'], unit='ms'))
+    return frame.resample(rule, label='left', closed='left').agg(
+        {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+    ).dropna()
+
+class TestResampleColumns(unittest.TestCase):
+
+    def test_matches_pandas_resample(self):
+        columns = minute_candles(3 * 1440 + 17)
+        for interval, rule in (('5m', '5min'), ('1h', 'h'), ('4h', '4h'), ('1d', 'D')):
+            candles = resample_columns(columns, interval)
+            expected = pandas_resample(columns, rule)
+            np.testing.assert_array_equal(candles['openTime'], expected.index.asi8 // 10 ** 6)
+            for field in ('open', 'high', 'low', 'close'):
+                np.testing.assert_array_equal(candles[field], expected[field].to_numpy())
+            np.testing.assert_allclose(candles['volume'], expected['volume'].to_numpy(), rtol=1e-12)
+            np.testing.assert_array_equal(candles['closeTime'][:-1], candles['openTime'][1:] - 1)
+
+    def test_weekly_and_monthly_buckets_follow_the_calendar(self):
+        thursday, feb_15 = START + 3 * 86400000, 1707955200000
+        self.assertEqual(bucket_open_times([thursday], '1w').tolist(), [START])
+        self.assertEqual(bucket_open_times([feb_15], '1M').tolist(), [1706745600000])
+        self.assertEqual(resample.bucket_close_times([1706745600000], '1M').tolist(), [1709251200000 - 1])
+
+    def test_sources_chain_through_rollups(self):
+        self.assertEqual(
+            rollup_sources(['1d', '5m', '1h', '4h', '1w', '1M', '30m'], '1m'),
+            {'5m': '1m', '30m': '5m', '1h': '30m', '4h': '1h', '1d': '4h', '1w': '1d', '1M': '1d'},
+        )
+
+class TestRollupMaterialization(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.engine = create_engine(f"sqlite:///{os.path.join(tmpdir.name, 'klines.db')}")
+        self.addCleanup(self.engine.dispose)
+        Base.metadata.create_all(self.engine)
+        for patcher in (
+            patch.object(storage, 'engine', self.engine),
+            patch.object(storage, '_save_listeners', []),
+            patch.object(Config, 'ROLLUP_INTERVALS', ['5m', '1h', '4h', '1d']),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def save(self, columns, selection=slice(None)):
+        storage.save_kline_data('BTCUSDT', '1m', storage.columns_to_records(
+            {name: values[selection] for name, values in columns.items()}
+        ))
+
+    def stored(self, interval):
+        return storage.get_kline_columns('BTCUSDT', interval, 0, 2 ** 62)
+
+    def assert_rollups_match(self, columns):
+        for interval in ('5m', '1h', '4h', '1d'):
+            expected = resample_columns(columns, interval)
+            actual = self.stored(interval)
+            np.testing.assert_array_equal(actual['openTime'], expected['openTime'])
+            for field in ('open', 'high', 'low', 'close', 'volume'):
+                np.testing.assert_allclose(actual[field], expected[field], rtol=1e-9)
+
+    def test_live_candles_ripple_up_every_interval(self):
+        resample.register_rollups()
+        columns = minute_candles(1500)
+        self.save(columns, slice(0, 1380))
+        for i in range(1380, 1500):  # one candle at a time, as the live feed stores them
+            self.save(columns, slice(i, i + 1))
+
+        self.assert_rollups_match(columns)
+
+    def test_bucket_missing_its_first_candle_is_skipped(self):
+        resample.register_rollups()
+        columns = minute_candles(130, start=START + 7 * MINUTE)
+        self.save(columns)
+
+        hours = self.stored('1h')['openTime'].tolist()
+        self.assertEqual(hours, [START + 3600000, START + 7200000])
+        self.assertEqual(self.stored('5m')['openTime'][0], START + 10 * MINUTE)
+
+    def test_bucket_with_a_hole_waits_for_it(self):
+        resample.register_rollups()
+        columns = minute_candles(180)
+        hole = columns['openTime'] != START + 30 * MINUTE
+        self.save(columns, hole)
+
+        # 00:00 is closed and missing its 00:30 candle; 02:00 is forming
+        self.assertEqual(self.stored('1h')['openTime'].tolist(), [START + 3600000, START + 7200000])
+        self.assertNotIn(START + 30 * MINUTE, self.stored('5m')['openTime'].tolist())
+
+        self.save(columns, ~hole)
+        self.assert_rollups_match(columns)
+
+    def test_materialize_existing_history(self):
+        columns = minute_candles(2 * 1440)
+        self.save(columns)
+        self.assertEqual(len(self.stored('1h')['openTime']), 0)
+
+        written = materialize_rollups('BTCUSDT', START, START + 2 * 86400000 - 1)
+
+        self.assertEqual(written, {'5m': 576, '1h': 48, '4h': 12, '1d': 2})
+        self.assert_rollups_match(columns)
+
+if __name__ == '__main__':
+    unittest.main()
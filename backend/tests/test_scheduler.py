@@ -0,0 +1,164 @@
+import unittest
+from unittest.mock import patch
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from backend.config import Config
+from backend.data.backfill import WeightBudget
+from backend.data.scheduler import IngestScheduler, find_gaps, next_close
+
+MINUTE = 60000
+START = 1704067200000  # 2024-01-01 00:00 UTC
+
+class VirtualClock:
+    """
+    Time that only moves when the scheduler sleeps, after its in-flight runs have finished
+    """
+
+    def __init__(self, now_ms):
+        self.now_ms = now_ms
+        self.scheduler = None
+
+    def time(self):
+        return self.now_ms / 1000
+
+    async def sleep(self, seconds):
+        await self.scheduler.drain()
+        self.now_ms += int(seconds * 1000)
+
+class FakeExchange:
+    """
+    Serves closed and forming 1m candles of any symbol up to the virtual time. Candles of
+    symbols in `delayed` are only published `delay_ms` after they close, and requests for
+    the (symbol, startTime, endTime) in `failing` always fail.
+    """
+
+    def __init__(self, clock, delayed=(), delay_ms=0, failing=()):
+        self.clock = clock
+        self.delayed = set(delayed)
+        self.delay_ms = delay_ms
+        self.failing = set(failing)
+        self.requests = []
+        self.app = web.Application()
+        self.app.router.add_get('/api/v3/klines', self.klines)
+
+    async def klines(self, request):
+        query = request.query
+        self.requests.append((query['symbol'], int(query['startTime']), int(query['endTime'])))
+        if self.requests[-1] in self.failing:
+            return web.json_response({'code': -1121, 'msg': 'Invalid symbol.'}, status=400)
+        last_open = self.clock.now_ms
+        if query['symbol'] in self.delayed:
+            last_open -= MINUTE + self.delay_ms
+        open_times = range(int(query['startTime']), min(int(query['endTime']), last_open) + 1, MINUTE)
+        klines = [[t, '1.0', '2.0', '0.5', str(t / MINUTE), '3.0', t + MINUTE - 1]
+                  for t in open_times[:int(query['limit'])]]
+        return web.json_response(klines, headers={'X-MBX-USED-WEIGHT-1M': '2'})
+
+class TestScheduler(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.clock = VirtualClock(START + 30 * MINUTE + 100)
+        self.stored = {}
+        self.stored_at = {}
+        for patcher in (
+            patch.object(Config, 'INGEST_LOOKBACK', 20),
+            patch.object(Config, 'INGEST_CLOSE_DELAY_MS', 200),
+            patch.object(Config, 'INGEST_RETRY_SECONDS', 1),
+            patch('backend.data.scheduler.get_kline_columns', self.stored_columns),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def start_exchange(self, **kwargs):
+        self.exchange = FakeExchange(self.clock, **kwargs)
+        self.server = TestServer(self.exchange.app)
+        await self.server.start_server()
+        self.addAsyncCleanup(self.server.close)
+
+    def stored_columns(self, symbol, interval, start_time, end_time):
+        times = sorted(t for t in self.stored.get(symbol, {}) if start_time <= t <= end_time)
+        return {'openTime': times}
+
+    def writer(self, symbol, interval, candles):
+        for candle in candles:
+            self.stored.setdefault(symbol, {})[candle['openTime']] = candle
+            self.stored_at.setdefault((symbol, candle['openTime']), self.clock.now_ms)
+        return len(candles)
+
+    def scheduler(self, pairs):
+        scheduler = IngestScheduler(pairs, writer=self.writer, base_url=str(self.server.make_url('')).rstrip('/'),
+                                    workers=4, budget=WeightBudget(1200), clock=self.clock.time, sleep=self.clock.sleep)
+        self.clock.scheduler = scheduler
+        return scheduler
+
+    async def test_many_pairs_are_stored_as_each_candle_closes(self):
+        await self.start_exchange()
+        symbols = [f'SYM{i}USDT' for i in range(30)]
+        scheduler = self.scheduler([(symbol, '1m') for symbol in symbols])
+
+        await scheduler.run(until_ms=START + 35 * MINUTE + 500)
+
+        for symbol in symbols:
+            # The 20 candle lookback, then one candle per close; the forming one is never stored
+            self.assertEqual(sorted(self.stored[symbol]), list(range(START + 10 * MINUTE, START + 35 * MINUTE, MINUTE)))
+            for minute in range(31, 35):
+                # Fetched within the close delay of the candle closing, not at a blind 60s tick
+                self.assertEqual(self.stored_at[(symbol, START + minute * MINUTE)], START + (minute + 1) * MINUTE + 200)
+        metrics = {m['symbol']: m for m in scheduler.metrics()}
+        self.assertEqual(metrics['SYM0USDT']['lag_ms'], 200)
+        self.assertEqual(metrics['SYM0USDT']['next_run'], START + 36 * MINUTE + 200)
+        self.assertEqual(metrics['SYM0USDT']['errors'], 0)
+
+    async def test_stored_holes_are_filled(self):
+        await self.start_exchange()
+        self.stored['BTCUSDT'] = {t: {} for t in range(START + 10 * MINUTE, START + 30 * MINUTE, MINUTE)
+                                  if not START + 14 * MINUTE <= t < START + 17 * MINUTE}
+        scheduler = self.scheduler([('BTCUSDT', '1m')])
+
+        await scheduler.run(until_ms=START + 30 * MINUTE + 500)
+
+        self.assertEqual(sorted(self.stored['BTCUSDT']), list(range(START + 10 * MINUTE, START + 30 * MINUTE, MINUTE)))
+        self.assertIn(('BTCUSDT', START + 14 * MINUTE, START + 17 * MINUTE - 1), self.exchange.requests)
+        self.assertEqual(scheduler.metrics()[0]['gaps_filled'], 1)
+
+    async def test_failing_hole_backs_off_without_holding_live_candles(self):
+        hole = ('BTCUSDT', START + 14 * MINUTE, START + 15 * MINUTE - 1)
+        await self.start_exchange(failing=[hole])
+        self.stored['BTCUSDT'] = {t: {} for t in range(START + 10 * MINUTE, START + 30 * MINUTE, MINUTE)
+                                  if t != START + 14 * MINUTE}
+        scheduler = self.scheduler([('BTCUSDT', '1m')])
+
+        with patch.object(Config, 'INGEST_GAP_MAX_FAILURES', 3):
+            await scheduler.run(until_ms=START + 33 * MINUTE + 500)
+
+        # Live candles kept up at every close
+        self.assertEqual(max(self.stored['BTCUSDT']), START + 32 * MINUTE)
+        self.assertEqual(self.stored_at[('BTCUSDT', START + 32 * MINUTE)], START + 33 * MINUTE + 200)
+        # Tried at the first run, then 1s and 2s later, then dropped
+        self.assertEqual(self.exchange.requests.count(hole), 3)
+        metrics = scheduler.metrics()[0]
+        self.assertEqual((metrics['pending_gaps'], metrics['gaps_dropped']), (0, 1))
+
+    async def test_candle_missing_at_close_is_retried(self):
+        await self.start_exchange(delayed=['LATEUSDT'], delay_ms=1500)
+        scheduler = self.scheduler([('LATEUSDT', '1m')])
+
+        await scheduler.run(until_ms=START + 31 * MINUTE + 5000)
+
+        # Published 1.5s after the close, so the 0.2s run misses it and a 1s retry picks it up
+        self.assertEqual(self.stored_at[('LATEUSDT', START + 30 * MINUTE)], START + 31 * MINUTE + 2200)
+        self.assertEqual(scheduler.metrics()[0]['lag_ms'], 2200)
+
+class TestBoundaries(unittest.TestCase):
+
+    def test_next_close(self):
+        self.assertEqual(next_close(START + 1, '1h'), START + 3600000)
+        self.assertEqual(next_close(START + 5 * 86400000, '1w'), START + 7 * 86400000)
+        self.assertEqual(next_close(START + 86400000, '1M'), 1706745600000)
+
+    def test_find_gaps(self):
+        self.assertEqual(find_gaps([0, MINUTE, 4 * MINUTE, 5 * MINUTE, 7 * MINUTE], '1m'),
+                         [(2 * MINUTE, 4 * MINUTE), (6 * MINUTE, 7 * MINUTE)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from sqlalchemy import create_engine
+from backend.database import Base
+from backend.data import coverage, storage
+from backend.data.parallel import Universe, get_pool
+from backend.data.screener import Screen, run_screen, scan
+
+HOUR = 3600000
+START = 1704067200000
+
+def candles(close):
+    close = np.asarray(close, dtype=np.float64)
+    open_times = START + np.arange(len(close), dtype=np.int64) * HOUR
+    return {
+        'openTime': open_times,
+        'open': close,
+        'high': close + 1,
+        'low': close - 1,
+        'close': close,
+        'volume': np.ones(len(close)),
+        'closeTime': open_times + HOUR - 1,
+    }
+
+# Steady decline, a decline that turns up over the last candles, and a steady rise
+FALLING = 200 - np.arange(300) * 0.5
+REVERSING = np.r_[200 - np.arange(295) * 0.5, 53.5 + np.arange(1, 6) * 0.4]
+RISING = 100 + np.arange(300) * 0.5
+
+def universe(series):
+    columns = [candles(close) for close in series.values()]
+    offsets = np.cumsum([0] + [len(c['close']) for c in columns])
+    return Universe(list(series), offsets, {name: np.concatenate([c[name] for c in columns]) for name in columns[0]})
+
+class TestScreener(unittest.TestCase):
+
+    def test_conditions(self):
+        series = {'FALL': FALLING, 'REV': REVERSING, 'RISE': RISING}
+        cases = {
+            'rsi(14) < 30': ['FALL'],
+            'rsi(14) > 70': ['RISE'],
+            'macd(12,26,9).macd crosses_above macd(12,26,9).signal within 5': ['REV'],
+            'macd.macd crosses_above macd.signal within 1': [],
+            'close > sma(50); rsi > 50': ['RISE'],
+            'close < 100; 0 > macd.histogram': ['FALL'],
+        }
+        with universe(series) as packed:
+            for text, expected in cases.items():
+                self.assertEqual([m['symbol'] for m in scan(packed, Screen(text), workers=1)], expected, text)
+
+    def test_matches_report_last_candle_values(self):
+        with universe({'FALL': FALLING}) as packed:
+            match, = scan(packed, Screen('rsi(14) < 30; close < ema(20)'), workers=1)
+        self.assertEqual(match['openTime'], START + 299 * HOUR)
+        self.assertEqual(match['close'], FALLING[-1])
+        self.assertEqual(set(match), {'symbol', 'openTime', 'rsi(14)', 'close', 'ema(20)'})
+
+    def test_process_pool_matches_in_process_scan(self):
+        rng = np.random.default_rng(3)
+        series = {f'S{i:02d}': 100 + np.cumsum(rng.normal(0, 1, 200 + i)) for i in range(40)}
+        screen = Screen('rsi(14) < 45; macd.macd crosses_above macd.signal within 20')
+        with universe(series) as packed:
+            expected = scan(packed, screen, workers=1)
+            self.assertTrue(expected)
+            self.assertEqual(scan(packed, screen, workers=2), expected)
+        self.assertFalse(os.path.exists(packed.path))
+        # Workers never start as forks of this multi-threaded process
+        self.assertNotEqual(get_pool(2)._mp_context.get_start_method(), 'fork')
+
+    def test_invalid_conditions(self):
+        for text in ('', 'rsi(14)', 'rsi(14) << 30', 'foo(3) < 1', 'macd < 0', 'macd.nope < 0',
+                     'rsi < 30 within 3', '1 < 2', 'rsi crosses_above 50 within 0'):
+            with self.assertRaises(ValueError, msg=text):
+                Screen(text)
+
+    def test_run_screen_reads_stored_candles(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        engine = create_engine(f"sqlite:///{os.path.join(tmpdir.name, 'klines.db')}")
+        self.addCleanup(engine.dispose)
+        Base.metadata.create_all(engine)
+        for patcher in (
+            patch.object(storage, 'engine', engine),
+            patch.object(coverage, 'engine', engine),
+            patch.object(storage, '_save_listeners', [coverage.on_candles_saved]),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for symbol, close in (('AAAUSDT', FALLING), ('BBBUSDT', RISING)):
+            storage.save_kline_data(symbol, '1h', storage.columns_to_records(candles(close)))
+
+        # One candle past the last stored one is still forming and isn't screened
+        now = START + 300 * HOUR + 5
+        result = run_screen(Screen('rsi(14) < 30'), '1h', workers=1, now_ms=now)
+
+        self.assertEqual(result['scanned'], 2)
+        self.assertEqual([(m['symbol'], m['openTime']) for m in result['matches']], [('AAAUSDT', START + 299 * HOUR)])
+        self.assertEqual(run_screen(Screen('rsi(14) < 30'), '1h', ['BBBUSDT'], workers=1, now_ms=now)['matches'], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+import unittest
+import numpy as np
+from unittest.mock import patch
+from sqlalchemy import MetaData, Table, create_engine, func, inspect, select
+from sqlalchemy.pool import StaticPool
+from backend.database import (
+    Base, kline_table, kline_versions_table, build_kline_table, migrate_legacy_kline_tables, migrate_price_storage,
+    partition_suffixes, price_storage,
+)
+from backend.data import storage
+
+def make_candles(start_time, count, step=60000):
+    return [
+        {
+            'openTime': start_time + i * step,
+            'open': 100.0 + i,
+            'high': 101.0 + i,
+            'low': 99.0 + i,
+            'close': 100.5 + i,
+            'volume': 10.0,
+            'closeTime': start_time + (i + 1) * step - 1,
+        }
+        for i in range(count)
+    ]
+
+class TestStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://', poolclass=StaticPool)
+        patchers = [
+            patch.object(storage, 'engine', self.engine),
+            # Listeners registered by other tests' create_app would write rollups here
+            patch.object(storage, '_save_listeners', []),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def count_rows(self):
+        with self.engine.connect() as connection:
+            return connection.execute(select(func.count()).select_from(kline_table)).scalar()
+
+    def test_read_spans_quarters(self):
+        Base.metadata.create_all(self.engine)
+        # 2024-03-31 23:58 UTC, so the third candle lands in 2024q2
+        candles = make_candles(1711929480000, 3)
+        self.assertEqual(storage.save_kline_data('BTCUSDT', '1m', candles), 3)
+        data = storage.get_kline_data('BTCUSDT', '1m', 1711929480000, 1711929480000 + 3 * 60000)
+        self.assertEqual([d['openTime'] for d in data], [c['openTime'] for c in candles])
+
+    def test_iter_streams_partitions_in_chunks(self):
+        Base.metadata.create_all(self.engine)
+        # Five candles either side of the 2024q1/2024q2 boundary
+        candles = make_candles(1711929300000, 10)
+        storage.save_kline_data('BTCUSDT', '1m', candles)
+
+        chunks = list(storage.iter_kline_columns('BTCUSDT', '1m', 0, 2 ** 62, chunk_size=3))
+        self.assertEqual([len(chunk['openTime']) for chunk in chunks], [3, 2, 3, 2])
+        self.assertEqual(np.concatenate([chunk['openTime'] for chunk in chunks]).tolist(),
+                         [c['openTime'] for c in candles])
+        self.assertEqual(list(storage.iter_kline_columns('BTCUSDT', '1h', 0, 2 ** 62)), [])
+
+    def test_save_is_idempotent(self):
+        Base.metadata.create_all(self.engine)
+        candles = make_candles(1704067200000, 5)
+        storage.save_kline_data('BTCUSDT', '1m', candles)
+        candles[-1]['close'] = 42.0
+        storage.save_kline_data('BTCUSDT', '1m', candles)
+
+        self.assertEqual(self.count_rows(), 5)
+        data = storage.get_kline_data('BTCUSDT', '1m', 1704067200000, 1704067200000 + 5 * 60000)
+        self.assertEqual([d['openTime'] for d in data], [c['openTime'] for c in candles])
+        self.assertEqual(data[-1]['close'], 42.0)
+
+    def test_save_columns_keeps_last_duplicate(self):
+        Base.metadata.create_all(self.engine)
+        candles = make_candles(1704067200000, 3)
+        columns = {name: np.array([c[name] for c in candles + candles[-1:]]) for name in storage.KLINE_FIELDS}
+        columns['close'][-1] = 42.0
+        self.assertEqual(storage.save_kline_columns('BTCUSDT', '1m', columns), 3)
+
+        data = storage.get_kline_data('BTCUSDT', '1m', 0, 2 ** 62)
+        self.assertEqual([d['close'] for d in data], [100.5, 101.5, 42.0])
+        self.assertIsInstance(data[0]['openTime'], int)
+
+    def test_migrate_legacy_quarter_tables(self):
+        with self.engine.begin() as connection:
+            for name, closes in (('kline_data_2023q1', (1, 2)), ('kline_data_default', (3,))):
+                connection.exec_driver_sql(
+                    f"CREATE TABLE {name} (id INTEGER PRIMARY KEY, symbol VARCHAR(10), interval VARCHAR(5), "
+                    "open_time BIGINT, open NUMERIC, high NUMERIC, low NUMERIC, close NUMERIC, volume NUMERIC, close_time BIGINT)"
+                )
+                for i, close in enumerate(closes):
+                    connection.exec_driver_sql(
+                        f"INSERT INTO {name} (symbol, interval, open_time, open, high, low, close, volume, close_time) "
+                        f"VALUES ('BTCUSDT', '1m', {1672531200000 + i * 60000}, 1, 1, 1, {close}, 1, 0)"
+                    )
+            migrate_legacy_kline_tables(connection)
+
+        self.assertEqual(inspect(self.engine).get_table_names(), ['kline_data'])
+        data = storage.get_kline_data('BTCUSDT', '1m', 1672531200000, 1672531260000)
+        self.assertEqual([d['close'] for d in data], [1.0, 2.0])
+
+    def test_columns_are_typed_arrays(self):
+        Base.metadata.create_all(self.engine)
+        storage.save_kline_data('BTCUSDT', '1m', make_candles(1704067200000, 4))
+        columns = storage.get_kline_columns('BTCUSDT', '1m', 1704067200000, 1704067200000 + 2 * 60000)
+
+        self.assertEqual(columns['openTime'].dtype, np.int64)
+        self.assertEqual(columns['close'].dtype, np.float64)
+        self.assertTrue(columns['close'].flags['C_CONTIGUOUS'])
+        self.assertEqual(columns['close'].tolist(), [100.5, 101.5, 102.5])
+        empty = storage.get_kline_columns('ETHUSDT', '1m', 1704067200000, 1704067200000 + 2 * 60000)
+        self.assertEqual(len(empty['openTime']), 0)
+
+    def test_series_version_changes_with_any_write_in_range(self):
+        Base.metadata.create_all(self.engine)
+        self.assertEqual(storage.series_version('BTCUSDT', '1m', 0, 2 ** 62), ())
+        # 2024-03-31 23:58 UTC: two candles in 2024q1, one in 2024q2
+        candles = make_candles(1711929480000, 3)
+        storage.save_kline_data('BTCUSDT', '1m', candles)
+        version = storage.series_version('BTCUSDT', '1m', 0, 2 ** 62)
+        first_quarter = storage.series_version('BTCUSDT', '1m', 0, candles[0]['openTime'])
+        self.assertEqual(version, (('2024q1', 1), ('2024q2', 1)))
+
+        # A correction that isn't the latest candle, as another process's backfill would make
+        candles[0]['close'] = 42.0
+        storage.save_kline_data('BTCUSDT', '1m', candles[:1])
+        self.assertNotEqual(storage.series_version('BTCUSDT', '1m', 0, 2 ** 62), version)
+        self.assertNotEqual(storage.series_version('BTCUSDT', '1m', 0, candles[0]['openTime']), first_quarter)
+        # Ranges in other quarters keep their version
+        self.assertEqual(storage.series_version('BTCUSDT', '1m', candles[2]['openTime'], 2 ** 62), (('2024q2', 1),))
+
+    def test_failed_write_keeps_version(self):
+        Base.metadata.create_all(self.engine)
+        storage.save_kline_data('BTCUSDT', '1m', make_candles(1704067200000, 2))
+        version = storage.series_version('BTCUSDT', '1m', 0, 2 ** 62)
+        with patch.object(storage, '_executemany_upsert', side_effect=RuntimeError('disk full')):
+            self.assertEqual(storage.save_kline_data('BTCUSDT', '1m', make_candles(1704067200000, 2)), 0)
+        self.assertEqual(storage.series_version('BTCUSDT', '1m', 0, 2 ** 62), version)
+
+    def test_scaled_price_storage(self):
+        scaled = build_kline_table(MetaData(), 'scaled')
+        scaled.create(self.engine)
+        kline_versions_table.create(self.engine)
+        candles = make_candles(1704067200000, 3)
+        candles[0]['close'], candles[1]['volume'] = 42123.45678901, 0.00000001
+        with patch.object(storage, 'kline_table', scaled):
+            storage.save_kline_data('BTCUSDT', '1m', candles)
+            columns = storage.get_kline_columns('BTCUSDT', '1m', 0, 2 ** 62)
+
+        with self.engine.connect() as connection:
+            stored = connection.execute(select(scaled.c.close, scaled.c.volume).order_by(scaled.c.open_time)).all()
+        self.assertEqual(stored[0][0], 4212345678901)
+        self.assertEqual(stored[1][1], 1)
+        for field in ('open', 'high', 'low', 'close', 'volume'):
+            self.assertEqual(columns[field].tolist(), [c[field] for c in candles])
+
+    def test_migrate_price_storage(self):
+        Base.metadata.create_all(self.engine)
+        candles = make_candles(1704067200000, 3)
+        candles[0]['close'] = 42123.45678901
+        storage.save_kline_data('BTCUSDT', '1m', candles)
+        expected = storage.get_kline_columns('BTCUSDT', '1m', 0, 2 ** 62)
+
+        for target in ('scaled', 'double', 'numeric', 'double', 'scaled', 'numeric'):
+            with self.engine.begin() as connection:
+                migrate_price_storage(connection, target)
+            converted = Table('kline_data', MetaData(), autoload_with=self.engine)
+            self.assertEqual(price_storage(converted), target)
+            with patch.object(storage, 'kline_table', converted):
+                columns = storage.get_kline_columns('BTCUSDT', '1m', 0, 2 ** 62)
+            for field, values in expected.items():
+                self.assertEqual(columns[field].tolist(), values.tolist(), f'{target} {field}')
+
+    def test_migrate_rejects_values_scaled_cannot_hold(self):
+        Base.metadata.create_all(self.engine)
+        candles = make_candles(1704067200000, 1)
+        candles[0]['volume'] = 1e11
+        storage.save_kline_data('BTCUSDT', '1m', candles)
+        with self.engine.begin() as connection:
+            with self.assertRaises(ValueError):
+                migrate_price_storage(connection, 'scaled')
+            self.assertEqual(migrate_price_storage(connection, 'double'), 'numeric')
+
+    def test_partition_bounds(self):
+        self.assertEqual(storage.get_partition_bounds('2024q4'), (1727740800000, 1735689600000))
+        self.assertEqual(storage.get_partition_suffix(1735689600000 - 1), '2024q4')
+        self.assertEqual(storage.get_partition_suffix(1735689600000), '2025q1')
+        self.assertEqual(partition_suffixes(1727740800000, 1735689600000), ['2024q4', '2025q1'])
+
+if __name__ == '__main__':
+    unittest.main()
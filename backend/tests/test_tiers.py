@@ -0,0 +1,166 @@
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from backend.database import Base, indicator_state_table, indicator_values_table
+from backend.data import indicators, processing, storage
+from backend.data.cache import IndicatorCache
+from backend.data.tiers import QuarterFiles
+
+HOUR = 3600000
+START = 1754006400000  # 2025-08-01, in 2025q3
+NOW = 1793491200000  # 2026-11-01: quarters before 2026q4 are sealed
+
+def make_candles(start_time, count, step=HOUR):
+    rng = np.random.default_rng(start_time % 1000)
+    close = 100 + np.cumsum(rng.normal(0, 1, count)).round(8)
+    return [
+        {
+            'openTime': start_time + i * step,
+            'open': close[i] - 0.25,
+            'high': close[i] + 1.125,
+            'low': close[i] - 1.5,
+            'close': close[i],
+            'volume': 10.0 + i,
+            'closeTime': start_time + (i + 1) * step - 1,
+        }
+        for i in range(count)
+    ]
+
+class TestHotTier(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.engine = create_engine('sqlite://', poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.tier = QuarterFiles(tmpdir.name)
+        self.db_reads = []
+        db_kline_columns = storage._db_kline_columns
+
+        def counted(*args):
+            self.db_reads.append(args[2:])
+            return db_kline_columns(*args)
+
+        for patcher in (
+            patch.object(storage, 'engine', self.engine),
+            patch.object(storage, 'hot_tier', self.tier),
+            # No listener: files must go stale from database state alone, as when another
+            # process writes the candles
+            patch.object(storage, '_save_listeners', []),
+            patch.object(storage, '_db_kline_columns', counted),
+            patch('backend.data.tiers.time.time', return_value=NOW / 1000),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # 2025-08-01 to 2026-10-31: parts of 2025q3 and 2026q4, all of the quarters between
+        storage.save_kline_data('BTCUSDT', '1h', make_candles(START, (NOW - START) // HOUR - 24))
+
+    def assert_same_as_database(self, start_time, end_time):
+        tiered = storage.get_kline_columns('BTCUSDT', '1h', start_time, end_time)
+        with patch.object(storage, 'hot_tier', None):
+            expected = storage.get_kline_columns('BTCUSDT', '1h', start_time, end_time)
+        self.assertEqual(tiered.keys(), expected.keys())
+        for name, values in expected.items():
+            self.assertEqual(tiered[name].dtype, values.dtype, name)
+            np.testing.assert_array_equal(tiered[name], values, err_msg=name)
+
+    def test_results_identical_to_database(self):
+        for start_time, end_time in (
+            (0, NOW),
+            (START + 5 * HOUR, START + 500 * HOUR),
+            (1759276800000 - 3 * HOUR, 1759276800000 + 3 * HOUR),  # across the 2025q3/q4 boundary
+            (1790812800000 - 10 * HOUR, NOW),  # last sealed quarter into the open one
+            (START + 30 * 60000, START + 40 * 60000),  # between candles
+            (0, START - 1),
+        ):
+            self.assert_same_as_database(start_time, end_time)
+
+    def test_sealed_reads_skip_the_database(self):
+        storage.get_kline_columns('BTCUSDT', '1h', 0, NOW)
+        # Only the sealed quarters holding candles, 2025q3 to 2026q3
+        self.assertEqual(self.tier.exports, 5)
+        self.db_reads.clear()
+
+        columns = storage.get_kline_columns('BTCUSDT', '1h', START, 1790812800000 - 1)
+        self.assertEqual(self.db_reads, [])
+        self.assertEqual(len(columns['openTime']), (1790812800000 - START) // HOUR)
+
+        # Within one quarter the columns are views of the mapped file
+        columns = storage.get_kline_columns('BTCUSDT', '1h', START, START + 100 * HOUR)
+        self.assertIsInstance(columns['close'].base, np.memmap)
+        self.assertFalse(columns['openTime'].flags.writeable)
+
+        storage.get_kline_columns('BTCUSDT', '1h', START, NOW)
+        # The open quarter is read up to the last stored candle
+        self.assertEqual(self.db_reads, [(1790812800000, NOW - 25 * HOUR)])
+
+    def test_write_to_sealed_quarter_replaces_its_file(self):
+        storage.get_kline_columns('BTCUSDT', '1h', START, NOW)
+        revised = make_candles(START + 10 * HOUR, 1)
+        revised[0]['close'] = 12345.0
+        storage.save_kline_data('BTCUSDT', '1h', revised)
+
+        self.db_reads.clear()
+        columns = storage.get_kline_columns('BTCUSDT', '1h', START, START + 20 * HOUR)
+        self.assertEqual(columns['close'][10], 12345.0)
+        self.assertEqual(self.tier.invalidations, 1)
+        self.assertEqual(len(self.db_reads), 1)
+        self.assert_same_as_database(START, NOW)
+
+    def test_export_racing_a_write_is_not_served(self):
+        version = storage.quarter_versions('BTCUSDT', '1h', START, START)['2025q3']
+        columns = storage._db_kline_columns('BTCUSDT', '1h', START, 1759276800000 - 1)
+        storage.save_kline_data('BTCUSDT', '1h', make_candles(START, 1))
+        self.tier.write('BTCUSDT', '1h', '2025q3', columns, version)
+
+        self.assertIsNotNone(self.tier.read('BTCUSDT', '1h', '2025q3', version))
+        self.assertIsNone(self.tier.read('BTCUSDT', '1h', '2025q3', version + 1))
+        self.assert_same_as_database(START, NOW)
+
+    def test_empty_quarter_fills_in(self):
+        # 2024q1 has no candles until another process writes some
+        storage.get_kline_columns('BTCUSDT', '1h', 1704067200000, 1711929600000 - 1)
+        self.assertEqual(len(storage.get_kline_columns('BTCUSDT', '1h', 1704067200000, 1711929600000 - 1)['openTime']), 0)
+        storage.save_kline_data('BTCUSDT', '1h', make_candles(1704067200000, 3))
+        self.assertEqual(len(storage.get_kline_columns('BTCUSDT', '1h', 1704067200000, 1711929600000 - 1)['openTime']), 3)
+
+    def test_streamed_chunks_match(self):
+        chunks = list(storage.iter_kline_columns('BTCUSDT', '1h', START + 7 * HOUR, NOW, chunk_size=1000))
+        streamed = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in storage.KLINE_FIELDS}
+        expected = storage.get_kline_columns('BTCUSDT', '1h', START + 7 * HOUR, NOW)
+        for name in storage.KLINE_FIELDS:
+            np.testing.assert_array_equal(streamed[name], expected[name])
+        self.assertTrue(all(len(chunk['openTime']) <= 1000 for chunk in chunks))
+
+    def test_indicators_read_through_the_tier(self):
+        def indicator_results():
+            with patch.object(indicators, 'engine', self.engine), \
+                    patch.object(processing, 'indicator_cache', IndicatorCache(2 ** 24, 60)):
+                return (
+                    processing.get_macd('BTCUSDT', '1h', 0, NOW),
+                    processing.get_rsi('BTCUSDT', '1h', 0, NOW),
+                    processing.get_rsi('BTCUSDT', '1h', START, NOW, ema=False),
+                )
+
+        tiered = indicator_results()
+        self.assertEqual(self.tier.exports, 5)
+        with self.engine.begin() as connection:
+            connection.execute(indicator_state_table.delete())
+            connection.execute(indicator_values_table.delete())
+        with patch.object(storage, 'hot_tier', None):
+            expected = indicator_results()
+        for tiered_series, expected_series in zip(tiered, expected):
+            self.assertEqual(tiered_series.keys(), expected_series.keys())
+            for name, values in expected_series.items():
+                np.testing.assert_array_equal(tiered_series[name], values, err_msg=name)
+
+    def test_unsafe_names_stay_on_the_database(self):
+        self.assertFalse(self.tier.accepts('../BTC', '1h'))
+        storage.get_kline_columns('../BTC', '1h', START, NOW)
+        self.assertEqual(self.tier.exports, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,10 +20,11 @@ import {
 import {
   fetchKlineData,
   KLineDataItem,
-  fetchMACDData,
-  fetchRSIData,
+  fetchChartIndicators,
   MACDData,
   RSIData,
+  CandleUpdate,
+  subscribeToCandles,
 } from "./api/klineData";
 
 interface ChartData extends KLineDataItem {
@@ -59,8 +60,12 @@ export default function ImprovedChart() {
     try {
       const { start, end } = getTimeRange();
       const data = await fetchKlineData(interval, start, end);
-      const macd = await fetchMACDData("BTCUSDT", interval, start, end);
-      const rsi = await fetchRSIData("BTCUSDT", interval, start, end);
+      const { macd, rsi } = await fetchChartIndicators(
+        "BTCUSDT",
+        interval,
+        start,
+        end
+      );
 
       if (data && data.length > 0) {
         setMACDData(
@@ -82,12 +87,39 @@ export default function ImprovedChart() {
     }
   }, [interval]);
 
+  const mergeCandles = (
+    prev: ChartData[],
+    update: CandleUpdate
+  ): ChartData[] => {
+    const merged = new Map(prev.map((item) => [item.openTime, item]));
+    update.candles.forEach((candle) => {
+      const macdIndex = update.macd?.timestamps.indexOf(candle.openTime) ?? -1;
+      const rsiIndex = update.rsi?.timestamps.indexOf(candle.openTime) ?? -1;
+      merged.set(candle.openTime, {
+        ...candle,
+        date: new Date(candle.openTime),
+        macd: update.macd?.macd[macdIndex] ?? undefined,
+        signal: update.macd?.signal[macdIndex] ?? undefined,
+        histogram: update.macd?.histogram[macdIndex] ?? undefined,
+        rsi: update.rsi?.rsi[rsiIndex] ?? undefined,
+      });
+    });
+    const { start } = getTimeRange();
+    return Array.from(merged.values())
+      .filter((item) => item.openTime >= start)
+      .sort((a, b) => a.openTime - b.openTime);
+  };
+
   useEffect(() => {
     fetchData();
-    const intervalId = window.setInterval(fetchData, 60000); // Fetch data every minute
-
-    return () => window.clearInterval(intervalId);
-  }, [fetchData]);
+    // New candles are pushed by the server; a full refetch is only needed after a gap
+    return subscribeToCandles(
+      "BTCUSDT",
+      interval,
+      (update) => setChartData((prev) => mergeCandles(prev, update)),
+      fetchData
+    );
+  }, [fetchData, interval]);
 
   const formatData = (
     data: KLineDataItem[],
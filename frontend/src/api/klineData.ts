@@ -22,14 +22,22 @@ export interface RSIData {
   timestamps: number[];
 }
 
+// Appends the optional server-side downsampling limit to a query string
+const withMaxPoints = (query: string, maxPoints?: number): string =>
+  maxPoints ? `${query}&maxPoints=${maxPoints}` : query;
+
 export const fetchKlineData = async (
   interval: string,
   startTime: number,
-  endTime: number
+  endTime: number,
+  maxPoints?: number
 ): Promise<KLineDataItem[]> => {
   const symbol = "BTCUSDT";
   const response = await fetch(
-    `${API_BASE_URL}/kline?symbol=${symbol}&interval=${interval}&startTime=${startTime}&endTime=${endTime}`
+    withMaxPoints(
+      `${API_BASE_URL}/kline?symbol=${symbol}&interval=${interval}&startTime=${startTime}&endTime=${endTime}`,
+      maxPoints
+    )
   );
   if (!response.ok) {
     throw new Error("Failed to fetch kline data");
@@ -41,10 +49,14 @@ export const fetchMACDData = async (
   symbol: string,
   interval: string,
   startTime: number,
-  endTime: number
+  endTime: number,
+  maxPoints?: number
 ): Promise<MACDData> => {
   const response = await fetch(
-    `${API_BASE_URL}/macd?symbol=${symbol}&interval=${interval}&startTime=${startTime}&endTime=${endTime}`
+    withMaxPoints(
+      `${API_BASE_URL}/macd?symbol=${symbol}&interval=${interval}&startTime=${startTime}&endTime=${endTime}`,
+      maxPoints
+    )
   );
   if (!response.ok) {
     throw new Error("Failed to fetch MACD data");
@@ -56,10 +68,14 @@ export const fetchRSIData = async (
   symbol: string,
   interval: string,
   startTime: number,
-  endTime: number
+  endTime: number,
+  maxPoints?: number
 ): Promise<RSIData> => {
   const response = await fetch(
-    `${API_BASE_URL}/rsi?symbol=${symbol}&interval=${interval}&startTime=${startTime}&endTime=${endTime}`
+    withMaxPoints(
+      `${API_BASE_URL}/rsi?symbol=${symbol}&interval=${interval}&startTime=${startTime}&endTime=${endTime}`,
+      maxPoints
+    )
   );
   if (!response.ok) {
     throw new Error("Failed to fetch RSI data");
@@ -67,6 +83,64 @@ export const fetchRSIData = async (
   return response.json();
 };
 
+// MACD and RSI from one /indicators call, which reads the candle range once for both
+export const fetchChartIndicators = async (
+  symbol: string,
+  interval: string,
+  startTime: number,
+  endTime: number,
+  maxPoints?: number
+): Promise<{ macd: MACDData; rsi: RSIData }> => {
+  const response = await fetch(
+    withMaxPoints(
+      `${API_BASE_URL}/indicators?symbol=${symbol}&interval=${interval}&startTime=${startTime}&endTime=${endTime}` +
+        `&indicators=${encodeURIComponent("macd(12,26,9),rsi(14)")}`,
+      maxPoints
+    )
+  );
+  if (!response.ok) {
+    throw new Error("Failed to fetch indicator data");
+  }
+  const data = await response.json();
+  return {
+    macd: {
+      macd: data["macd(12,26,9).macd"],
+      signal: data["macd(12,26,9).signal"],
+      histogram: data["macd(12,26,9).histogram"],
+      timestamps: data.timestamps,
+    },
+    rsi: { rsi: data["rsi(14)"], timestamps: data.timestamps },
+  };
+};
+
+export interface CandleUpdate {
+  symbol: string;
+  interval: string;
+  candles: KLineDataItem[];
+  macd?: MACDData | null;
+  rsi?: RSIData | null;
+}
+
+// Subscribes to pushed candle upserts with their MACD/RSI values; returns an unsubscribe
+// function. `onLagged` fires when the server dropped events because we read too slowly.
+export const subscribeToCandles = (
+  symbol: string,
+  interval: string,
+  onUpdate: (update: CandleUpdate) => void,
+  onLagged?: () => void
+): (() => void) => {
+  const source = new EventSource(
+    `${API_BASE_URL}/stream?symbol=${symbol}&interval=${interval}&indicators=macd,rsi`
+  );
+  source.addEventListener("candles", (event) =>
+    onUpdate(JSON.parse((event as MessageEvent).data))
+  );
+  if (onLagged) {
+    source.addEventListener("lagged", onLagged);
+  }
+  return () => source.close();
+};
+
 export const fetchSymbols = async (): Promise<string[]> => {
   const response = await fetch(`${API_BASE_URL}/symbols`);
   if (!response.ok) {